@@ -0,0 +1,84 @@
+import bisect
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.metadata import cache
+from app.metadata.metadata import PartitionRecord, TopicIndex
+from app.protocol import codec, errors
+from app.protocol.request import KafkaRequestHeader, KafkaResponse
+from app.protocol.writer import ResponseBody
+from app.server.server_args import ServerArguments
+
+NO_TOPIC_ID = uuid.UUID(int=0)
+TOPIC_AUTHORIZED_OPERATIONS = 0x00000df8
+# Kafka's max.request.partition.size.limit: the most partitions one response carries, whatever the client asks
+DEFAULT_PARTITION_LIMIT = 2000
+DESCRIBE_TOPIC_PARTITIONS_REQUEST = codec.MESSAGES["DescribeTopicPartitionsRequest"]
+DESCRIBE_TOPIC_PARTITIONS_RESPONSE = codec.MESSAGES["DescribeTopicPartitionsResponse"]
+DescribeTopicPartitionsRequest = DESCRIBE_TOPIC_PARTITIONS_REQUEST.struct
+TopicRequest = DESCRIBE_TOPIC_PARTITIONS_REQUEST.structs["TopicRequest"]
+Cursor = DESCRIBE_TOPIC_PARTITIONS_REQUEST.structs["Cursor"]
+DescribeTopicPartitionsResponse = DESCRIBE_TOPIC_PARTITIONS_RESPONSE.struct
+ResponseTopic = DESCRIBE_TOPIC_PARTITIONS_RESPONSE.structs["DescribeTopicPartitionsResponseTopic"]
+ResponsePartition = DESCRIBE_TOPIC_PARTITIONS_RESPONSE.structs["DescribeTopicPartitionsResponsePartition"]
+
+
+@dataclass
+class TopicDescription:
+    error_code: int
+    name: str
+    topic_id: uuid.UUID = NO_TOPIC_ID
+    partitions: list[PartitionRecord] = field(default_factory=list)
+    is_internal: bool = False
+
+
+def describe(index: TopicIndex, request: DescribeTopicPartitionsRequest,
+             limit: int) -> tuple[list[TopicDescription], Optional[Cursor]]:
+    # topics are answered in name order so a cursor can say where the previous page stopped
+    names = sorted({x.name for x in request.topics}) if request.topics else sorted(index.name_to_id)
+    cursor = request.cursor
+    # a page always moves the cursor on, or a client following next_cursor would ask for the same page forever
+    remaining = max(limit, 1)
+    topics = []
+    for name in names:
+        if cursor is not None and name < cursor.topic_name:
+            continue
+        partitions = index.partitions(name)
+        if partitions is None:
+            topics.append(TopicDescription(errors.UNKNOWN_TOPIC_OR_PARTITION, name))
+            continue
+        first = cursor.partition_index if cursor is not None and name == cursor.topic_name else 0
+        selected = partitions[bisect.bisect_left(partitions, first, key=lambda x: x.partition_id):]
+        if remaining == 0 and selected:
+            return topics, Cursor(name, selected[0].partition_id)
+        topic = TopicDescription(errors.NONE, name, index.name_to_id[name], selected[:remaining],
+                                 name.startswith("__"))
+        topics.append(topic)
+        if len(selected) > remaining:
+            return topics, Cursor(name, selected[remaining].partition_id)
+        remaining -= len(selected)
+    return topics, None
+
+
+def serialize(request: KafkaRequestHeader, topics: list[TopicDescription], next_cursor: Optional[Cursor],
+              throttle_time_ms: int = 0) -> ResponseBody:
+    response_topics = []
+    for topic in topics:
+        # eligible leader replicas, last known elr and offline replicas are always empty here
+        partitions = [ResponsePartition(errors.NONE, x.partition_id, x.leader, x.leader_epoch, x.replica_array,
+                                        x.in_sync_replica_array, (), (), ()) for x in topic.partitions]
+        response_topics.append(ResponseTopic(topic.error_code, topic.name, topic.topic_id, topic.is_internal,
+                                             partitions, TOPIC_AUTHORIZED_OPERATIONS))
+    response = DescribeTopicPartitionsResponse(throttle_time_ms, response_topics, next_cursor)
+    return DESCRIBE_TOPIC_PARTITIONS_RESPONSE.encode_response(request, response)
+
+
+def handle_describe_topic_partitions(request: KafkaRequestHeader, server_args: ServerArguments) -> KafkaResponse:
+    describe_request = DESCRIBE_TOPIC_PARTITIONS_REQUEST.decode(request)
+    index = cache.read_partition(server_args).index
+    limit = server_args.int_property("max.request.partition.size.limit", DEFAULT_PARTITION_LIMIT)
+    if describe_request.response_partition_limit > 0:
+        limit = min(limit, describe_request.response_partition_limit)
+    topics, next_cursor = describe(index, describe_request, limit)
+    return KafkaResponse(0, serialize(request, topics, next_cursor, request.throttle_time_ms))
@@ -0,0 +1,113 @@
+from typing import Optional
+
+from app.log.partition import LogManager, get_log_manager
+from app.metadata import cache
+from app.metadata.metadata import TopicIndex
+from app.protocol import codec, errors
+from app.protocol.request import KafkaRequestHeader, KafkaResponse
+from app.protocol.writer import FileRegion, ResponseBody
+from app.server.purgatory import DelayedOperation
+from app.server.server_args import ServerArguments
+
+FIRST_TOPIC_ID_VERSION = 13
+FETCH_REQUEST = codec.MESSAGES["FetchRequest"]
+FETCH_RESPONSE = codec.MESSAGES["FetchResponse"]
+FetchPartition = FETCH_REQUEST.structs["FetchPartition"]
+FetchTopic = FETCH_REQUEST.structs["FetchTopic"]
+FetchRequest = FETCH_REQUEST.struct
+FetchResponse = FETCH_RESPONSE.struct
+FetchTopicResponse = FETCH_RESPONSE.structs["FetchableTopicResponse"]
+FetchPartitionResponse = FETCH_RESPONSE.structs["PartitionData"]
+
+
+def serialize(request: KafkaRequestHeader, topics: list[FetchTopicResponse], error_code: int = errors.NONE,
+              session_id: int = 0, throttle_time_ms: int = 0) -> ResponseBody:
+    return FETCH_RESPONSE.encode_response(request, FetchResponse(throttle_time_ms, error_code, session_id, topics))
+
+
+def fetch_partition(log_manager: LogManager, topic_name: str, partition: FetchPartition,
+                    max_bytes: int) -> FetchPartitionResponse:
+    log = log_manager.get(topic_name, partition.partition)
+    high_watermark = log.next_offset
+    response = FetchPartitionResponse(partition.partition, errors.NONE, high_watermark,
+                                      last_stable_offset=high_watermark, log_start_offset=log.log_start_offset)
+    if partition.fetch_offset > high_watermark or partition.fetch_offset < log.log_start_offset:
+        response.error_code = errors.OFFSET_OUT_OF_RANGE
+    elif max_bytes > 0:
+        response.records = log.read(partition.fetch_offset, min(partition.partition_max_bytes, max_bytes)) or b""
+    return response
+
+
+def resolve_topic(index: TopicIndex, topic: FetchTopic, version: int) -> tuple[Optional[str], int]:
+    if version >= FIRST_TOPIC_ID_VERSION:
+        name = index.id_to_name.get(topic.topic_id)
+        return name, errors.UNKNOWN_TOPIC_ID if name is None else errors.NONE
+    known = topic.topic in index.name_to_id
+    return topic.topic, errors.NONE if known else errors.UNKNOWN_TOPIC_OR_PARTITION
+
+
+def read_topics(request: KafkaRequestHeader, fetch_request: FetchRequest, index: TopicIndex,
+                log_manager: LogManager) -> tuple[list[FetchTopicResponse], int, list[tuple[str, int]], bool]:
+    # the responses, the bytes they hold, the partitions that were read and whether any of them failed
+    remaining = fetch_request.max_bytes
+    topics = []
+    keys = []
+    failed = False
+    for topic in fetch_request.topics:
+        topic_name, error_code = resolve_topic(index, topic, request.request_api_version)
+        topic_response = FetchTopicResponse(topic.topic, topic.topic_id)
+        for partition in topic.partitions:
+            if error_code != errors.NONE:
+                partition_response = FetchPartitionResponse(partition.partition, error_code)
+            elif index.partition(topic_name, partition.partition) is None:
+                partition_response = FetchPartitionResponse(partition.partition, errors.UNKNOWN_TOPIC_OR_PARTITION)
+            else:
+                partition_response = fetch_partition(log_manager, topic_name, partition, remaining)
+                keys.append((topic_name, partition.partition))
+                if isinstance(partition_response.records, FileRegion):
+                    remaining -= partition_response.records.count
+            failed = failed or partition_response.error_code != errors.NONE
+            topic_response.partitions.append(partition_response)
+        topics.append(topic_response)
+    return topics, fetch_request.max_bytes - remaining, keys, failed
+
+
+class DelayedFetch(DelayedOperation):
+    # a long poll: answered once min_bytes can be read or max_wait_ms is over
+
+    def __init__(self, request: KafkaRequestHeader, fetch_request: FetchRequest, index: TopicIndex,
+                 log_manager: LogManager):
+        super().__init__(fetch_request.max_wait_ms)
+        self.request = request
+        self.fetch_request = fetch_request
+        self.index = index
+        self.log_manager = log_manager
+        self.topics: Optional[list[FetchTopicResponse]] = None
+
+    def try_complete(self) -> bool:
+        topics, readable, _, failed = read_topics(self.request, self.fetch_request, self.index, self.log_manager)
+        if readable < self.fetch_request.min_bytes and not failed:
+            return False
+        self.topics = topics
+        return self.force_complete()
+
+    def on_complete(self) -> ResponseBody:
+        topics = self.topics
+        if topics is None:
+            # expired: whatever there is by now
+            topics = read_topics(self.request, self.fetch_request, self.index, self.log_manager)[0]
+        return serialize(self.request, topics, throttle_time_ms=self.request.throttle_time_ms)
+
+
+def handle_fetch(request: KafkaRequestHeader, server_args: ServerArguments) -> KafkaResponse:
+    fetch_request = FETCH_REQUEST.decode(request)
+    index = cache.read_partition(server_args).index
+    log_manager = get_log_manager(server_args)
+    topics, readable, keys, failed = read_topics(request, fetch_request, index, log_manager)
+    if fetch_request.max_wait_ms <= 0 or readable >= fetch_request.min_bytes or failed or not keys:
+        return KafkaResponse(0, serialize(request, topics, throttle_time_ms=request.throttle_time_ms))
+    # appends to any of the partitions check it again; the handler thread is free meanwhile
+    operation = DelayedFetch(request, fetch_request, index, log_manager)
+    if log_manager.fetch_purgatory.try_complete_else_watch(operation, keys):
+        return KafkaResponse(0, operation.response.result())
+    return KafkaResponse(0, None, delayed=operation.response)
@@ -0,0 +1,56 @@
+from app.log.partition import LogManager, get_log_manager
+from app.metadata import cache
+from app.metadata.metadata import TopicIndex
+from app.protocol import codec, errors
+from app.protocol.request import KafkaRequestHeader, KafkaResponse
+from app.protocol.writer import ResponseBody
+from app.server.server_args import ServerArguments
+
+LATEST_TIMESTAMP = -1
+EARLIEST_TIMESTAMP = -2
+MAX_TIMESTAMP = -3
+LIST_OFFSETS_REQUEST = codec.MESSAGES["ListOffsetsRequest"]
+LIST_OFFSETS_RESPONSE = codec.MESSAGES["ListOffsetsResponse"]
+ListOffsetsPartition = LIST_OFFSETS_REQUEST.structs["ListOffsetsPartition"]
+ListOffsetsResponse = LIST_OFFSETS_RESPONSE.struct
+ListOffsetsTopicResponse = LIST_OFFSETS_RESPONSE.structs["ListOffsetsTopicResponse"]
+ListOffsetsPartitionResponse = LIST_OFFSETS_RESPONSE.structs["ListOffsetsPartitionResponse"]
+
+
+def serialize(request: KafkaRequestHeader, topics: list[ListOffsetsTopicResponse],
+              throttle_time_ms: int = 0) -> ResponseBody:
+    return LIST_OFFSETS_RESPONSE.encode_response(request, ListOffsetsResponse(throttle_time_ms, topics))
+
+
+def list_partition(log_manager: LogManager, index: TopicIndex, topic_name: str,
+                   partition: ListOffsetsPartition) -> ListOffsetsPartitionResponse:
+    record = index.partition(topic_name, partition.partition_index)
+    if record is None:
+        return ListOffsetsPartitionResponse(partition.partition_index, errors.UNKNOWN_TOPIC_OR_PARTITION)
+    log = log_manager.get(topic_name, partition.partition_index)
+    response = ListOffsetsPartitionResponse(partition.partition_index, errors.NONE, leader_epoch=record.leader_epoch)
+    if partition.timestamp == LATEST_TIMESTAMP:
+        response.offset = log.next_offset
+    elif partition.timestamp == EARLIEST_TIMESTAMP:
+        response.offset = log.log_start_offset
+    elif partition.timestamp == MAX_TIMESTAMP:
+        response.offset, response.timestamp = log.max_timestamp()
+    else:
+        # no batch reaches the timestamp: answer with no offset, like Kafka does
+        found = log.offset_for_timestamp(partition.timestamp)
+        if found is not None:
+            response.offset, response.timestamp = found
+    return response
+
+
+def handle_list_offsets(request: KafkaRequestHeader, server_args: ServerArguments) -> KafkaResponse:
+    list_offsets_request = LIST_OFFSETS_REQUEST.decode(request)
+    index = cache.read_partition(server_args).index
+    log_manager = get_log_manager(server_args)
+    topics = []
+    for topic in list_offsets_request.topics:
+        topic_response = ListOffsetsTopicResponse(topic.name)
+        for partition in topic.partitions:
+            topic_response.partitions.append(list_partition(log_manager, index, topic.name, partition))
+        topics.append(topic_response)
+    return KafkaResponse(0, serialize(request, topics, request.throttle_time_ms))
@@ -0,0 +1,200 @@
+import pathlib
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from app.api.describe_topic_partitions import TOPIC_AUTHORIZED_OPERATIONS
+from app.metadata import cache
+from app.metadata.metadata import TopicIndex
+from app.protocol import codec, errors
+from app.protocol.request import KafkaRequestHeader, KafkaResponse
+from app.protocol.writer import INT32, Encoded, ResponseBody, ResponseWriter
+from app.server import HOST, PORT
+from app.server.server_args import ServerArguments, read_properties
+
+FIRST_THROTTLE_VERSION = 3
+FIRST_TOPIC_ID_VERSION = 10
+FIRST_NULLABLE_NAME_VERSION = 12
+CLUSTER_AUTHORIZED_OPERATIONS_VERSIONS = codec.Versions(8, 10)
+AUTHORIZED_OPERATIONS_OMITTED = -2147483648
+DEFAULT_NODE_ID = 1
+META_PROPERTIES = "meta.properties"
+METADATA_REQUEST = codec.MESSAGES["MetadataRequest"]
+METADATA_RESPONSE = codec.MESSAGES["MetadataResponse"]
+MetadataRequest = METADATA_REQUEST.struct
+MetadataRequestTopic = METADATA_REQUEST.structs["MetadataRequestTopic"]
+MetadataResponse = METADATA_RESPONSE.struct
+MetadataResponseBroker = METADATA_RESPONSE.structs["MetadataResponseBroker"]
+MetadataResponseTopic = METADATA_RESPONSE.structs["MetadataResponseTopic"]
+MetadataResponsePartition = METADATA_RESPONSE.structs["MetadataResponsePartition"]
+
+
+@dataclass
+class Shell:
+    # a version's response without its topics: what follows the throttle time up to the topic count, and what
+    # follows the topics
+    head: bytes
+    tail: bytes
+
+
+@dataclass
+class Fragment:
+    topic_id: bytes
+    # the topic's entry in TopicIndex.topic_changes when it was encoded
+    changes: int
+    encoded: bytes
+
+
+class MetadataResponseCache:
+    # topics are encoded once per version and reused until the metadata log changes them; only the header,
+    # throttle time and topic count are written per request
+
+    def __init__(self, node_id: int, cluster_id: Optional[str]):
+        self.node_id = node_id
+        self.cluster_id = cluster_id
+        self.shells = {version: self._shell(version) for version in METADATA_RESPONSE.versions}
+        self.lock = threading.Lock()
+        self.index: Optional[TopicIndex] = None
+        self.fragments: dict[tuple[str, int, bool], Fragment] = {}
+        # (version, authorized operations) -> (TopicIndex.changes, topic count, every topic's fragment joined)
+        self.all_topics: dict[tuple[int, bool], tuple[int, int, bytes]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def of(cls, server_args: ServerArguments) -> "MetadataResponseCache":
+        # the cluster id is the one kafka-storage format wrote next to the logs
+        meta = read_properties(server_args.log_dir / META_PROPERTIES)
+        return MetadataResponseCache(server_args.int_property("node.id", DEFAULT_NODE_ID), meta.get("cluster.id"))
+
+    def _shell(self, version: int) -> Shell:
+        brokers = [MetadataResponseBroker(self.node_id, HOST, PORT)]
+        out = Encoded()
+        METADATA_RESPONSE.encoders[version](out, MetadataResponse(0, brokers, self.cluster_id, self.node_id, []))
+        flexible = METADATA_RESPONSE.flexible(version)
+        # an empty topic array, then the cluster's authorized operations and the tagged fields where present
+        tail = 4 * (version in CLUSTER_AUTHORIZED_OPERATIONS_VERSIONS) + flexible
+        start = INT32.size if version >= FIRST_THROTTLE_VERSION else 0
+        head_end = len(out) - tail - (1 if flexible else INT32.size)
+        return Shell(bytes(out[start:head_end]), bytes(out[len(out) - tail:]))
+
+    def topic(self, index: TopicIndex, name: str, version: int, operations: bool) -> bytes:
+        topic_id = index.name_to_id[name].bytes
+        changes = index.topic_changes.get(topic_id, 0)
+        key = (name, version, operations)
+        with self.lock:
+            # a handler still on a replaced index neither reads nor stores fragments
+            current = index is self.index
+            fragment = self.fragments.get(key) if current else None
+            if fragment is not None and fragment.topic_id == topic_id and fragment.changes == changes:
+                self.hits += 1
+                return fragment.encoded
+            self.misses += 1
+        partitions = [MetadataResponsePartition(errors.NONE, x.partition_id, x.leader, x.leader_epoch,
+                                                x.replica_array, x.in_sync_replica_array, ())
+                      for x in index.partitions(name)]
+        topic = MetadataResponseTopic(errors.NONE, name, index.name_to_id[name], name.startswith("__"), partitions,
+                                      TOPIC_AUTHORIZED_OPERATIONS if operations else AUTHORIZED_OPERATIONS_OMITTED)
+        encoded = bytes(encode_topic(topic, version))
+        with self.lock:
+            if index is self.index:
+                self.fragments[key] = Fragment(topic_id, changes, encoded)
+        return encoded
+
+    def every_topic(self, index: TopicIndex, version: int, operations: bool) -> tuple[int, bytes]:
+        changes = index.changes
+        with self.lock:
+            cached = self.all_topics.get((version, operations)) if index is self.index else None
+        if cached is not None and cached[0] == changes:
+            return cached[1], cached[2]
+        names = sorted(index.name_to_id)
+        encoded = b"".join(self.topic(index, x, version, operations) for x in names)
+        with self.lock:
+            if index is self.index:
+                self.all_topics[(version, operations)] = (changes, len(names), encoded)
+        return len(names), encoded
+
+    def use(self, index: TopicIndex) -> None:
+        # a reloaded log comes with a new index, whose change counts start over
+        with self.lock:
+            if index is not self.index:
+                self.index = index
+                self.fragments = {}
+                self.all_topics = {}
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def encode_topic(topic: MetadataResponseTopic, version: int) -> Encoded:
+    out = Encoded()
+    METADATA_RESPONSE.struct_encoders[("MetadataResponseTopic", version)](out, topic)
+    return out
+
+
+def unknown_topic(request_topic: MetadataRequestTopic, version: int) -> bytes:
+    if request_topic.name is None:
+        name = None if version >= FIRST_NULLABLE_NAME_VERSION else ""
+        topic = MetadataResponseTopic(errors.UNKNOWN_TOPIC_ID, name, request_topic.topic_id)
+    else:
+        topic = MetadataResponseTopic(errors.UNKNOWN_TOPIC_OR_PARTITION, request_topic.name)
+    return bytes(encode_topic(topic, version))
+
+
+def select_topics(response_cache: MetadataResponseCache, index: TopicIndex, request: MetadataRequest,
+                  version: int) -> tuple[int, bytes]:
+    operations = request.include_topic_authorized_operations
+    # v0 asks for every topic with an empty list, later versions with a null one
+    if request.topics is None or (version == 0 and not request.topics):
+        return response_cache.every_topic(index, version, operations)
+    fragments = []
+    seen = set()
+    for request_topic in request.topics:
+        name = request_topic.name
+        if name is None and version >= FIRST_TOPIC_ID_VERSION:
+            name = index.id_to_name.get(request_topic.topic_id)
+        if name is not None and name in index.name_to_id:
+            if name not in seen:
+                seen.add(name)
+                fragments.append(response_cache.topic(index, name, version, operations))
+        else:
+            fragments.append(unknown_topic(request_topic, version))
+    return len(fragments), b"".join(fragments)
+
+
+def serialize(request: KafkaRequestHeader, shell: Shell, count: int, topics: bytes,
+              throttle_time_ms: int = 0) -> ResponseBody:
+    version = request.request_api_version
+    flexible = METADATA_RESPONSE.flexible(version)
+    writer = ResponseWriter()
+    writer.header(request.correlation_id, flexible)
+    if version >= FIRST_THROTTLE_VERSION:
+        writer.int32(throttle_time_ms)
+    writer.raw(shell.head)
+    if flexible:
+        writer.compact_array_length(count)
+    else:
+        writer.array_length(count)
+    return writer.raw(topics).raw(shell.tail).finish()
+
+
+_caches: dict[pathlib.Path, MetadataResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(server_args: ServerArguments) -> MetadataResponseCache:
+    with _caches_lock:
+        if server_args.log_dir not in _caches:
+            _caches[server_args.log_dir] = MetadataResponseCache.of(server_args)
+        return _caches[server_args.log_dir]
+
+
+def handle_metadata(request: KafkaRequestHeader, server_args: ServerArguments) -> KafkaResponse:
+    metadata_request = METADATA_REQUEST.decode(request)
+    index = cache.read_partition(server_args).index
+    response_cache = get_response_cache(server_args)
+    response_cache.use(index)
+    version = request.request_api_version
+    count, topics = select_topics(response_cache, index, metadata_request, version)
+    return KafkaResponse(0, serialize(request, response_cache.shells[version], count, topics,
+                                      request.throttle_time_ms))
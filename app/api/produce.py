@@ -0,0 +1,148 @@
+from concurrent.futures import Future
+from typing import Optional
+
+from app.log.batches import (BatchHeader, InvalidRecordError, read_batch_headers, recompress, validate_compressed,
+                             verify_crcs)
+from app.log.crc import CrcVerifier, get_verifier
+from app.log.partition import LogManager, get_log_manager
+from app.metadata import cache
+from app.protocol import codec, compression, errors
+from app.protocol.request import KafkaRequestHeader, KafkaResponse
+from app.protocol.writer import ResponseBody
+from app.server.offload import get_executor
+from app.server.purgatory import DelayedOperation
+from app.server.server_args import ServerArguments
+
+# Kafka's compression.type: "producer" keeps whatever codec each batch arrived in
+PRODUCER_COMPRESSION = "producer"
+PRODUCE_REQUEST = codec.MESSAGES["ProduceRequest"]
+PRODUCE_RESPONSE = codec.MESSAGES["ProduceResponse"]
+ProduceRequest = PRODUCE_REQUEST.struct
+PartitionProduceData = PRODUCE_REQUEST.structs["PartitionProduceData"]
+ProduceResponse = PRODUCE_RESPONSE.struct
+TopicProduceResponse = PRODUCE_RESPONSE.structs["TopicProduceResponse"]
+PartitionProduceResponse = PRODUCE_RESPONSE.structs["PartitionProduceResponse"]
+
+
+def serialize(request: KafkaRequestHeader, topics: list[TopicProduceResponse],
+              throttle_time_ms: int = 0) -> ResponseBody:
+    return PRODUCE_RESPONSE.encode_response(request, ProduceResponse(topics, throttle_time_ms))
+
+
+def compression_settings(server_args: ServerArguments) -> tuple[Optional[int], Optional[int]]:
+    name = server_args.properties.get("compression.type", PRODUCER_COMPRESSION)
+    if name == PRODUCER_COMPRESSION:
+        return None, None
+    level = server_args.properties.get(f"compression.{name}.level")
+    return compression.CODEC_NAMES[name], None if level is None else int(level)
+
+
+def decode_records(records: Optional[bytes | memoryview], codec: Optional[int], level: Optional[int],
+                   verifier: CrcVerifier) -> tuple[bytes | memoryview, list[BatchHeader]]:
+    # runs on the compression pool: checksums, inflating to validate and re-encoding are the CPU-heavy parts
+    records = records or b""
+    headers = read_batch_headers(records)
+    verify_crcs(records, headers, verifier)
+    validate_compressed(records, headers)
+    if codec is not None:
+        converted = recompress(records, headers, codec, level)
+        if converted is not records:
+            return converted, read_batch_headers(converted)
+    return records, headers
+
+
+def append_partition(log_manager: LogManager, topic_name: str, partition: PartitionProduceData,
+                     decoded: Future) -> tuple[PartitionProduceResponse, Optional[int]]:
+    try:
+        records, headers = decoded.result()
+    except compression.UnsupportedCodecError as e:
+        return PartitionProduceResponse(partition.index, errors.UNSUPPORTED_COMPRESSION_TYPE,
+                                        error_message=str(e)), None
+    except InvalidRecordError as e:
+        return PartitionProduceResponse(partition.index, errors.CORRUPT_MESSAGE, error_message=str(e)), None
+    log = log_manager.get(topic_name, partition.index)
+    base_offset, segment = log.append(records, headers)
+    # fetches waiting on this partition may have enough now
+    log_manager.fetch_purgatory.check_and_complete((topic_name, partition.index))
+    # every append schedules a flush; only acks=all waits for it
+    ticket = log_manager.committer.request(segment, (topic_name, partition.index))
+    return PartitionProduceResponse(partition.index, errors.NONE, base_offset,
+                                    log_start_offset=log.log_start_offset), ticket
+
+
+class DelayedProduce(DelayedOperation):
+    # acks=all: answered once the group commit has synced every append of the request
+
+    def __init__(self, request: KafkaRequestHeader, topics: list[TopicProduceResponse], log_manager: LogManager,
+                 appended: list[tuple[tuple[str, int], int, PartitionProduceResponse]], timeout_ms: int):
+        super().__init__(timeout_ms)
+        self.request = request
+        self.topics = topics
+        self.log_manager = log_manager
+        # ((topic, partition), commit ticket, response) of every append
+        self.appended = appended
+        self.ticket = max(x[1] for x in appended)
+        self.synced = False
+
+    def try_complete(self) -> bool:
+        if self.log_manager.committer.completed < self.ticket:
+            return False
+        self.synced = True
+        return self.force_complete()
+
+    def on_complete(self) -> ResponseBody:
+        if self.synced:
+            committer = self.log_manager.committer
+            for key, ticket, partition_response in self.appended:
+                if committer.failed(key, ticket):
+                    partition_response.error_code = errors.KAFKA_STORAGE_ERROR
+        else:
+            for topic_response in self.topics:
+                for partition_response in topic_response.partitions:
+                    if partition_response.error_code == errors.NONE:
+                        partition_response.error_code = errors.REQUEST_TIMED_OUT
+        return serialize(self.request, self.topics, self.request.throttle_time_ms)
+
+
+def handle_produce(request: KafkaRequestHeader, server_args: ServerArguments) -> KafkaResponse:
+    produce_request = PRODUCE_REQUEST.decode(request)
+    index = cache.read_partition(server_args).index
+    log_manager = get_log_manager(server_args)
+    executor = get_executor(server_args)
+    codec, level = compression_settings(server_args)
+    verifier = get_verifier(server_args)
+    # decoding of every partition is started before the first append so the pool works on them together
+    pending: list[tuple[TopicProduceResponse, str, PartitionProduceData, Optional[Future]]] = []
+    topics = []
+    for topic in produce_request.topics:
+        topic_response = TopicProduceResponse(topic.name)
+        for partition in topic.partitions:
+            decoded = None
+            if produce_request.acks in (-1, 0, 1) and index.partition(topic.name, partition.index) is not None:
+                decoded = executor.submit(decode_records, partition.records, codec, level, verifier)
+            pending.append((topic_response, topic.name, partition, decoded))
+        topics.append(topic_response)
+
+    appended = []
+    for topic_response, topic_name, partition, decoded in pending:
+        if produce_request.acks not in (-1, 0, 1):
+            topic_response.partitions.append(PartitionProduceResponse(partition.index, errors.INVALID_REQUIRED_ACKS))
+            continue
+        if decoded is None:
+            topic_response.partitions.append(PartitionProduceResponse(partition.index,
+                                                                      errors.UNKNOWN_TOPIC_OR_PARTITION))
+            continue
+        partition_response, ticket = append_partition(log_manager, topic_name, partition, decoded)
+        topic_response.partitions.append(partition_response)
+        if ticket is not None:
+            appended.append(((topic_name, partition.index), ticket, partition_response))
+
+    if produce_request.acks == 0:
+        return KafkaResponse(0, None)
+    if produce_request.acks == -1 and appended:
+        # the handler does not wait for the fsync, the commit of the last append completes the operation
+        operation = DelayedProduce(request, topics, log_manager, appended, produce_request.timeout_ms)
+        if log_manager.produce_purgatory.try_complete_else_watch(operation, [x[0] for x in appended]):
+            return KafkaResponse(0, operation.response.result())
+        return KafkaResponse(0, None, delayed=operation.response)
+    return KafkaResponse(0, serialize(request, topics, request.throttle_time_ms))
@@ -0,0 +1,51 @@
+import uuid
+from unittest import TestCase
+
+import describe_topic_partitions
+from app.api.testing import make_index
+from app.metadata.metadata import TopicIndex
+from describe_topic_partitions import Cursor, DescribeTopicPartitionsRequest, TopicRequest
+
+
+def pages(index: TopicIndex, names: list[str], limit: int) -> list[list[tuple[str, list[int]]]]:
+    result = []
+    cursor = None
+    # more pages than partitions means the cursor stopped moving
+    for _ in range(len(index.store) + 2):
+        request = DescribeTopicPartitionsRequest([TopicRequest(x) for x in names], limit, cursor)
+        topics, cursor = describe_topic_partitions.describe(index, request, limit)
+        result.append([(topic.name, [p.partition_id for p in topic.partitions]) for topic in topics])
+        if cursor is None:
+            return result
+    raise AssertionError(f"still paging after {result}")
+
+
+class TestDescribe(TestCase):
+    def setUp(self):
+        self.index = make_index({"foo": 3, "bar": 2, "baz": 0})
+
+    def test_returns_all_requested_topics_sorted(self):
+        topics, cursor = describe_topic_partitions.describe(
+            self.index, DescribeTopicPartitionsRequest([TopicRequest(x) for x in ("foo", "bar", "nope")], 100, None),
+            100)
+        self.assertIsNone(cursor)
+        self.assertEqual(["bar", "foo", "nope"], [topic.name for topic in topics])
+        self.assertEqual([0, 1], [p.partition_id for p in topics[0].partitions])
+        self.assertEqual(3, topics[2].error_code)
+        self.assertEqual(uuid.UUID(int=0), topics[2].topic_id)
+
+    def test_paginates_every_partition_exactly_once(self):
+        self.assertEqual([[("bar", [0, 1]), ("baz", [])], [("foo", [0, 1])], [("foo", [2])]],
+                         pages(self.index, [], 2))
+
+    def test_limits_below_one_still_end(self):
+        index = make_index({"foo": 2, "bar": 1, "baz": 3})
+        one_each = [[("bar", [0])], [("baz", [0])], [("baz", [1])], [("baz", [2])], [("foo", [0])], [("foo", [1])]]
+        for limit in (1, 0, -5):
+            self.assertEqual(one_each, pages(index, [], limit))
+
+    def test_cursor_in_the_middle_of_a_topic(self):
+        request = DescribeTopicPartitionsRequest([TopicRequest("foo")], 1, Cursor("foo", 1))
+        topics, cursor = describe_topic_partitions.describe(self.index, request, 1)
+        self.assertEqual([1], [p.partition_id for p in topics[0].partitions])
+        self.assertEqual(Cursor("foo", 2), cursor)
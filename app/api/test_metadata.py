@@ -0,0 +1,104 @@
+import uuid
+from unittest import TestCase
+
+import metadata
+from app.api.testing import make_index, partition_record
+from app.metadata.metadata import TOPIC_RECORD_TYPE, TopicIndex, TopicRecord
+from app.protocol import errors
+from app.protocol.request import KafkaRequestHeader
+from metadata import MetadataRequest, MetadataRequestTopic
+
+
+def header(version: int) -> KafkaRequestHeader:
+    return KafkaRequestHeader(0, 3, version, 42, b"", b"")
+
+
+class TestMetadata(TestCase):
+    def setUp(self):
+        self.index = make_index({"foo": 3, "bar": 2, "__internal": 1})
+        self.cache = metadata.MetadataResponseCache(7, "cluster")
+        self.cache.use(self.index)
+
+    def respond(self, request: MetadataRequest, version: int):
+        count, topics = metadata.select_topics(self.cache, self.index, request, version)
+        body = bytes(metadata.serialize(header(version), self.cache.shells[version], count, topics, 25))
+        # size, correlation id and, from v9 on, the header's tagged fields
+        self.assertEqual(42, int.from_bytes(body[4:8]))
+        return metadata.METADATA_RESPONSE.decode_body(body, 9 if version >= 9 else 8, version)
+
+    def test_every_version_decodes(self):
+        for version in metadata.METADATA_RESPONSE.versions:
+            response = self.respond(MetadataRequest(None if version else []), version)
+            self.assertEqual(25 if version >= 3 else 0, response.throttle_time_ms)
+            self.assertEqual([(7, "localhost", 9092)], [(x.node_id, x.host, x.port) for x in response.brokers])
+            self.assertEqual(["__internal", "bar", "foo"], [x.name for x in response.topics], f"v{version}")
+            foo = response.topics[2]
+            self.assertEqual([0, 1, 2], [x.partition_index for x in foo.partitions])
+            self.assertEqual(([1, 2], [1]), (foo.partitions[0].replica_nodes, foo.partitions[0].isr_nodes))
+            if version >= 1:
+                self.assertEqual(7, response.controller_id)
+                self.assertTrue(response.topics[0].is_internal)
+            if version >= 2:
+                self.assertEqual("cluster", response.cluster_id)
+            if version >= 10:
+                self.assertEqual(uuid.UUID(int=1), foo.topic_id)
+
+    def test_requested_topics(self):
+        request = MetadataRequest([MetadataRequestTopic(name=x) for x in ("foo", "nope", "foo")])
+        response = self.respond(request, 9)
+        self.assertEqual([("foo", errors.NONE), ("nope", errors.UNKNOWN_TOPIC_OR_PARTITION)],
+                         [(x.name, x.error_code) for x in response.topics])
+        # from v1 on an empty list asks for no topics at all
+        self.assertEqual([], self.respond(MetadataRequest([]), 1).topics)
+        by_id = MetadataRequest([MetadataRequestTopic(uuid.UUID(int=2), None),
+                                 MetadataRequestTopic(uuid.UUID(int=9), None)])
+        self.assertEqual([("bar", errors.NONE), (None, errors.UNKNOWN_TOPIC_ID)],
+                         [(x.name, x.error_code) for x in self.respond(by_id, 12).topics])
+
+    def test_authorized_operations(self):
+        request = MetadataRequest(None, include_topic_authorized_operations=True)
+        self.assertEqual(0x0df8, self.respond(request, 10).topics[0].topic_authorized_operations)
+        self.assertEqual(metadata.AUTHORIZED_OPERATIONS_OMITTED,
+                         self.respond(MetadataRequest(None), 10).topics[0].topic_authorized_operations)
+
+    def test_only_changed_topics_are_encoded_again(self):
+        self.respond(MetadataRequest(None), 12)
+        self.assertEqual({"hits": 0, "misses": 3}, self.cache.stats())
+        self.respond(MetadataRequest(None), 12)
+        self.respond(MetadataRequest([MetadataRequestTopic(name="bar")]), 12)
+        self.assertEqual({"hits": 1, "misses": 3}, self.cache.stats())
+
+        self.index.apply(partition_record(uuid.UUID(int=1), 1, leader=2, leader_epoch=5))
+        response = self.respond(MetadataRequest(None), 12)
+        changed = response.topics[2].partitions[1]
+        self.assertEqual((2, 5), (changed.leader_id, changed.leader_epoch))
+        self.assertEqual({"hits": 3, "misses": 4}, self.cache.stats())
+
+        # a reloaded log starts over
+        self.index = make_index({"baz": 1})
+        self.cache.use(self.index)
+        self.assertEqual(["baz"], [x.name for x in self.respond(MetadataRequest(None), 12).topics])
+
+    def test_fragments_of_a_replaced_index_are_not_kept(self):
+        old = make_index({"foo": 3})
+        self.cache.use(old)
+        # the reloaded log has the same topic and the same change counts, with another leader
+        new = TopicIndex()
+        new.apply(TopicRecord(1, TOPIC_RECORD_TYPE, 0, 3, "foo", uuid.UUID(int=1), 0))
+        for partition_id in range(3):
+            new.apply(partition_record(uuid.UUID(int=1), partition_id, leader=2))
+        encode_topic = metadata.encode_topic
+
+        def reload_while_encoding(topic, version):
+            # another handler swaps the index while this one is still encoding from the old one
+            self.cache.use(new)
+            return encode_topic(topic, version)
+
+        metadata.encode_topic = reload_while_encoding
+        try:
+            self.cache.topic(old, "foo", 12, False)
+        finally:
+            metadata.encode_topic = encode_topic
+        self.index = new
+        response = self.respond(MetadataRequest(None), 12)
+        self.assertEqual([2, 2, 2], [x.leader_id for x in response.topics[0].partitions])
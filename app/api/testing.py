@@ -0,0 +1,19 @@
+import uuid
+
+from app.metadata.metadata import PARTITION_RECORD_TYPE, TOPIC_RECORD_TYPE, PartitionRecord, TopicIndex, TopicRecord
+
+
+def partition_record(topic_id: uuid.UUID, partition_id: int, leader: int = 1, leader_epoch: int = 0) -> PartitionRecord:
+    return PartitionRecord(1, PARTITION_RECORD_TYPE, 1, partition_id, topic_id, 2, [1, 2], 1, [leader], 0, 0, leader,
+                           leader_epoch, 0, 0, [], 0)
+
+
+def make_index(topics: dict[str, int]) -> TopicIndex:
+    # topic ids count up from 1 in the order given
+    index = TopicIndex()
+    for i, (name, partition_count) in enumerate(topics.items()):
+        topic_id = uuid.UUID(int=i + 1)
+        index.apply(TopicRecord(1, TOPIC_RECORD_TYPE, 0, len(name), name, topic_id, 0))
+        for partition_id in range(partition_count):
+            index.apply(partition_record(topic_id, partition_id))
+    return index
@@ -0,0 +1,172 @@
+import struct
+from dataclasses import dataclass
+from typing import Optional
+
+from app.log.crc import ATTRIBUTES_START, CRC, CRC_START, CrcVerifier, crc32c
+from app.metadata.metadata import BATCH_HEADER, BATCH_LENGTH_END, COMPRESSION_MASK, Compression
+from app.protocol import compression
+from app.protocol.reader import read_varint
+
+MAGIC_V2 = 2
+BATCH_LENGTH = struct.Struct(">i")
+ATTRIBUTES = struct.Struct(">H")
+
+
+class InvalidRecordError(ValueError):
+    pass
+
+
+@dataclass(slots=True)
+class BatchHeader:
+    position: int
+    base_offset: int
+    batch_length: int
+    magic_byte: int
+    crc: int
+    attributes: int
+    last_offset_delta: int
+    base_timestamp: int
+    max_timestamp: int
+    records_count: int
+
+    @property
+    def size(self) -> int:
+        return BATCH_LENGTH_END + self.batch_length
+
+    @property
+    def end(self) -> int:
+        return self.position + self.size
+
+    @property
+    def codec(self) -> int:
+        return self.attributes & COMPRESSION_MASK
+
+    @property
+    def compression(self) -> Compression:
+        return Compression.of(self.codec)
+
+
+def parse_batch_header(buffer: bytes | memoryview, position: int) -> BatchHeader:
+    # same v2 layout metadata.RecordBatch is parsed from; only the header is looked at, records stay opaque
+    (base_offset, batch_length, _, magic_byte, crc, attributes, last_offset_delta, base_timestamp,
+     max_timestamp, _, _, _, records_count) = BATCH_HEADER.unpack_from(buffer, position)
+    return BatchHeader(position, base_offset, batch_length, magic_byte, crc & 0xFFFFFFFF, attributes,
+                       last_offset_delta, base_timestamp, max_timestamp, records_count)
+
+
+def read_batch_headers(records: bytes | memoryview) -> list[BatchHeader]:
+    headers = []
+    position = 0
+    while position < len(records):
+        if len(records) - position < BATCH_HEADER.size:
+            raise InvalidRecordError(f"truncated batch header at {position}")
+        header = parse_batch_header(records, position)
+        if header.magic_byte != MAGIC_V2:
+            raise InvalidRecordError(f"unsupported magic {header.magic_byte} at {position}")
+        if header.size < BATCH_HEADER.size or header.end > len(records):
+            raise InvalidRecordError(f"batch length {header.batch_length} at {position} does not fit the records")
+        if header.last_offset_delta < 0 or header.records_count < 0:
+            raise InvalidRecordError(f"negative record count at {position}")
+        headers.append(header)
+        position = header.end
+    if not headers:
+        raise InvalidRecordError("no record batches")
+    return headers
+
+
+def records_of(records: bytes | memoryview, header: BatchHeader) -> bytes | memoryview:
+    # the records of a batch, decompressed if the batch is compressed
+    section = memoryview(records)[header.position + BATCH_HEADER.size: header.end]
+    try:
+        return compression.decompress(header.codec, section)
+    except compression.UnsupportedCodecError:
+        raise
+    except ValueError as e:
+        raise InvalidRecordError(f"batch at {header.position}: {e}") from e
+
+
+def count_records(data: bytes | memoryview) -> int:
+    index = 0
+    count = 0
+    while index < len(data):
+        length, index = read_varint(data, index)
+        if length <= 0:
+            raise InvalidRecordError(f"record length {length} at {index}")
+        index += length
+        count += 1
+    if index != len(data):
+        raise InvalidRecordError("last record runs past the end of the batch")
+    return count
+
+
+def verify_crcs(records: bytes | memoryview, headers: list[BatchHeader], verifier: CrcVerifier) -> None:
+    corrupt = verifier.verify_batches(records, [(x.position, x.end) for x in headers], loading=False)
+    if corrupt:
+        raise InvalidRecordError(f"crc mismatch in batch at {corrupt[0]}")
+
+
+def validate_compressed(records: bytes | memoryview, headers: list[BatchHeader]) -> None:
+    # a compressed batch is opaque until it is inflated, so that is the only way to know it is well formed
+    for header in headers:
+        if header.codec == compression.NO_COMPRESSION:
+            continue
+        if count_records(records_of(records, header)) != header.records_count:
+            raise InvalidRecordError(f"batch at {header.position} does not hold {header.records_count} records")
+
+
+def recompress_batch(records: bytes | memoryview, header: BatchHeader, codec: int,
+                     level: Optional[int] = None) -> bytes:
+    payload = compression.compress(codec, records_of(records, header), level)
+    batch = bytearray(memoryview(records)[header.position: header.position + BATCH_HEADER.size])
+    batch += payload
+    BATCH_LENGTH.pack_into(batch, 8, len(batch) - BATCH_LENGTH_END)
+    ATTRIBUTES.pack_into(batch, ATTRIBUTES_START, (header.attributes & ~COMPRESSION_MASK) | codec)
+    CRC.pack_into(batch, CRC_START, crc32c(memoryview(batch)[ATTRIBUTES_START:]))
+    return bytes(batch)
+
+
+def recompress(records: bytes | memoryview, headers: list[BatchHeader], codec: int,
+               level: Optional[int] = None) -> bytes | memoryview:
+    # only batches in another codec are rewritten; the rest are copied as received
+    if all(x.codec == codec for x in headers):
+        return records
+    view = memoryview(records)
+    return b"".join(view[x.position: x.end] if x.codec == codec else recompress_batch(view, x, codec, level)
+                    for x in headers)
+
+
+def encode_varint(value: int) -> bytes:
+    value = (value << 1) ^ (value >> 63)
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_record(offset_delta: int, timestamp_delta: int, key: Optional[bytes], value: Optional[bytes]) -> bytes:
+    body = bytearray(b"\x00")
+    body += encode_varint(timestamp_delta)
+    body += encode_varint(offset_delta)
+    for part in (key, value):
+        if part is None:
+            body += encode_varint(-1)
+        else:
+            body += encode_varint(len(part))
+            body += part
+    body += encode_varint(0)
+    return encode_varint(len(body)) + bytes(body)
+
+
+def build_record_batch(values: list[tuple[Optional[bytes], Optional[bytes]]], base_timestamp: int = 0,
+                       base_offset: int = 0, attributes: int = 0, codec: int = compression.NO_COMPRESSION) -> bytes:
+    records = b"".join(encode_record(i, 0, key, value) for i, (key, value) in enumerate(values))
+    records = compression.compress(codec, records)
+    attributes = (attributes & ~COMPRESSION_MASK) | codec
+    batch = bytearray(BATCH_HEADER.size)
+    BATCH_HEADER.pack_into(batch, 0, base_offset, BATCH_HEADER.size - BATCH_LENGTH_END + len(records), 0, MAGIC_V2,
+                           0, attributes, len(values) - 1, base_timestamp, base_timestamp, -1, -1, -1, len(values))
+    batch += records
+    CRC.pack_into(batch, CRC_START, crc32c(memoryview(batch)[ATTRIBUTES_START:]))
+    return bytes(batch)
@@ -0,0 +1,146 @@
+import random
+import struct
+import threading
+import time
+from enum import Enum
+from typing import Optional
+
+from app.server.server_args import ServerArguments
+
+try:
+    import crc32c as _native
+except ImportError:
+    _native = None
+
+# CRC-32C (Castagnoli), the checksum of v2 record batches; the stdlib only has the zlib polynomial
+CASTAGNOLI = 0x82F63B78
+# the crc sits right before the attributes and covers everything from them to the end of the batch
+CRC_START = 17
+ATTRIBUTES_START = 21
+CRC = struct.Struct(">I")
+DEFAULT_SAMPLE_RATE = 0.01
+
+
+def _make_table() -> list[int]:
+    table = []
+    for n in range(256):
+        crc = n
+        for _ in range(8):
+            crc = (crc >> 1) ^ CASTAGNOLI if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+def _make_slices(table: list[int]) -> list[list[int]]:
+    # slice k answers "what does this byte contribute once k more zero bytes follow it"
+    slices = [table]
+    for _ in range(7):
+        previous = slices[-1]
+        slices.append([(x >> 8) ^ table[x & 0xFF] for x in previous])
+    return slices
+
+
+TABLE = _make_table()
+SLICES = _make_slices(TABLE)
+
+
+def crc32c_bytewise(data: bytes | memoryview, crc: int = 0) -> int:
+    crc ^= 0xFFFFFFFF
+    table = TABLE
+    for byte in bytes(data):
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def crc32c_sliced(data: bytes | memoryview, crc: int = 0) -> int:
+    # slicing-by-8: eight table lookups per eight bytes instead of a loop iteration per byte
+    t0, t1, t2, t3, t4, t5, t6, t7 = SLICES
+    crc ^= 0xFFFFFFFF
+    data = memoryview(data)
+    whole = len(data) & ~7
+    for low, high in struct.iter_unpack("<II", data[:whole]):
+        low ^= crc
+        crc = (t7[low & 0xFF] ^ t6[(low >> 8) & 0xFF] ^ t5[(low >> 16) & 0xFF] ^ t4[low >> 24]
+               ^ t3[high & 0xFF] ^ t2[(high >> 8) & 0xFF] ^ t1[(high >> 16) & 0xFF] ^ t0[high >> 24])
+    for byte in bytes(data[whole:]):
+        crc = t0[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+if _native is not None:
+    def crc32c(data: bytes | memoryview, crc: int = 0) -> int:
+        return _native.crc32c(data, crc)
+else:
+    crc32c = crc32c_sliced
+
+IMPLEMENTATION = "native" if _native is not None else "slicing-by-8"
+
+
+def batch_crc_matches(buffer: bytes | memoryview, position: int, end: int) -> bool:
+    (stored,) = CRC.unpack_from(buffer, position + CRC_START)
+    return crc32c(memoryview(buffer)[position + ATTRIBUTES_START: end]) == stored
+
+
+class CrcMode(Enum):
+    ALWAYS = "always"
+    ON_LOAD = "on-load"
+    SAMPLED = "sampled"
+    OFF = "off"
+
+
+class CrcVerifier:
+
+    def __init__(self, mode: CrcMode = CrcMode.ON_LOAD, sample_rate: float = DEFAULT_SAMPLE_RATE):
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self.verified_bytes = 0
+        self.seconds = 0.0
+        self.failures = 0
+
+    def wants(self, loading: bool) -> bool:
+        if self.mode == CrcMode.ALWAYS:
+            return True
+        if self.mode == CrcMode.ON_LOAD:
+            return loading
+        if self.mode == CrcMode.SAMPLED:
+            return random.random() < self.sample_rate
+        return False
+
+    def verify_batches(self, buffer: bytes | memoryview, spans: list[tuple[int, int]], loading: bool) -> list[int]:
+        # positions of the batches whose crc does not match; the whole list is checked in one go so the
+        # bytes/sec figure covers a real amount of data
+        start = time.perf_counter()
+        checked = 0
+        corrupt = []
+        for position, end in spans:
+            if not self.wants(loading):
+                continue
+            checked += end - position
+            if not batch_crc_matches(buffer, position, end):
+                corrupt.append(position)
+        if checked:
+            with self.lock:
+                self.verified_bytes += checked
+                self.seconds += time.perf_counter() - start
+                self.failures += len(corrupt)
+        return corrupt
+
+    def stats(self) -> dict[str, float]:
+        with self.lock:
+            rate = self.verified_bytes / self.seconds if self.seconds else 0.0
+            return {"bytes": self.verified_bytes, "seconds": self.seconds, "failures": self.failures,
+                    "bytes_per_second": rate}
+
+
+_verifier: Optional[CrcVerifier] = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier(server_args: ServerArguments) -> CrcVerifier:
+    global _verifier
+    with _verifier_lock:
+        if _verifier is None:
+            _verifier = CrcVerifier(CrcMode(server_args.properties.get("log.crc.verification", CrcMode.ON_LOAD.value)),
+                                    float(server_args.properties.get("log.crc.sample.rate", DEFAULT_SAMPLE_RATE)))
+        return _verifier
@@ -0,0 +1,75 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Hashable, Optional, Protocol
+
+logger = logging.getLogger(__name__)
+
+
+class Syncable(Protocol):
+    def fsync(self) -> None: ...
+
+
+class GroupCommitter:
+
+    def __init__(self, linger_ms: int = 0):
+        self.linger = linger_ms / 1000
+        self.condition = threading.Condition()
+        # each target with whatever its appends want to be told about once they are durable, and who is told
+        self.dirty: dict[Syncable, set[Hashable]] = {}
+        self.listeners: list[Callable[[set[Hashable]], None]] = []
+        self.requested = 0
+        self.completed = 0
+        self.commits = 0
+        # key -> tickets (after, up to) of the last commit that failed to sync its target
+        self.failures: dict[Hashable, tuple[int, int]] = {}
+        self.thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self.thread.start()
+
+    def request(self, target: Syncable, key: Optional[Hashable] = None) -> int:
+        with self.condition:
+            keys = self.dirty.setdefault(target, set())
+            if key is not None:
+                keys.add(key)
+            self.requested += 1
+            self.condition.notify_all()
+            return self.requested
+
+    def wait(self, ticket: int, timeout: float | None = None) -> bool:
+        with self.condition:
+            return self.condition.wait_for(lambda: self.completed >= ticket, timeout)
+
+    def failed(self, key: Hashable, ticket: int) -> bool:
+        # whether the commit that covered ticket could not sync the target key was appended to
+        failure = self.failures.get(key)
+        return failure is not None and failure[0] < ticket <= failure[1]
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.dirty)
+            if self.linger:
+                # give concurrent producers a moment to join this commit
+                time.sleep(self.linger)
+            with self.condition:
+                dirty = self.dirty
+                self.dirty = {}
+                ticket = self.requested
+            failed = set()
+            for target, target_keys in dirty.items():
+                try:
+                    target.fsync()
+                except Exception as e:
+                    # the waiters of its appends learn from failed()
+                    logger.error("fsync of %s failed: %r", target, e)
+                    failed |= target_keys
+            keys = set().union(*dirty.values())
+            with self.condition:
+                for key in failed:
+                    self.failures[key] = (self.completed, ticket)
+                self.completed = ticket
+                self.commits += 1
+                self.condition.notify_all()
+            for listener in self.listeners:
+                listener(keys)
@@ -0,0 +1,125 @@
+import mmap
+import os
+import pathlib
+import struct
+from typing import Optional
+
+INDEX_SUFFIX = ".index"
+TIME_INDEX_SUFFIX = ".timeindex"
+DEFAULT_INDEX_INTERVAL_BYTES = 4096
+DEFAULT_MAX_INDEX_BYTES = 10 * 1024 * 1024
+
+
+class CorruptIndexError(ValueError):
+    pass
+
+
+class SparseIndex:
+    # fixed-size big-endian entries sorted by their first field, preallocated and mapped like Kafka's index files
+    entry: struct.Struct
+
+    def __init__(self, path: pathlib.Path, max_bytes: int = DEFAULT_MAX_INDEX_BYTES):
+        self.path = path
+        self.max_entries = max(max_bytes // self.entry.size, 1)
+        self.file = open(path, 'a+b')
+        size = os.fstat(self.file.fileno()).st_size
+        if size % self.entry.size:
+            raise CorruptIndexError(f"{path} is {size} bytes, not a multiple of {self.entry.size}")
+        self.entries = size // self.entry.size
+        if self.entries > self.max_entries:
+            raise CorruptIndexError(f"{path} holds {self.entries} entries, at most {self.max_entries} fit")
+        self.file.truncate(self.max_entries * self.entry.size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        # an unclean shutdown leaves the preallocated zero tail in place
+        self.entries = self._count_entries(self.entries)
+
+    @property
+    def is_full(self) -> bool:
+        return self.entries >= self.max_entries
+
+    def entry_at(self, i: int) -> tuple[int, ...]:
+        return self.entry.unpack_from(self.map, i * self.entry.size)
+
+    def last(self) -> Optional[tuple[int, ...]]:
+        return self.entry_at(self.entries - 1) if self.entries else None
+
+    def append(self, *values: int) -> None:
+        self.entry.pack_into(self.map, self.entries * self.entry.size, *values)
+        self.entries += 1
+
+    def lookup(self, key: int) -> Optional[tuple[int, ...]]:
+        # the last entry whose key is <= key
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry_at(middle)[0] <= key:
+                low = middle + 1
+            else:
+                high = middle
+        return self.entry_at(low - 1) if low else None
+
+    def truncate_to(self, entries: int) -> None:
+        self.map[entries * self.entry.size: self.entries * self.entry.size] = bytes(
+            (self.entries - entries) * self.entry.size)
+        self.entries = entries
+
+    def trim(self) -> None:
+        # shrink the file to its real entries once the segment stops growing
+        self.map.flush()
+        self.map.close()
+        self.file.truncate(self.entries * self.entry.size)
+        self.file.flush()
+        self.map = mmap.mmap(self.file.fileno(), 0) if self.entries else None
+
+    def reload(self) -> None:
+        # the mapping is shared, so entries appended by another process are already visible
+        self.entries = self._count_entries(len(self.map) // self.entry.size)
+
+    def flush(self) -> None:
+        if self.map is not None:
+            self.map.flush()
+
+    def close(self) -> None:
+        if self.map is not None and len(self.map) != self.entries * self.entry.size:
+            self.trim()
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def _count_entries(self, limit: int) -> int:
+        # real entries are never all zeros, so the zero tail starts at the first zero entry
+        empty = bytes(self.entry.size)
+        low, high = 0, limit
+        while low < high:
+            middle = (low + high) // 2
+            if self.map[middle * self.entry.size: (middle + 1) * self.entry.size] == empty:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+
+class OffsetIndex(SparseIndex):
+    # relative offset of a batch's base offset, byte position of the batch in the segment
+    entry = struct.Struct(">ii")
+
+    def check(self, segment_size: int) -> None:
+        previous = -1
+        for i in range(self.entries):
+            relative_offset, position = self.entry_at(i)
+            if relative_offset <= previous or not 0 <= position < segment_size:
+                raise CorruptIndexError(f"{self.path} entry {i} ({relative_offset}, {position}) is out of order")
+            previous = relative_offset
+
+
+class TimeIndex(SparseIndex):
+    # largest timestamp seen so far, relative offset of the batch it was first seen in
+    entry = struct.Struct(">qi")
+
+    def check(self, segment_size: int) -> None:
+        previous = (-1 << 63, -1)
+        for i in range(self.entries):
+            current = self.entry_at(i)
+            if current[0] < previous[0] or current[1] < previous[1]:
+                raise CorruptIndexError(f"{self.path} entry {i} {current} is out of order")
+            previous = current
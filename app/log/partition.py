@@ -0,0 +1,422 @@
+import bisect
+import contextlib
+import fcntl
+import os
+import pathlib
+import struct
+import threading
+from typing import Optional
+
+from app.log.batches import MAGIC_V2, BatchHeader, parse_batch_header
+from app.log.crc import CrcVerifier, get_verifier
+from app.log.group_commit import GroupCommitter
+from app.log.index import (CorruptIndexError, DEFAULT_INDEX_INTERVAL_BYTES, DEFAULT_MAX_INDEX_BYTES, INDEX_SUFFIX,
+                           TIME_INDEX_SUFFIX, OffsetIndex, SparseIndex, TimeIndex)
+from app.metadata.metadata import BATCH_HEADER
+from app.protocol.writer import FileRegion
+from app.server.purgatory import DelayedOperationPurgatory
+from app.server.server_args import ServerArguments
+
+LOG_SUFFIX = ".log"
+BASE_OFFSET = struct.Struct(">q")
+DEFAULT_SEGMENT_BYTES = 1024 * 1024 * 1024
+NO_TIMESTAMP = -1
+
+
+def segment_name(base_offset: int) -> str:
+    return f"{base_offset:020d}"
+
+
+class LogSegment:
+
+    def __init__(self, path: pathlib.Path, base_offset: int, index_interval_bytes: int = DEFAULT_INDEX_INTERVAL_BYTES,
+                 max_index_bytes: int = DEFAULT_MAX_INDEX_BYTES):
+        self.path = path
+        self.base_offset = base_offset
+        self.index_interval_bytes = index_interval_bytes
+        self.max_index_bytes = max_index_bytes
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self.size = os.fstat(self.fd).st_size
+        # separate read handle for sendfile so readers never touch the append descriptor
+        self.file = open(path, 'rb', buffering=0)
+        self.offset_index = self._open_index(OffsetIndex, INDEX_SUFFIX)
+        self.time_index = self._open_index(TimeIndex, TIME_INDEX_SUFFIX)
+        self.bytes_since_index_entry = 0
+        last_time_entry = self.time_index.last()
+        self.max_timestamp, self.max_timestamp_offset = (last_time_entry[0], base_offset + last_time_entry[1]) \
+            if last_time_entry else (NO_TIMESTAMP, -1)
+
+    @property
+    def is_full(self) -> bool:
+        return self.offset_index.is_full or self.time_index.is_full
+
+    def append(self, buffers: list[bytes | memoryview], headers: list[BatchHeader]) -> int:
+        position = self.size
+        total = sum(len(x) for x in buffers)
+        written = os.writev(self.fd, buffers)
+        if written < total:
+            rest = memoryview(b"".join(buffers))[written:]
+            while rest:
+                rest = rest[os.write(self.fd, rest):]
+        self.size += total
+        batch_position = position
+        for header in headers:
+            self._index_batch(header, batch_position)
+            batch_position += header.size
+        return position
+
+    def read_header(self, position: int) -> Optional[BatchHeader]:
+        raw = os.pread(self.fd, BATCH_HEADER.size, position)
+        if len(raw) < BATCH_HEADER.size:
+            return None
+        header = parse_batch_header(raw, 0)
+        if header.magic_byte != MAGIC_V2 or header.size < BATCH_HEADER.size:
+            return None
+        header.position = position
+        return header
+
+    def load(self) -> None:
+        # segments that stopped growing were cleanly written, so only their indexes need checking
+        try:
+            self.offset_index.check(self.size)
+            self.time_index.check(self.size)
+        except CorruptIndexError:
+            self.rebuild_indexes()
+            return
+        if not self.time_index.entries and self.size:
+            self.rebuild_indexes()
+
+    def recover(self, verifier: Optional[CrcVerifier] = None) -> int:
+        # resume from the last indexed batch, re-index what follows and cut off a batch that was only partly
+        # written or, when verifying, fails its crc
+        try:
+            self.offset_index.check(self.size)
+            self.time_index.check(self.size)
+        except CorruptIndexError:
+            return self.rebuild_indexes(verifier)
+        last_entry = self.offset_index.last()
+        position = last_entry[1] if last_entry else 0
+        # an empty time index next to offset entries means the maximum timestamp has to be found again
+        if position and (self.read_header(position) is None or not self.time_index.entries):
+            return self.rebuild_indexes(verifier)
+        return self._scan(position, verifier)
+
+    def catch_up(self, next_offset: int) -> int:
+        # another worker appended: its index entries are already in the shared mappings, only the batches
+        # themselves are followed to keep the maximum timestamp
+        position = self.size
+        self.size = os.fstat(self.fd).st_size
+        self.offset_index.reload()
+        self.time_index.reload()
+        while position < self.size:
+            header = self.read_header(position)
+            if header is None or position + header.size > self.size:
+                # left behind by a worker that died mid-write
+                os.ftruncate(self.fd, position)
+                self.size = position
+                break
+            if header.max_timestamp > self.max_timestamp:
+                self.max_timestamp, self.max_timestamp_offset = header.max_timestamp, header.base_offset
+            next_offset = header.base_offset + header.last_offset_delta + 1
+            position += header.size
+        last_entry = self.offset_index.last()
+        self.bytes_since_index_entry = self.size - (last_entry[1] if last_entry else 0)
+        return next_offset
+
+    def rebuild_indexes(self, verifier: Optional[CrcVerifier] = None) -> int:
+        self.offset_index.truncate_to(0)
+        self.time_index.truncate_to(0)
+        self.bytes_since_index_entry = 0
+        self.max_timestamp, self.max_timestamp_offset = NO_TIMESTAMP, -1
+        return self._scan(0, verifier)
+
+    def find(self, offset: int, size: int) -> Optional[int]:
+        entry = self.offset_index.lookup(offset - self.base_offset)
+        position = entry[1] if entry else 0
+        while position < size:
+            header = self.read_header(position)
+            if header is None:
+                return None
+            if header.base_offset + header.last_offset_delta >= offset:
+                return position
+            position += header.size
+        return None
+
+    def find_timestamp(self, timestamp: int, size: int) -> Optional[BatchHeader]:
+        # first batch whose max timestamp reaches timestamp; offsets are resolved to batch granularity
+        entry = self.time_index.lookup(timestamp)
+        position = self.find(self.base_offset + entry[1], size) if entry else 0
+        while position is not None and position < size:
+            header = self.read_header(position)
+            if header is None:
+                return None
+            if header.max_timestamp >= timestamp:
+                return header
+            position += header.size
+        return None
+
+    def region(self, position: int, size: int, max_bytes: int) -> FileRegion:
+        # whole batches only, but always at least one so a consumer can make progress past a large batch
+        end = position
+        while end < size:
+            header = self.read_header(end)
+            if header is None or (end > position and end + header.size - position > max_bytes):
+                break
+            end += header.size
+        return FileRegion(self.file, position, end - position)
+
+    def trim_indexes(self) -> None:
+        self.offset_index.trim()
+        self.time_index.trim()
+
+    def fsync(self) -> None:
+        os.fsync(self.fd)
+        self.offset_index.flush()
+        self.time_index.flush()
+
+    def close(self) -> None:
+        self.offset_index.close()
+        self.time_index.close()
+        self.file.close()
+        os.close(self.fd)
+
+    def _index_batch(self, header: BatchHeader, position: int) -> None:
+        if header.max_timestamp > self.max_timestamp:
+            self.max_timestamp = header.max_timestamp
+            self.max_timestamp_offset = header.base_offset
+        if self.bytes_since_index_entry > self.index_interval_bytes:
+            self.offset_index.append(header.base_offset - self.base_offset, position)
+            last_time_entry = self.time_index.last()
+            if self.max_timestamp > (last_time_entry[0] if last_time_entry else NO_TIMESTAMP):
+                self.time_index.append(self.max_timestamp, self.max_timestamp_offset - self.base_offset)
+            self.bytes_since_index_entry = 0
+        self.bytes_since_index_entry += header.size
+
+    def _scan(self, position: int, verifier: Optional[CrcVerifier] = None) -> int:
+        entry = self.offset_index.last() if position else None
+        next_offset = self.base_offset + entry[0] if entry else self.base_offset
+        self.bytes_since_index_entry = 0
+        while position < self.size:
+            header = self.read_header(position)
+            if header is None or position + header.size > self.size:
+                break
+            if verifier is not None and verifier.verify_batches(os.pread(self.fd, header.size, position),
+                                                                [(0, header.size)], loading=True):
+                break
+            self._index_batch(header, position)
+            next_offset = header.base_offset + header.last_offset_delta + 1
+            position += header.size
+        if position < self.size:
+            os.ftruncate(self.fd, position)
+            self.size = position
+            self._drop_index_entries(next_offset)
+        return next_offset
+
+    def _drop_index_entries(self, next_offset: int) -> None:
+        entries = self.offset_index.entries
+        while entries and self.offset_index.entry_at(entries - 1)[1] >= self.size:
+            entries -= 1
+        self.offset_index.truncate_to(entries)
+        entries = self.time_index.entries
+        while entries and self.base_offset + self.time_index.entry_at(entries - 1)[1] >= next_offset:
+            entries -= 1
+        self.time_index.truncate_to(entries)
+
+    def _open_index(self, index_type: type[SparseIndex], suffix: str) -> SparseIndex:
+        path = self.path.with_suffix(suffix)
+        try:
+            return index_type(path, self.max_index_bytes)
+        except CorruptIndexError:
+            path.unlink()
+            return index_type(path, self.max_index_bytes)
+
+
+class PartitionLog:
+
+    def __init__(self, directory: pathlib.Path, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 index_interval_bytes: int = DEFAULT_INDEX_INTERVAL_BYTES,
+                 max_index_bytes: int = DEFAULT_MAX_INDEX_BYTES, shared: bool = False,
+                 verifier: Optional[CrcVerifier] = None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_interval_bytes = index_interval_bytes
+        self.max_index_bytes = max_index_bytes
+        self.shared = shared
+        self.lock = threading.Lock()
+        directory.mkdir(parents=True, exist_ok=True)
+        # worker processes serialize on an flock of the partition directory
+        self.directory_fd = os.open(directory, os.O_RDONLY) if shared else None
+        self.directory_mtime = 0
+        with self._process_lock(fcntl.LOCK_EX):
+            base_offsets = sorted(int(x.stem) for x in directory.glob(f"*{LOG_SUFFIX}"))
+            self.segments = [self._segment(x) for x in base_offsets] or [self._segment(0)]
+            for segment in self.segments[:-1]:
+                segment.load()
+            self.next_offset = self.segments[-1].recover(verifier)
+            if shared:
+                self.directory_mtime = os.fstat(self.directory_fd).st_mtime_ns
+
+    @property
+    def active_segment(self) -> LogSegment:
+        return self.segments[-1]
+
+    @property
+    def log_start_offset(self) -> int:
+        return self.segments[0].base_offset
+
+    def append(self, records: bytes | memoryview, headers: list[BatchHeader]) -> tuple[int, LogSegment]:
+        records = memoryview(records)
+        with self.lock, self._process_lock(fcntl.LOCK_EX):
+            self._catch_up()
+            base_offset = self.next_offset
+            # the broker owns offsets: each batch gets its base offset patched in, the rest is written as received
+            buffers = []
+            for header in headers:
+                header.base_offset = self.next_offset
+                buffers.append(BASE_OFFSET.pack(self.next_offset))
+                buffers.append(records[header.position + BASE_OFFSET.size: header.end])
+                self.next_offset += header.last_offset_delta + 1
+            active = self.active_segment
+            if active.size > 0 and (active.size + len(records) > self.segment_bytes or active.is_full):
+                # other workers may still map the preallocated index files
+                if not self.shared:
+                    active.trim_indexes()
+                self.segments.append(self._segment(base_offset))
+            segment = self.active_segment
+            segment.append(buffers, headers)
+        return base_offset, segment
+
+    def read(self, fetch_offset: int, max_bytes: int) -> Optional[FileRegion]:
+        with self.lock:
+            segments = list(self.segments)
+            # sizes only move forward, so anything up to these snapshots is fully written
+            sizes = [x.size for x in segments]
+            next_offset = self.next_offset
+        if fetch_offset >= next_offset:
+            return None
+        first = max(bisect.bisect_right(segments, fetch_offset, key=lambda x: x.base_offset) - 1, 0)
+        for segment, size in zip(segments[first:], sizes[first:]):
+            position = segment.find(fetch_offset, size)
+            if position is not None:
+                return segment.region(position, size, max_bytes)
+        return None
+
+    def sync(self) -> None:
+        if self.shared:
+            with self.lock, self._process_lock(fcntl.LOCK_SH):
+                self._catch_up()
+
+    def offset_for_timestamp(self, timestamp: int) -> Optional[tuple[int, int]]:
+        # (offset, timestamp) of the first batch whose max timestamp is at least timestamp
+        with self.lock:
+            segments = list(self.segments)
+            sizes = [x.size for x in segments]
+        for segment, size in zip(segments, sizes):
+            if segment.max_timestamp < timestamp:
+                continue
+            header = segment.find_timestamp(timestamp, size)
+            if header is not None:
+                return header.base_offset, header.max_timestamp
+        return None
+
+    def max_timestamp(self) -> tuple[int, int]:
+        with self.lock:
+            segments = list(self.segments)
+        best = max(segments, key=lambda x: x.max_timestamp)
+        return best.max_timestamp_offset, best.max_timestamp
+
+    def close(self) -> None:
+        with self.lock:
+            for segment in self.segments:
+                segment.close()
+
+    @contextlib.contextmanager
+    def _process_lock(self, operation: int):
+        if not self.shared:
+            yield
+            return
+        fcntl.flock(self.directory_fd, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.directory_fd, fcntl.LOCK_UN)
+
+    def _catch_up(self) -> None:
+        if not self.shared:
+            return
+        mtime = os.fstat(self.directory_fd).st_mtime_ns
+        rolled = False
+        if mtime != self.directory_mtime:
+            # a new file in the directory means another worker may have rolled the segment
+            self.directory_mtime = mtime
+            base_offsets = sorted(int(x.stem) for x in self.directory.glob(f"*{LOG_SUFFIX}"))
+            for base_offset in base_offsets:
+                if base_offset > self.active_segment.base_offset:
+                    self.active_segment.catch_up(self.next_offset)
+                    self.segments.append(self._segment(base_offset))
+                    self.next_offset = self.active_segment.recover()
+                    rolled = True
+        active = self.active_segment
+        if not rolled and os.fstat(active.fd).st_size != active.size:
+            self.next_offset = active.catch_up(self.next_offset)
+
+    def _segment(self, base_offset: int) -> LogSegment:
+        return LogSegment(self._path(base_offset), base_offset, self.index_interval_bytes, self.max_index_bytes)
+
+    def _path(self, base_offset: int) -> pathlib.Path:
+        return self.directory / (segment_name(base_offset) + LOG_SUFFIX)
+
+
+class LogManager:
+
+    def __init__(self, log_dir: pathlib.Path, segment_bytes: int = DEFAULT_SEGMENT_BYTES, linger_ms: int = 0,
+                 index_interval_bytes: int = DEFAULT_INDEX_INTERVAL_BYTES,
+                 max_index_bytes: int = DEFAULT_MAX_INDEX_BYTES, shared: bool = False,
+                 verifier: Optional[CrcVerifier] = None):
+        self.log_dir = log_dir
+        self.segment_bytes = segment_bytes
+        self.index_interval_bytes = index_interval_bytes
+        self.max_index_bytes = max_index_bytes
+        self.shared = shared
+        self.verifier = verifier
+        self.committer = GroupCommitter(linger_ms)
+        # fetches waiting for data and acks=all produces waiting for fsync, both keyed by (topic, partition)
+        self.fetch_purgatory = DelayedOperationPurgatory("fetch")
+        self.produce_purgatory = DelayedOperationPurgatory("produce")
+        self.committer.listeners.append(self._committed)
+        self.lock = threading.Lock()
+        self.logs: dict[tuple[str, int], PartitionLog] = {}
+
+    def get(self, topic_name: str, partition_id: int) -> PartitionLog:
+        key = (topic_name, partition_id)
+        log = self.logs.get(key)
+        if log is None:
+            with self.lock:
+                log = self.logs.get(key)
+                if log is None:
+                    log = PartitionLog(self.log_dir / f"{topic_name}-{partition_id}", self.segment_bytes,
+                                       self.index_interval_bytes, self.max_index_bytes, self.shared, self.verifier)
+                    self.logs[key] = log
+                    return log
+        log.sync()
+        return log
+
+    def _committed(self, keys: set[tuple[str, int]]) -> None:
+        for key in keys:
+            self.produce_purgatory.check_and_complete(key)
+
+
+_managers: dict[pathlib.Path, LogManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_log_manager(server_args: ServerArguments) -> LogManager:
+    with _managers_lock:
+        if server_args.log_dir not in _managers:
+            _managers[server_args.log_dir] = LogManager(
+                server_args.log_dir, server_args.int_property("log.segment.bytes", DEFAULT_SEGMENT_BYTES),
+                server_args.int_property("log.group.commit.linger.ms", 0),
+                server_args.int_property("log.index.interval.bytes", DEFAULT_INDEX_INTERVAL_BYTES),
+                server_args.int_property("log.index.size.max.bytes", DEFAULT_MAX_INDEX_BYTES),
+                server_args.workers > 1, get_verifier(server_args))
+        return _managers[server_args.log_dir]
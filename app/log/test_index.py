@@ -0,0 +1,48 @@
+import pathlib
+import tempfile
+from unittest import TestCase
+
+import index
+
+
+class TestSparseIndex(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.dir.name) / "00000000000000000000.index"
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_lookup_finds_the_last_entry_at_or_below(self):
+        offsets = index.OffsetIndex(self.path)
+        for relative_offset, position in ((3, 100), (7, 4200), (12, 8400)):
+            offsets.append(relative_offset, position)
+        self.assertIsNone(offsets.lookup(2))
+        self.assertEqual((3, 100), offsets.lookup(3))
+        self.assertEqual((7, 4200), offsets.lookup(11))
+        self.assertEqual((12, 8400), offsets.lookup(1000))
+        offsets.close()
+
+    def test_preallocated_tail_is_ignored_and_trimmed(self):
+        offsets = index.OffsetIndex(self.path, max_bytes=80)
+        offsets.append(1, 10)
+        offsets.append(2, 20)
+        offsets.flush()
+        self.assertEqual(80, self.path.stat().st_size)
+
+        # reopening without a clean close sees the zero tail
+        reopened = index.OffsetIndex(self.path, max_bytes=80)
+        self.assertEqual(2, reopened.entries)
+        reopened.close()
+        offsets.close()
+        self.assertEqual(16, self.path.stat().st_size)
+
+    def test_bad_files_are_reported(self):
+        self.path.write_bytes(b"\x00" * 7)
+        with self.assertRaises(index.CorruptIndexError):
+            index.OffsetIndex(self.path)
+        self.path.write_bytes(bytes.fromhex("0000000500000010" "0000000300000020"))
+        offsets = index.OffsetIndex(self.path)
+        with self.assertRaises(index.CorruptIndexError):
+            offsets.check(1000)
+        offsets.close()
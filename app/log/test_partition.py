@@ -0,0 +1,223 @@
+import os
+import pathlib
+import tempfile
+from unittest import TestCase
+
+import batches
+import crc
+import partition
+from app.metadata.metadata import BATCH_HEADER
+from app.protocol import compression
+from group_commit import GroupCommitter
+
+
+class TestPartitionLog(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.dir.name) / "topic-0"
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def append(self, log: partition.PartitionLog, count: int, timestamp: int = 0) -> int:
+        records = batches.build_record_batch([(None, b"value-%d" % i) for i in range(count)], timestamp)
+        base_offset, _ = log.append(records, batches.read_batch_headers(records))
+        return base_offset
+
+    def test_offsets_are_assigned_and_recovered(self):
+        log = partition.PartitionLog(self.path)
+        self.assertEqual(0, self.append(log, 3))
+        self.assertEqual(3, self.append(log, 2))
+        self.assertEqual(5, log.next_offset)
+
+        with open(log.active_segment.path, 'ab') as out_file:
+            out_file.write(b"\x00" * 20)
+        reopened = partition.PartitionLog(self.path)
+        self.assertEqual(5, reopened.next_offset)
+        self.assertEqual(log.active_segment.size, reopened.active_segment.size)
+        self.assertEqual(5, self.append(reopened, 1))
+
+        stored = log.active_segment.path.read_bytes()
+        self.assertEqual([0, 3, 5], [x.base_offset for x in batches.read_batch_headers(stored)])
+
+    def test_read_returns_whole_batches_from_the_requested_offset(self):
+        log = partition.PartitionLog(self.path, segment_bytes=200)
+        for _ in range(4):
+            self.append(log, 2)
+        self.assertIsNone(log.read(8, 1000))
+
+        self.assertEqual([0, 4], [x.base_offset for x in log.segments])
+        region = log.read(3, 1000)
+        stored = log.segments[0].path.read_bytes()
+        self.assertIs(log.segments[0].file, region.file)
+        sent = stored[region.offset: region.offset + region.count]
+        self.assertEqual([2], [x.base_offset for x in batches.read_batch_headers(sent)])
+
+        region = log.read(5, 1000)
+        self.assertIs(log.segments[1].file, region.file)
+        self.assertEqual(0, region.offset)
+
+        region = log.read(0, 1)
+        first_batch = batches.read_batch_headers(log.segments[0].path.read_bytes())[0]
+        self.assertEqual((0, first_batch.size), (region.offset, region.count))
+
+    def test_segments_roll(self):
+        log = partition.PartitionLog(self.path, segment_bytes=100)
+        for _ in range(3):
+            self.append(log, 2)
+        self.assertEqual([0, 2, 4], [x.base_offset for x in log.segments])
+        self.assertEqual([0, 2, 4], [x.base_offset for x in partition.PartitionLog(self.path, 100).segments])
+
+    def test_indexes_are_sparse_and_rebuilt(self):
+        log = partition.PartitionLog(self.path, index_interval_bytes=100)
+        for i in range(10):
+            self.append(log, 2, timestamp=1000 + i * 10)
+        segment = log.active_segment
+        self.assertEqual(4, segment.offset_index.entries)
+        stored = batches.read_batch_headers(segment.path.read_bytes())
+        for relative_offset, position in (segment.offset_index.entry_at(i) for i in range(4)):
+            self.assertEqual(relative_offset, next(x.base_offset for x in stored if x.position == position))
+        self.assertEqual(stored[7].position, segment.find(15, segment.size))
+        self.assertEqual((6, 1030), log.offset_for_timestamp(1025))
+        self.assertEqual((18, 1090), log.max_timestamp())
+        self.assertIsNone(log.offset_for_timestamp(2000))
+        log.close()
+
+        offset_entries = segment.path.with_suffix(".index").read_bytes()
+        segment.path.with_suffix(".index").write_bytes(offset_entries[8:] + offset_entries[:8])
+        segment.path.with_suffix(".timeindex").unlink()
+        reopened = partition.PartitionLog(self.path, index_interval_bytes=100)
+        self.assertEqual(20, reopened.next_offset)
+        self.assertEqual(offset_entries, reopened.active_segment.offset_index.map[:len(offset_entries)])
+        self.assertEqual((6, 1030), reopened.offset_for_timestamp(1025))
+        reopened.close()
+
+    def test_recovery_stops_at_a_corrupt_batch(self):
+        log = partition.PartitionLog(self.path)
+        for _ in range(3):
+            self.append(log, 2)
+        size = log.active_segment.size
+        log.close()
+        with open(self.path / "00000000000000000000.log", 'r+b') as out_file:
+            out_file.seek(size - 1)
+            out_file.write(b"\xff")
+        self.assertEqual(6, partition.PartitionLog(self.path).next_offset)
+        verified = partition.PartitionLog(self.path, verifier=crc.CrcVerifier(crc.CrcMode.ON_LOAD))
+        self.assertEqual(4, verified.next_offset)
+        self.assertEqual(self.append(verified, 1), 4)
+        verified.close()
+
+    def test_shared_logs_follow_each_other(self):
+        first = partition.PartitionLog(self.path, segment_bytes=300, index_interval_bytes=100, shared=True)
+        second = partition.PartitionLog(self.path, segment_bytes=300, index_interval_bytes=100, shared=True)
+        for i in range(4):
+            self.assertEqual(4 * i, self.append(first, 2, timestamp=100 + i))
+            self.assertEqual(4 * i + 2, self.append(second, 2, timestamp=200 + i))
+        first.sync()
+        self.assertEqual(16, first.next_offset)
+        self.assertEqual([x.base_offset for x in second.segments], [x.base_offset for x in first.segments])
+        self.assertEqual((14, 203), first.max_timestamp())
+        stored = b"".join(x.path.read_bytes() for x in first.segments)
+        self.assertEqual(list(range(0, 16, 2)), [x.base_offset for x in batches.read_batch_headers(stored)])
+        region = first.read(10, 1000)
+        sent = os.pread(region.file.fileno(), region.count, region.offset)
+        self.assertEqual(10, batches.read_batch_headers(sent)[0].base_offset)
+        first.close()
+        second.close()
+
+    def test_rejects_malformed_batches(self):
+        records = batches.build_record_batch([(None, b"x")])
+        with self.assertRaises(batches.InvalidRecordError):
+            batches.read_batch_headers(records[:-1])
+        with self.assertRaises(batches.InvalidRecordError):
+            batches.read_batch_headers(records[:16] + b"\x01" + records[17:])
+
+
+class TestCompressedBatches(TestCase):
+    def test_gzip_batches_are_validated_and_recompressed(self):
+        values = [(None, b"value-%d" % i * 20) for i in range(50)]
+        plain = batches.build_record_batch(values)
+        packed = batches.build_record_batch(values, codec=compression.GZIP)
+        self.assertLess(len(packed), len(plain) // 4)
+        header = batches.read_batch_headers(packed)[0]
+        self.assertEqual(compression.GZIP, header.codec)
+        batches.validate_compressed(packed, [header])
+        self.assertEqual(bytes(plain[BATCH_HEADER.size:]), bytes(batches.records_of(packed, header)))
+        self.assertEqual(plain, batches.recompress(packed, [header], compression.NO_COMPRESSION))
+        self.assertIs(packed, batches.recompress(packed, [header], compression.GZIP))
+
+        header.records_count += 1
+        with self.assertRaises(batches.InvalidRecordError):
+            batches.validate_compressed(packed, [header])
+        corrupted = packed[:-10] + b"\x00" * 10
+        with self.assertRaises(batches.InvalidRecordError):
+            batches.validate_compressed(corrupted, batches.read_batch_headers(corrupted))
+        unknown = bytearray(plain)
+        unknown[batches.ATTRIBUTES_START + 1] |= 0x07
+        with self.assertRaises(compression.UnsupportedCodecError):
+            batches.records_of(unknown, batches.read_batch_headers(unknown)[0])
+
+    def test_crc_covers_attributes_to_end(self):
+        data = bytes(range(256)) * 5 + b"tail"
+        for implementation in (crc.crc32c, crc.crc32c_sliced, crc.crc32c_bytewise):
+            self.assertEqual(0xE3069283, implementation(b"123456789"))
+            self.assertEqual(crc.crc32c_bytewise(data), implementation(data))
+        batch = batches.build_record_batch([(b"k", b"v")], codec=compression.GZIP)
+        header = batches.read_batch_headers(batch)[0]
+        self.assertEqual(crc.crc32c(batch[crc.ATTRIBUTES_START:]), header.crc)
+
+    def test_verification_modes(self):
+        good = batches.build_record_batch([(b"k", b"v")])
+        bad = good[:-1] + b"\xff"
+        records = good + bad
+        headers = batches.read_batch_headers(records)
+        spans = [(x.position, x.end) for x in headers]
+        self.assertEqual([len(good)], crc.CrcVerifier(crc.CrcMode.ALWAYS).verify_batches(records, spans, False))
+        self.assertEqual([], crc.CrcVerifier(crc.CrcMode.ON_LOAD).verify_batches(records, spans, False))
+        self.assertEqual([len(good)], crc.CrcVerifier(crc.CrcMode.ON_LOAD).verify_batches(records, spans, True))
+        self.assertEqual([], crc.CrcVerifier(crc.CrcMode.SAMPLED, 0.0).verify_batches(records, spans, True))
+        self.assertEqual([], crc.CrcVerifier(crc.CrcMode.OFF).verify_batches(records, spans, True))
+        verifier = crc.CrcVerifier(crc.CrcMode.ALWAYS)
+        with self.assertRaises(batches.InvalidRecordError):
+            batches.verify_crcs(records, headers, verifier)
+        self.assertEqual(len(records), verifier.stats()["bytes"])
+        self.assertEqual(1, verifier.stats()["failures"])
+
+
+class TestGroupCommitter(TestCase):
+    def test_waiters_are_released_by_one_fsync(self):
+        synced = []
+
+        class Target:
+            def fsync(self):
+                synced.append(self)
+
+        target = Target()
+        committer = GroupCommitter(linger_ms=20)
+        tickets = [committer.request(target) for _ in range(5)]
+        self.assertTrue(committer.wait(tickets[-1], timeout=5))
+        self.assertTrue(all(committer.wait(x, timeout=0) for x in tickets))
+        self.assertEqual([target], synced)
+
+    def test_failed_fsync_fails_its_waiters_and_commits_go_on(self):
+        class Target:
+            def __init__(self, broken: bool):
+                self.broken = broken
+
+            def fsync(self):
+                if self.broken:
+                    raise OSError(5, "Input/output error")
+
+        committer = GroupCommitter()
+        committed = []
+        committer.listeners.append(committed.append)
+        broken, healthy = Target(True), Target(False)
+        with self.assertLogs("group_commit", "ERROR"):
+            first = committer.request(broken, ("broken", 0))
+            self.assertTrue(committer.wait(first, timeout=5))
+        self.assertTrue(committer.failed(("broken", 0), first))
+        later = committer.request(healthy, ("healthy", 0))
+        self.assertTrue(committer.wait(later, timeout=5))
+        self.assertFalse(committer.failed(("healthy", 0), later))
+        self.assertTrue(committer.thread.is_alive())
+        self.assertEqual([{("broken", 0)}, {("healthy", 0)}], committed)
@@ -1,243 +1,183 @@
+import asyncio
+import logging
 import socket  # noqa: F401
+import struct
 import sys
 import threading
-import uuid
-from dataclasses import dataclass
-import pathlib
+import time
+from concurrent.futures import Future
 from enum import Enum
-from typing import Callable, Self
-from app.metadata import metadata
-from app.metadata.metadata import get_topic_stuff
-from app.server import ENCODING
-from app.server.server_args import ServerArguments
-
-API_VERSION_MIN_VERSION = 0
-API_VERSION_MAX_VERSION = 4
-API_VERSION = 18
-
-THROTTLE_TIME_MS = 4
-
-TAG_BUFFER = b"\x00"
-
-
-@dataclass
-class KafkaRequestHeader:
-    message_size: int
-    request_api_key: int
-    request_api_version: int
-    correlation_id: int
-    payload: bytes
-    raw_msg: bytes
-
-    @classmethod
-    def of(cls, msg: bytes) -> Self:
-        message_size = int.from_bytes(msg[0:4], "big")
-        request_api_key = int.from_bytes(msg[4:6], "big")
-        request_api_version = int.from_bytes(msg[6:8], "big")
-        correlation_id = int.from_bytes(msg[8:12], "big")
-        payload = msg[12:]
-
-
-        return KafkaRequestHeader(message_size, request_api_key, request_api_version, correlation_id, payload, msg)
-
-
-@dataclass
-class DescribeTopicPartition:
-    topic_id: uuid
-    partition: None
-    partitions_array_length: int
-    response_partition_limit: int
-    topic_names: list[str]
-    cursor: int
-    error_code: int
-    is_internal: bool = False
-
-    operations_allowed = int(0x00000df8).to_bytes(4)
-
-    @classmethod
-    def from_bytes(cls, stuff: bytes, server_args: ServerArguments):
-        metadata_log = metadata.read_partition(server_args)
-        length_raw = stuff[0:2] # 12-14
-        length = int.from_bytes(length_raw, "big", signed=False)
-        client_id = stuff[2: 2 + length].decode(ENCODING)
-        index = 2 + length
-        array_length = int.from_bytes(stuff[index:index+2], signed=False) -1
-        topics = []
-        index = index + 2
-        print(f"{length=}, {array_length=}")
-        cursor = 0
-        response_partition_limit = 0
-        for i in range(array_length):
-            topic_length = int.from_bytes(stuff[index: index + 1], signed=False) -1
-            index = index + 1
-            topic_name = stuff[index: index + topic_length].decode(ENCODING)
-            index = index + topic_length
-            topics.append(topic_name)
-            num_partitions_limit = int.from_bytes(stuff[index: index + 4])
-            index = index + 4
-
-            cursor = int.from_bytes(stuff[index:index+1], signed=False)
-            index = index + 1
-
-            response_partition_limit_raw = stuff[index: index + 4]
-            response_partition_limit = int.from_bytes(response_partition_limit_raw)
-            index += 4
-        topic_records = get_topic_stuff(metadata_log, topics)
-        error_code = 0 if topic_records else 3
-
-
-
-        topic_id: uuid = uuid.UUID('00000000-0000-0000-0000-000000000000') if not topic_records else topic_records[0].topic_uuid
-        return DescribeTopicPartition(topic_id, None, array_length, response_partition_limit, topics, cursor, error_code)
-
-    def serialize(self, request: KafkaRequestHeader) -> bytes:
-        buf = "".encode(ENCODING)
-        buf += request.correlation_id.to_bytes(4, byteorder="big", signed=False)
-        buf += TAG_BUFFER
-        buf += (0).to_bytes(4, byteorder="big", signed=False)
-        buf += (len(self.topic_names) + 1).to_bytes(1, byteorder="big", signed=False)
-        buf += (self.error_code).to_bytes(2, byteorder="big", signed=False)
-
-
-        print(f"{self.topic_names=}")
-
-        topic = self.topic_names[0]
-        print(f"{topic=}, reported topic length={len(topic.encode(ENCODING)) + 1}")
-        length = int(len(topic.encode(ENCODING)) + 1).to_bytes()
-        buf = buf + length
-        buf = buf + topic.encode(ENCODING)
-        buf = buf + int(self.topic_id).to_bytes(16, byteorder="big", signed=False)
-        is_internal_msg = int(0).to_bytes(1)
-        buf = buf + is_internal_msg
-        buf = buf + self.partitions_array_length.to_bytes(1)
-        buf = buf + self.operations_allowed   #
-        buf = buf +  TAG_BUFFER #
-        print(len(buf.hex()))
-        print(f"{self.cursor=}")
-        buf = buf + (255).to_bytes(1, byteorder="big", signed=False)
-        buf = buf + TAG_BUFFER
-        return  buf
-
-
-
-
-
-
+from functools import partial
+from typing import Callable, Optional
+from app.api.describe_topic_partitions import handle_describe_topic_partitions
+from app.api.fetch import handle_fetch
+from app.api.list_offsets import handle_list_offsets
+from app.api.metadata import handle_metadata
+from app.api.produce import handle_produce
+from app.protocol import codec
+from app.protocol.request import KafkaRequestHeader, KafkaResponse
+from app.protocol.writer import ResponseBody, ResponseWriter, SIZE_PREFIX_LENGTH
+from app.server import HOST, PORT, async_server, logs, metrics, quotas, socket_server, workers
+from app.server.framing import FrameReader
+from app.server.server_args import ServerArguments, ServerMode
+from app.server.transport import send_response
 
+API_VERSION = 18
+API_VERSIONS_RESPONSE = codec.RESPONSES[API_VERSION]
 
+CORRELATION_ID = struct.Struct(">I")
+THROTTLE_TIME_MS = struct.Struct(">i")
 
-@dataclass()
-class KafkaResponse:
-    error_code: int
-    body: bytes
+# under app so the handler set up by app.server.logs applies when this runs as __main__
+logger = logging.getLogger("app.main")
 
 
 def handle_api_version(request: KafkaRequestHeader, server_args: ServerArguments) -> KafkaResponse:
-    api_key = ApiKeys.get_Version(request.request_api_key)
-    error_bytes = get_version_error_number(request, api_key).to_bytes(2, "big", signed=False)
-
-    message_bytes = request.correlation_id.to_bytes(4, byteorder="big", signed=False)
-    message_bytes += error_bytes
-    if api_key.key != 75:
-        message_bytes += int(3).to_bytes(1, byteorder="big", signed=False)
-        for key in ApiKeys:
-            message_bytes += key.key.to_bytes(2, byteorder="big", signed=False)
-            message_bytes += key.min_version.to_bytes(2, byteorder="big", signed=False)
-            message_bytes += key.max_version.to_bytes(2, byteorder="big", signed=False)
-            message_bytes += TAG_BUFFER
-
-    message_bytes += THROTTLE_TIME_MS.to_bytes(4, byteorder="big", signed=False)
-
-    message_bytes += TAG_BUFFER
+    version = request.request_api_version if request.request_api_version in API_VERSIONS_TEMPLATES \
+        else UNSUPPORTED_VERSION
+    message_bytes = bytearray(API_VERSIONS_TEMPLATES[version])
+    CORRELATION_ID.pack_into(message_bytes, SIZE_PREFIX_LENGTH, request.correlation_id)
+    if request.throttle_time_ms and version >= 1:
+        # v1+ end with the throttle time, followed only by the empty tagged fields of the flexible versions
+        offset = len(message_bytes) - THROTTLE_TIME_MS.size - API_VERSIONS_RESPONSE.flexible(version)
+        THROTTLE_TIME_MS.pack_into(message_bytes, offset, request.throttle_time_ms)
     return KafkaResponse(0, message_bytes)
 
-def compare_byteroos(a: bytes, b: bytes):
-    if len(a.hex()) != len(b.hex()):
-        print(f"lengths differ: {len(a.hex())} to {len(b.hex())}")
-
-    for (i, pair) in enumerate(zip(a.hex(),b.hex())):
-        if pair[0] != pair[1]:
-            print(f'pos {i}: {pair[0]}, {pair[1]}')
-
-
-
-
-def handle_describe_topic_partition(request: KafkaRequestHeader, server_args: ServerArguments):
-    lolzers = DescribeTopicPartition.from_bytes(request.payload, server_args)
-    response_header = request.correlation_id.to_bytes(4, byteorder="big", signed=False)
-
-    return KafkaResponse(3, lolzers.serialize(request))
-
 
+def build_api_versions_body(version: int, error_code: int) -> bytes:
+    # correlation id placeholder first, the response header has no tagged fields in any version
+    api_version = API_VERSIONS_RESPONSE.structs["ApiVersion"]
+    response = API_VERSIONS_RESPONSE.struct(error_code, [api_version(key.key, key.min_version, key.max_version)
+                                                         for key in ApiKeys], 0)
+    writer = ResponseWriter()
+    writer.header(0, flexible=False)
+    return bytes(API_VERSIONS_RESPONSE.encode_body(writer, version, response).finish())
 
 
+def build_api_versions_templates() -> dict[int, bytes]:
+    api_key = ApiKeys.API_VERSION_REQUEST
+    templates = {version: build_api_versions_body(version, 0)
+                 for version in range(api_key.min_version, api_key.max_version + 1)}
+    # clients that ask for a version we do not know get a v0 body they are guaranteed to parse
+    templates[UNSUPPORTED_VERSION] = build_api_versions_body(0, 35)
+    return templates
 
 
 class ApiKeys(Enum):
     handler: Callable[[KafkaRequestHeader, ServerArguments], KafkaResponse]
-    API_VERSION_REQUEST = 18, 0, 4, handle_api_version
-    DESCRIBE_TOPIC_PARTITIONS = 75, 0, 0, handle_describe_topic_partition
+    # the supported versions are the ones the request schema lists
+    PRODUCE = 0, handle_produce
+    FETCH = 1, handle_fetch
+    LIST_OFFSETS = 2, handle_list_offsets
+    METADATA = 3, handle_metadata
+    API_VERSION_REQUEST = 18, handle_api_version
+    DESCRIBE_TOPIC_PARTITIONS = 75, handle_describe_topic_partitions
 
     def __new__(cls, *args, **kwds):
         obj = object.__new__(cls)
         obj._value_ = args[0]
         return obj
 
-    def __init__(self, key: int, min_version: int, max_version: int, handler: Callable[[KafkaRequestHeader,
-                                                                                        ServerArguments], KafkaResponse]):
+    def __init__(self, key: int, handler: Callable[[KafkaRequestHeader, ServerArguments], KafkaResponse]):
+        versions = codec.REQUESTS[key].versions
         self.key: int = key
-        self.min_version: int = min_version
-        self.max_version: int = max_version
+        self.min_version: int = versions.low
+        self.max_version: int = versions.high
         self.handler = handler
 
-    @staticmethod
-    def get_Version(request_key: int):
-        print(f'{request_key=}')
-        return next(x for x in ApiKeys if x.key == request_key)
-
-
-def get_version_error_number(header: KafkaRequestHeader, key: ApiKeys) -> int:
-    if key.min_version <= header.request_api_version <= key.max_version:
-        return 0
-    return 35
-
-
-def handle_request(accepted_socket: socket, server_args: ServerArguments) -> None:
-
 
+UNSUPPORTED_VERSION = -1
+API_VERSIONS_TEMPLATES = build_api_versions_templates()
+# every supported (api key, version) pair, so finding the handler of a request is one lookup
+HANDLERS = {(key.key, version): key for key in ApiKeys for version in range(key.min_version, key.max_version + 1)}
+# everything but ApiVersions reads the logs or the metadata cache, which may stat, re-read or checkpoint
+OFFLOADED_API_KEYS = frozenset(key.key for key in ApiKeys if key.key != API_VERSION)
+metrics.METRICS.api_names.update({key.key: key.name for key in ApiKeys})
 
 
-    while True:
-        msg = accepted_socket.recv(1024)
-        num_api_keys = 2
-        array_size = 1
-        print(msg.hex())
+def record_delayed_response(quota_manager: quotas.QuotaManager, client_id: Optional[str], delayed: Future) -> None:
+    if delayed.exception() is None and delayed.result() is not None:
+        quota_manager.record_response(client_id, metrics.response_size(delayed.result()))
 
 
+def respond(msg: bytes | memoryview, server_args: ServerArguments,
+            received_ns: Optional[int] = None) -> KafkaResponse:
+    started = time.perf_counter_ns()
+    quota_manager = quotas.get_quota_manager(server_args)
+    api_metrics = metrics.METRICS.api(metrics.api_key_of(msg))
+    api_metrics.received(len(msg), None if received_ns is None else started - received_ns)
+    failed = True
+    try:
         header: KafkaRequestHeader = KafkaRequestHeader.of(msg)
-        api_key = ApiKeys.get_Version(header.request_api_key)
+        api_key = HANDLERS.get((header.request_api_key, header.request_api_version))
+        if api_key is None:
+            # only ApiVersions has a reply shape every version can parse, anything else gets disconnected
+            if header.request_api_key != API_VERSION:
+                raise ValueError(f"unsupported version {header.request_api_version} of api key "
+                                 f"{header.request_api_key}")
+            api_key = ApiKeys.API_VERSION_REQUEST
+        if quota_manager is not None:
+            header.throttle_time_ms = quota_manager.record_request(header.client_id, len(msg))
 
         kafka_response = api_key.handler(header, server_args)
+        kafka_response.throttle_time_ms = header.throttle_time_ms
+        failed = False
+    except Exception as e:
+        logger.warning("request with api key %d failed: %r", metrics.api_key_of(msg), e)
+        raise
+    finally:
+        api_metrics.handled(time.perf_counter_ns() - started, failed)
 
+    if quota_manager is not None and kafka_response.delayed is not None:
+        # counted once the purgatory produced it
+        kafka_response.delayed.add_done_callback(partial(record_delayed_response, quota_manager, header.client_id))
+    elif quota_manager is not None and kafka_response.body is not None:
+        quota_manager.record_response(header.client_id, metrics.response_size(kafka_response.body))
+    return kafka_response
 
-        req_len = len(kafka_response.body).to_bytes(4, byteorder="big", signed=False)
-
-        response = req_len + kafka_response.body
 
-        accepted_socket.sendall(response)
-
-
-def main():
+def send_measured(accepted_socket: socket, frame: memoryview, response: ResponseBody) -> None:
+    started = time.perf_counter_ns()
+    send_response(accepted_socket, response)
+    metrics.METRICS.api(metrics.api_key_of(frame)).sent(metrics.response_size(response),
+                                                        time.perf_counter_ns() - started)
 
-    print("Logs from your program will appear here!")
-    properties_path = pathlib.Path(sys.argv[1])
-    server_args = ServerArguments(properties_path)
 
-    # Uncomment this to pass the first stage
+def is_offloaded(msg: bytes | memoryview) -> bool:
+    return int.from_bytes(msg[4:6]) in OFFLOADED_API_KEYS
 
-    #
 
-    server = socket.create_server(("localhost", 9092), reuse_port=True)
+def handle_request(accepted_socket: socket, server_args: ServerArguments) -> None:
+    frame_reader = FrameReader()
+    with accepted_socket:
+        try:
+            while frame_reader.recv_into(accepted_socket):
+                received = time.perf_counter_ns()
+                for frame in frame_reader.frames():
+                    # frames pipelined in one read queue behind each other
+                    response = respond(frame, server_args, received)
+                    # a delayed operation parks this connection's thread until it completes or expires
+                    body = response.body if response.delayed is None else response.delayed.result()
+                    if body is not None:
+                        send_measured(accepted_socket, frame, body)
+                    if response.throttle_time_ms:
+                        # muted: nothing more is read from a throttled client until its throttle time is over
+                        time.sleep(response.throttle_time_ms / 1000)
+        except Exception as e:
+            # failed requests are logged by respond, the connection is dropped either way
+            logger.debug("closing connection: %r", e)
+
+
+def serve(server_args: ServerArguments) -> None:
+    metrics.start_endpoint(server_args)
+    if server_args.mode == ServerMode.ASYNCIO:
+        asyncio.run(async_server.serve(server_args, respond, is_offloaded))
+        return
+    if server_args.mode == ServerMode.POOLED:
+        socket_server.SocketServer(server_args, respond).serve_forever()
+        return
+
+    server = socket.create_server((HOST, PORT), reuse_port=True)
 
     while True:
         accepted_socket, _ = server.accept()
@@ -245,6 +185,18 @@ def main():
         threading.Thread(target=handle_request, args=(accepted_socket, server_args)).start()
 
 
+def main():
+    server_args = ServerArguments.of(sys.argv[1:])
+    logs.configure(server_args)
+    logger.info("serving on %s:%d in %s mode", HOST, PORT, server_args.mode.value)
+
+    if server_args.workers > 1:
+        workers.run_workers(server_args, serve)
+        return
+
+    serve(server_args)
+
+
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+import logging
+import os
+import pathlib
+import threading
+from typing import Optional
+
+from app.log.crc import CrcVerifier, get_verifier
+from app.metadata.checkpoint import Checkpoint, Checkpointer, encode, load_latest
+from app.metadata.mapped import MappedMetaDataLog
+from app.metadata.metadata import ClusterMetaDataLog, DEFAULT_METADATA_LOG
+from app.metadata.snapshot import MetadataSnapshot, SnapshotCache
+from app.server.server_args import ServerArguments
+
+logger = logging.getLogger(__name__)
+
+FileSignature = Optional[tuple[int, int, int]]
+CHECKPOINT_DIR_SUFFIX = ".broker-cache"
+
+
+class MetadataCache:
+
+    def __init__(self, path: pathlib.Path, mapped: bool = False, verifier: Optional[CrcVerifier] = None,
+                 checkpoint_interval_ms: int = -1, checkpoint_dir: Optional[pathlib.Path] = None):
+        self.path = path
+        self.mapped = mapped
+        self.verifier = verifier
+        # never next to the log: that directory belongs to KRaft, this broker only reads it
+        self.checkpointer = Checkpointer(checkpoint_dir, self._encode_checkpoint, checkpoint_interval_ms) \
+            if checkpoint_dir is not None and checkpoint_interval_ms >= 0 else None
+        self.lock = threading.Lock()
+        self.log: Optional[ClusterMetaDataLog | MappedMetaDataLog] = None
+        self.signature: FileSignature = None
+        self.hits = 0
+        self.misses = 0
+        self.tails = 0
+
+    def get(self) -> ClusterMetaDataLog | MappedMetaDataLog:
+        signature = self._signature()
+        with self.lock:
+            if self.log is not None and signature == self.signature:
+                self.hits += 1
+                return self.log
+            if self._can_tail(signature):
+                self.tails += 1
+                self._tail()
+            else:
+                self.misses += 1
+                self.log = self._load(signature)
+            self.signature = signature
+            if self.checkpointer is not None and signature is not None:
+                self.checkpointer.changed()
+            return self.log
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "tails": self.tails}
+
+    def _encode_checkpoint(self, written_offset: int) -> Optional[tuple[int, bytes]]:
+        # runs on the checkpoint thread; tails change the index in place, so only a copy is taken under the lock
+        with self.lock:
+            log = self.log
+            if log is None or self.signature is None or log.next_offset <= written_offset:
+                return None
+            index, next_offset, position = log.index.copy(), log.next_offset, log.parsed_bytes
+        return next_offset, encode(index, next_offset, position)
+
+    def _can_tail(self, signature: FileSignature) -> bool:
+        # the log is append-only, so the same file at least as long as what we parsed only has new batches
+        if self.log is None or signature is None or self.signature is None:
+            return False
+        inode, size, _ = signature
+        return inode == self.signature[0] and size >= self.log.parsed_bytes
+
+    def _tail(self) -> None:
+        if self.mapped:
+            self.log.refresh()
+            return
+        with open(self.path, 'rb') as in_file:
+            in_file.seek(self.log.parsed_bytes)
+            self.log.extend(in_file.read(), self.verifier)
+
+    def _signature(self) -> FileSignature:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _load(self, signature: FileSignature) -> ClusterMetaDataLog | MappedMetaDataLog:
+        if signature is None:
+            return ClusterMetaDataLog.of_bytes(DEFAULT_METADATA_LOG)
+        verified = self.verifier.stats() if self.verifier else None
+        start = self._latest_checkpoint()
+        if self.mapped:
+            log = MappedMetaDataLog(self.path, self.verifier, start)
+        elif start is not None:
+            # only the batches after the checkpoint are replayed
+            log = ClusterMetaDataLog(index=start.index, parsed_bytes=start.position, next_offset=start.next_offset)
+            with open(self.path, 'rb') as in_file:
+                in_file.seek(start.position)
+                log.extend(in_file.read(), self.verifier)
+        else:
+            with open(self.path, 'rb') as in_file:
+                log = ClusterMetaDataLog.of_bytes(in_file.read(), self.verifier)
+        if verified is not None:
+            now = self.verifier.stats()
+            checked = now["bytes"] - verified["bytes"]
+            seconds = now["seconds"] - verified["seconds"]
+            if checked and seconds > 0:
+                logger.info("verified crcs of %d metadata bytes at %.1f MB/s, %d corrupt batches skipped",
+                            checked, checked / seconds / 1e6, log.corrupt_batches)
+            elif checked:
+                # a small log can verify within one tick of the clock
+                logger.info("verified crcs of %d metadata bytes, %d corrupt batches skipped", checked,
+                            log.corrupt_batches)
+        return log
+
+    def _latest_checkpoint(self) -> Optional[Checkpoint]:
+        if self.checkpointer is None:
+            return None
+        start = load_latest(self.checkpointer.directory, self.path)
+        if start is not None:
+            logger.info("starting from the metadata checkpoint at offset %d", start.next_offset)
+            self.checkpointer.loaded(start)
+        return start
+
+
+def checkpoint_interval_ms(server_args: ServerArguments) -> int:
+    # checkpoints are off unless metadata.checkpoint.interval.ms is set
+    return server_args.int_property("metadata.checkpoint.interval.ms", -1)
+
+
+def checkpoint_dir(server_args: ServerArguments) -> pathlib.Path:
+    # outside the log dirs by default, where kafka would take any directory for a partition
+    default = server_args.log_dir.with_name(server_args.log_dir.name + CHECKPOINT_DIR_SUFFIX)
+    return pathlib.Path(server_args.properties.get("metadata.checkpoint.dir", default))
+
+
+_caches: dict[pathlib.Path, MetadataCache | SnapshotCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(server_args: ServerArguments) -> MetadataCache | SnapshotCache:
+    path = server_args.metadata_snapshot_path or server_args.metadata_log_path
+    with _caches_lock:
+        if path not in _caches:
+            if server_args.metadata_snapshot_path is not None:
+                _caches[path] = SnapshotCache(path)
+            else:
+                _caches[path] = MetadataCache(path, server_args.mmap_metadata, get_verifier(server_args),
+                                              checkpoint_interval_ms(server_args), checkpoint_dir(server_args))
+        return _caches[path]
+
+
+def read_partition(server_args: ServerArguments) -> ClusterMetaDataLog | MappedMetaDataLog | MetadataSnapshot:
+    return get_cache(server_args).get()
@@ -0,0 +1,223 @@
+import logging
+import os
+import pathlib
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import app.server
+from app.metadata.metadata import BATCH_OFFSETS, STORE_COLUMNS, PartitionStore, TopicIndex, _Parser
+
+logger = logging.getLogger(__name__)
+
+# not KRaft's .checkpoint, so nothing that scans for its snapshots picks these up
+CHECKPOINT_SUFFIX = ".topic-index"
+MAGIC = b"KMCK"
+FORMAT_VERSION = 1
+# magic, format version, next offset, log position
+HEADER = struct.Struct(">4shqq")
+COUNT = struct.Struct(">i")
+NAME_LENGTH = struct.Struct(">H")
+CHECKSUM = struct.Struct(">I")
+RETAINED_CHECKPOINTS = 2
+
+
+class CorruptCheckpointError(ValueError):
+    pass
+
+
+@dataclass
+class Checkpoint:
+    # the materialized topics and partitions as of next_offset, which starts at byte position of the log
+    index: TopicIndex
+    next_offset: int
+    position: int
+
+
+def _big_endian(column: array) -> bytes:
+    if sys.byteorder == "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_big_endian(typecode: str, data: bytes | memoryview) -> array:
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == "little":
+        column.byteswap()
+    return column
+
+
+def encode(index: TopicIndex, next_offset: int, position: int) -> bytes:
+    out = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, next_offset, position))
+    out += COUNT.pack(len(index.name_to_id))
+    for name, topic_id in index.name_to_id.items():
+        encoded = name.encode(app.server.ENCODING)
+        out += topic_id.bytes + NAME_LENGTH.pack(len(encoded)) + encoded
+    store = index.store
+    out += COUNT.pack(len(store.topic_ids))
+    for topic_id, rows in zip(store.topic_ids, store.topic_rows):
+        out += topic_id + COUNT.pack(len(rows)) + _big_endian(rows)
+    # the columns in STORE_COLUMNS order, then directories
+    for name in STORE_COLUMNS:
+        data = _big_endian(getattr(store, name))
+        out += COUNT.pack(len(data)) + data
+    out += COUNT.pack(len(store.directories)) + store.directories
+    out += CHECKSUM.pack(zlib.crc32(out))
+    return bytes(out)
+
+
+def decode(buffer: bytes | memoryview) -> Checkpoint:
+    buffer = memoryview(buffer)
+    if len(buffer) < HEADER.size + CHECKSUM.size:
+        raise CorruptCheckpointError(f"checkpoint of {len(buffer)} bytes is too short")
+    (checksum,) = CHECKSUM.unpack_from(buffer, len(buffer) - CHECKSUM.size)
+    if zlib.crc32(buffer[:-CHECKSUM.size]) != checksum:
+        raise CorruptCheckpointError("checkpoint checksum does not match")
+    magic, version, next_offset, position = HEADER.unpack_from(buffer)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise CorruptCheckpointError(f"not a version {FORMAT_VERSION} checkpoint")
+    parser = _Parser(buffer)
+    parser.index = HEADER.size
+    index = TopicIndex()
+    for _ in range(parser.read(4, signed=True)):
+        topic_id = parser.parse_uuid()
+        name = parser.read_string(parser.read(2))
+        index.name_to_id[name] = topic_id
+        index.id_to_name[topic_id] = name
+    store = index.store = PartitionStore()
+    for number in range(parser.read(4, signed=True)):
+        topic_id = bytes(buffer[parser.index: parser.index + 16])
+        parser.index += 16
+        length = 4 * parser.read(4, signed=True)
+        store.topic_ids.append(topic_id)
+        store.topic_numbers[topic_id] = number
+        store.topic_rows.append(_from_big_endian("i", buffer[parser.index: parser.index + length]))
+        parser.index += length
+    for name in STORE_COLUMNS:
+        length = parser.read(4, signed=True)
+        setattr(store, name, _from_big_endian(getattr(store, name).typecode,
+                                              buffer[parser.index: parser.index + length]))
+        parser.index += length
+    length = parser.read(4, signed=True)
+    store.directories = bytearray(buffer[parser.index: parser.index + length])
+    return Checkpoint(index, next_offset, position)
+
+
+def checkpoint_path(directory: pathlib.Path, next_offset: int) -> pathlib.Path:
+    # named after the offset they reach
+    return directory / f"{next_offset:020d}{CHECKPOINT_SUFFIX}"
+
+
+def list_checkpoints(directory: pathlib.Path) -> list[pathlib.Path]:
+    # newest first
+    try:
+        names = [x for x in os.listdir(directory)
+                 if x.endswith(CHECKPOINT_SUFFIX) and x[:-len(CHECKPOINT_SUFFIX)].isdigit()]
+    except FileNotFoundError:
+        return []
+    return [directory / x for x in sorted(names, reverse=True)]
+
+
+def write_checkpoint(directory: pathlib.Path, index: TopicIndex, next_offset: int, position: int) -> pathlib.Path:
+    return write_encoded(directory, next_offset, encode(index, next_offset, position))
+
+
+def write_encoded(directory: pathlib.Path, next_offset: int, encoded: bytes) -> pathlib.Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    path = checkpoint_path(directory, next_offset)
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, 'wb') as out_file:
+        out_file.write(encoded)
+        out_file.flush()
+        os.fsync(out_file.fileno())
+    os.replace(temporary, path)
+    for old in list_checkpoints(directory)[RETAINED_CHECKPOINTS:]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def starts_batch(log_path: pathlib.Path, checkpoint: Checkpoint) -> bool:
+    # the log must still hold the batch the checkpoint stops before, or end exactly there
+    with open(log_path, 'rb') as in_file:
+        size = os.fstat(in_file.fileno()).st_size
+        if checkpoint.position == size:
+            return True
+        header = os.pread(in_file.fileno(), BATCH_OFFSETS.size, checkpoint.position)
+    if len(header) < BATCH_OFFSETS.size:
+        return False
+    base_offset, _ = BATCH_OFFSETS.unpack(header)
+    return base_offset == checkpoint.next_offset
+
+
+def load_latest(directory: pathlib.Path, log_path: pathlib.Path) -> Optional[Checkpoint]:
+    for path in list_checkpoints(directory):
+        try:
+            checkpoint = decode(path.read_bytes())
+            if starts_batch(log_path, checkpoint):
+                return checkpoint
+            logger.warning("%s does not line up with %s, trying an older checkpoint", path, log_path)
+        except (OSError, CorruptCheckpointError) as e:
+            logger.warning("skipping checkpoint %s: %s", path, e)
+    return None
+
+
+# given the offset the last checkpoint reached, (next offset, encoded checkpoint) of anything newer
+EncodeLatest = Callable[[int], Optional[tuple[int, bytes]]]
+
+
+class Checkpointer:
+    # writes from its own thread, so requests never wait on the file; only encoding needs a consistent index
+
+    def __init__(self, directory: pathlib.Path, encode_latest: EncodeLatest, interval_ms: int):
+        self.directory = directory
+        self.encode_latest = encode_latest
+        self.interval_ms = interval_ms
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.written_offset = -1
+        self.written_at = float("-inf")
+        self.thread = threading.Thread(target=self._run, name="metadata-checkpoint", daemon=True)
+        self.thread.start()
+
+    def loaded(self, checkpoint: Checkpoint) -> None:
+        self.written_offset = checkpoint.next_offset
+        self.written_at = time.monotonic()
+
+    def changed(self) -> None:
+        self.wakeup.set()
+
+    def maybe_write(self) -> bool:
+        # the first write happens right away, so a broker that just replayed the whole log checkpoints it
+        with self.lock:
+            if time.monotonic() - self.written_at < self.interval_ms / 1000:
+                return False
+            latest = self.encode_latest(self.written_offset)
+            if latest is None:
+                return False
+            next_offset, encoded = latest
+            # a failed write waits out the interval as well instead of being retried on every change
+            self.written_at = time.monotonic()
+            try:
+                write_encoded(self.directory, next_offset, encoded)
+            except OSError as e:
+                logger.warning("writing a metadata checkpoint to %s failed: %s", self.directory, e)
+                return False
+            self.written_offset = next_offset
+            return True
+
+    def _run(self) -> None:
+        while True:
+            self.wakeup.wait()
+            delay = self.written_at + self.interval_ms / 1000 - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            # changes from here on wake the next round
+            self.wakeup.clear()
+            self.maybe_write()
@@ -0,0 +1,162 @@
+import mmap
+import os
+import pathlib
+import uuid
+from collections.abc import Sequence
+from typing import Iterator, Optional
+
+import app.server
+from app.log.crc import CrcVerifier
+from app.metadata.checkpoint import Checkpoint
+from app.metadata.metadata import (BATCH_LENGTH_END, PARTITION_RECORD_TYPE, TOPIC_RECORD_TYPE, FeatureLevelRecord,
+                                   PartitionRecord, RecordBatch, TopicIndex, TopicRecord, _Parser, next_offset)
+
+# offsets inside a record value: frame_version, type and version come first
+TOPIC_NAME_START = 3
+PARTITION_ID_START = 3
+PARTITION_TOPIC_UUID_START = 7
+
+
+class RecordView:
+    __slots__ = ("value", "_record")
+
+    def __init__(self, value: memoryview):
+        self.value = value
+        self._record: Optional[PartitionRecord | TopicRecord | FeatureLevelRecord] = None
+
+    @property
+    def type(self) -> int:
+        return self.value[1]
+
+    def materialize(self) -> PartitionRecord | TopicRecord | FeatureLevelRecord:
+        if self._record is None:
+            parser = _Parser(self.value)
+            parser.index = 2
+            self._record = parser.parse_record(self.value[0], self.value[1])
+        return self._record
+
+    def __getattr__(self, item):
+        return getattr(self.materialize(), item)
+
+
+class TopicRecordView(RecordView):
+    __slots__ = ()
+
+    @property
+    def name(self) -> memoryview:
+        parser = _Parser(self.value)
+        parser.index = TOPIC_NAME_START
+        name_length = parser.read_zig_zag() - 1
+        return self.value[parser.index: parser.index + name_length]
+
+    @property
+    def topic_name(self) -> str:
+        return str(self.name, app.server.ENCODING)
+
+    @property
+    def topic_uuid(self) -> uuid.UUID:
+        parser = _Parser(self.value)
+        parser.index = TOPIC_NAME_START
+        name_length = parser.read_zig_zag() - 1
+        parser.index += name_length
+        return uuid.UUID(bytes=bytes(self.value[parser.index: parser.index + 16]))
+
+
+class PartitionRecordView(RecordView):
+    __slots__ = ()
+
+    @property
+    def partition_id(self) -> int:
+        return int.from_bytes(self.value[PARTITION_ID_START: PARTITION_ID_START + 4])
+
+    @property
+    def topic_uuid_bytes(self) -> memoryview:
+        return self.value[PARTITION_TOPIC_UUID_START: PARTITION_TOPIC_UUID_START + 16]
+
+    @property
+    def topic_uuid(self) -> uuid.UUID:
+        return uuid.UUID(bytes=bytes(self.topic_uuid_bytes))
+
+
+def view_of(value: memoryview) -> RecordView:
+    if value[1] == TOPIC_RECORD_TYPE:
+        return TopicRecordView(value)
+    if value[1] == PARTITION_RECORD_TYPE:
+        return PartitionRecordView(value)
+    return RecordView(value)
+
+
+class LazyBatches(Sequence):
+
+    def __init__(self, log: "MappedMetaDataLog"):
+        self.log = log
+
+    def __len__(self) -> int:
+        return len(self.log.batch_positions)
+
+    def __getitem__(self, i: int) -> RecordBatch:
+        parser = _Parser(self.log.view)
+        parser.index = self.log.batch_positions[i]
+        return parser.parse_batch()
+
+
+class MappedMetaDataLog:
+
+    def __init__(self, path: pathlib.Path, verifier: Optional[CrcVerifier] = None,
+                 start: Optional[Checkpoint] = None):
+        self.path = path
+        self.verifier = verifier
+        self.view = memoryview(b"")
+        self.batch_positions: list[int] = []
+        # started from a checkpoint, only the batches after it are mapped and applied
+        self.parsed_bytes = start.position if start else 0
+        self.next_offset = start.next_offset if start else 0
+        self.corrupt_batches = 0
+        self.record_batches = LazyBatches(self)
+        self._index: Optional[TopicIndex] = start.index if start else None
+        self.refresh()
+
+    @property
+    def index(self) -> TopicIndex:
+        # building the index is the only step that touches record values, so it waits for the first lookup
+        if self._index is None:
+            self._index = TopicIndex()
+            self._apply(0)
+        return self._index
+
+    def refresh(self) -> None:
+        size = os.path.getsize(self.path)
+        if size == 0 or size == len(self.view):
+            return
+        with open(self.path, 'rb') as in_file:
+            mapped = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+        # views handed out earlier keep the previous mapping alive until they are dropped
+        self.view = memoryview(mapped)
+        first_new = len(self.batch_positions)
+        parser = _Parser(self.view)
+        parser.index = self.parsed_bytes
+        spans = parser.batch_spans()
+        corrupt = set(self.verifier.verify_batches(self.view, spans, loading=True)) if self.verifier else set()
+        for position, end in spans:
+            if position in corrupt:
+                self.corrupt_batches += 1
+            else:
+                self.batch_positions.append(position)
+                self.next_offset = next_offset(self.view, position)
+        self.parsed_bytes = spans[-1][1] if spans else self.parsed_bytes
+        if self._index is not None:
+            self._apply(first_new)
+
+    def record_views(self, batch_number: int) -> Iterator[RecordView]:
+        for value in _Parser.batch_values(self.view, *self._span(batch_number)):
+            yield view_of(value)
+
+    def _apply(self, first_batch: int) -> None:
+        # the index copies what it needs out of the values, so nothing it holds points into the mapping
+        for batch_number in range(first_batch, len(self.batch_positions)):
+            for value in _Parser.batch_values(self.view, *self._span(batch_number)):
+                self._index.apply_value(value)
+
+    def _span(self, batch_number: int) -> tuple[int, int]:
+        start = self.batch_positions[batch_number]
+        return start, start + BATCH_LENGTH_END + int.from_bytes(self.view[start + 8: start + BATCH_LENGTH_END])
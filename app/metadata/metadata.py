@@ -1,20 +1,51 @@
 import binascii
+import bisect
 import datetime
-import os.path
+import struct
 import pathlib
 import uuid
-from collections import defaultdict
-from dataclasses import dataclass
+from array import array
+from collections.abc import Sequence
+from dataclasses import dataclass, field
 from enum import Enum
-from itertools import chain
-from typing import Self, Optional
+from typing import Iterator, Self, Optional
 
 import app.server
-from app.server.server_args import ServerArguments
+from app.log.crc import CrcVerifier
+from app.protocol import compression as compression_codecs
 
 
 MSB_SET_MASK = 0b10000000
 REMOVE_MSB_MASK = 0b01111111
+# base_offset and batch_length precede the batch_length bytes of a batch
+BATCH_LENGTH_END = 12
+RECORDS_COUNT_END = 61
+
+# base_offset .. records count, everything of a v2 batch before the first record
+BATCH_HEADER = struct.Struct(">qiibiHiqqqhii")
+PARTITION_RECORD_START = struct.Struct(">Bi")
+# base offset and last offset delta, what it takes to know the offset after a batch
+BATCH_OFFSETS = struct.Struct(">q15xi")
+# attributes .. records count, the fields needed to walk a batch's records
+ATTRIBUTES_OFFSET = 21
+BATCH_VALUES_HEADER = struct.Struct(">H34xi")
+# frame version, type, version, partition id and topic uuid come before the replica array
+PARTITION_RECORD_VALUE_START = 23
+PARTITION_EPOCHS = struct.Struct(">iii")
+_UNPACKERS = {(n, signed): struct.Struct(">" + (fmt.lower() if signed else fmt)).unpack_from
+              for n, fmt in ((1, "B"), (2, "H"), (4, "I"), (8, "Q")) for signed in (False, True)}
+_INT32_ARRAYS = {n: struct.Struct(f">{n}i") for n in range(8)}
+
+# batch attribute bits
+COMPRESSION_MASK = 0x0007
+TIMESTAMP_TYPE_MASK = 0x0008
+TRANSACTIONAL_MASK = 0x0010
+CONTROL_BATCH_MASK = 0x0020
+DELETE_HORIZON_MASK = 0x0040
+
+TOPIC_RECORD_TYPE = 2
+PARTITION_RECORD_TYPE = 3
+FEATURE_LEVEL_RECORD_TYPE = 12
 
 
 
@@ -37,7 +68,7 @@ class Compression(Enum):
 
     @classmethod
     def of(cls, a: int) -> Self:
-        return next((x for x in Compression if x.id == a))
+        return cls(a)
 
 @dataclass
 class Record:
@@ -107,182 +138,540 @@ class RecordBatch:
     records: list[PartitionRecord | TopicRecord | FeatureLevelRecord]
 
 
+def _int32s(stuff: bytes | memoryview, index: int, n: int) -> tuple[int, ...]:
+    return _INT32_ARRAYS[n].unpack_from(stuff, index) if n in _INT32_ARRAYS \
+        else struct.unpack_from(f">{n}i", stuff, index)
+
+
+# the store's array columns; directories is a bytearray and kept apart
+STORE_COLUMNS = ("topic", "partition_id", "version", "leader", "leader_epoch", "partition_epoch", "nodes_start",
+                 "replica_count", "isr_count", "nodes", "directories_start", "directory_count")
+
+
+class PartitionStore:
+    # every partition is a row across array-backed columns; replica/isr node ids and directory ids live in
+    # shared flat arrays, addressed by a start and a count per row
+
+    def __init__(self):
+        self.topic_ids: list[bytes] = []
+        self.topic_numbers: dict[bytes, int] = {}
+        # per topic number, its rows ordered by partition id
+        self.topic_rows: list[array] = []
+        self.topic = array("i")
+        self.partition_id = array("i")
+        self.version = array("B")
+        self.leader = array("i")
+        self.leader_epoch = array("i")
+        self.partition_epoch = array("i")
+        self.nodes_start = array("I")
+        self.replica_count = array("H")
+        self.isr_count = array("H")
+        self.nodes = array("i")
+        self.directories_start = array("I")
+        self.directory_count = array("H")
+        self.directories = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.partition_id)
+
+    def topic_number(self, topic_id: bytes) -> int:
+        number = self.topic_numbers.get(topic_id)
+        if number is None:
+            # interned, so every row of a topic shares one 16 byte key
+            number = self.topic_numbers[topic_id] = len(self.topic_ids)
+            self.topic_ids.append(topic_id)
+            self.topic_rows.append(array("i"))
+        return number
+
+    def put(self, topic_id: bytes, partition_id: int, version: int, leader: int, leader_epoch: int,
+            partition_epoch: int, replicas: Sequence[int], isr: Sequence[int], directories: bytes) -> None:
+        number = self.topic_number(topic_id)
+        rows = self.topic_rows[number]
+        row = len(self.partition_id)
+        # partitions nearly always arrive in id order, so this is an append
+        if rows and self.partition_id[rows[-1]] >= partition_id:
+            position = bisect.bisect_left(rows, partition_id, key=self.partition_id.__getitem__)
+            if position < len(rows) and self.partition_id[rows[position]] == partition_id:
+                self._overwrite(rows[position], version, leader, leader_epoch, partition_epoch, replicas, isr,
+                                directories)
+                return
+            rows.insert(position, row)
+        else:
+            rows.append(row)
+        self.topic.append(number)
+        self.partition_id.append(partition_id)
+        self.version.append(version)
+        self.leader.append(leader)
+        self.leader_epoch.append(leader_epoch)
+        self.partition_epoch.append(partition_epoch)
+        self.nodes_start.append(len(self.nodes))
+        self.replica_count.append(len(replicas))
+        self.isr_count.append(len(isr))
+        self.nodes.extend(replicas)
+        self.nodes.extend(isr)
+        self.directories_start.append(len(self.directories))
+        self.directory_count.append(len(directories) // 16)
+        self.directories += directories
+
+    def _overwrite(self, row: int, version: int, leader: int, leader_epoch: int, partition_epoch: int,
+                   replicas: Sequence[int], isr: Sequence[int], directories: bytes) -> None:
+        self.version[row] = version
+        self.leader[row] = leader
+        self.leader_epoch[row] = leader_epoch
+        self.partition_epoch[row] = partition_epoch
+        # node ids are rewritten in place when they fit; otherwise the old slots are left behind unused
+        start = self.nodes_start[row]
+        if len(replicas) + len(isr) > self.replica_count[row] + self.isr_count[row]:
+            start = self.nodes_start[row] = len(self.nodes)
+            self.nodes.extend([0] * (len(replicas) + len(isr)))
+        self.nodes[start: start + len(replicas) + len(isr)] = array("i", [*replicas, *isr])
+        self.replica_count[row] = len(replicas)
+        self.isr_count[row] = len(isr)
+        start = self.directories_start[row]
+        if len(directories) > 16 * self.directory_count[row]:
+            start = self.directories_start[row] = len(self.directories)
+            self.directories += bytes(len(directories))
+        self.directories[start: start + len(directories)] = directories
+        self.directory_count[row] = len(directories) // 16
+
+    def partitions(self, topic_id: bytes) -> "PartitionList":
+        number = self.topic_numbers.get(topic_id)
+        return PartitionList(self, self.topic_rows[number] if number is not None else array("i"))
+
+    def copy(self) -> Self:
+        # every column is one flat buffer, so this is a memory copy per column and per topic's rows
+        store = PartitionStore()
+        store.topic_ids = list(self.topic_ids)
+        store.topic_numbers = dict(self.topic_numbers)
+        store.topic_rows = [rows[:] for rows in self.topic_rows]
+        for name in STORE_COLUMNS:
+            setattr(store, name, getattr(self, name)[:])
+        store.directories = self.directories[:]
+        return store
+
+
+class PartitionView:
+    # a partition read out of the store's columns; the rarely used PartitionRecord fields come from materialize()
+    __slots__ = ("store", "row")
+    type = PARTITION_RECORD_TYPE
+
+    def __init__(self, store: PartitionStore, row: int):
+        self.store = store
+        self.row = row
+
+    @property
+    def partition_id(self) -> int:
+        return self.store.partition_id[self.row]
+
+    @property
+    def topic_uuid(self) -> uuid.UUID:
+        return uuid.UUID(bytes=self.store.topic_ids[self.store.topic[self.row]])
+
+    @property
+    def leader(self) -> int:
+        return self.store.leader[self.row]
+
+    @property
+    def leader_epoch(self) -> int:
+        return self.store.leader_epoch[self.row]
+
+    @property
+    def partition_epoch(self) -> int:
+        return self.store.partition_epoch[self.row]
+
+    @property
+    def replica_array(self) -> list[int]:
+        start = self.store.nodes_start[self.row]
+        return self.store.nodes[start: start + self.store.replica_count[self.row]].tolist()
+
+    @property
+    def in_sync_replica_array(self) -> list[int]:
+        start = self.store.nodes_start[self.row] + self.store.replica_count[self.row]
+        return self.store.nodes[start: start + self.store.isr_count[self.row]].tolist()
+
+    @property
+    def directories_array(self) -> list[uuid.UUID]:
+        start = self.store.directories_start[self.row]
+        return [uuid.UUID(bytes=bytes(self.store.directories[x: x + 16]))
+                for x in range(start, start + 16 * self.store.directory_count[self.row], 16)]
+
+    def materialize(self) -> PartitionRecord:
+        # reassignments in flight and tagged fields are not kept, so those come back empty
+        replicas, isr, directories = self.replica_array, self.in_sync_replica_array, self.directories_array
+        return PartitionRecord(1, PARTITION_RECORD_TYPE, self.store.version[self.row], self.partition_id,
+                               self.topic_uuid, len(replicas) + 1, replicas, len(isr) + 1, isr, 1, 1, self.leader,
+                               self.leader_epoch, self.partition_epoch, len(directories) + 1, directories, 0)
+
+    def __getattr__(self, item):
+        return getattr(self.materialize(), item)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, PartitionView):
+            other = other.materialize()
+        return self.materialize() == other
+
+    def __repr__(self) -> str:
+        return repr(self.materialize())
+
+
+class PartitionList(Sequence):
+    # the partitions of one topic in id order; views are made on access, slices share the store
+
+    def __init__(self, store: PartitionStore, rows: array):
+        self.store = store
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return PartitionList(self.store, self.rows[i])
+        return PartitionView(self.store, self.rows[i])
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Sequence) and list(self) == list(other)
+
+
+@dataclass
+class TopicIndex:
+    name_to_id: dict[str, uuid.UUID] = field(default_factory=dict)
+    id_to_name: dict[uuid.UUID, str] = field(default_factory=dict)
+    store: PartitionStore = field(default_factory=PartitionStore)
+    # records applied so far, and that count as of each topic's last change by topic id; responses cache what they
+    # encode per topic against these
+    changes: int = field(default=0, compare=False)
+    topic_changes: dict[bytes, int] = field(default_factory=dict, compare=False)
+
+    def copy(self) -> Self:
+        # records applied later do not show up in the copy
+        return TopicIndex(dict(self.name_to_id), dict(self.id_to_name), self.store.copy(), self.changes,
+                          dict(self.topic_changes))
+
+    def apply(self, record: PartitionRecord | TopicRecord | FeatureLevelRecord) -> None:
+        # dispatching on the record type lets the lazy views in app.metadata.mapped go in here as well
+        if record is None:
+            return
+        if record.type == TOPIC_RECORD_TYPE:
+            self.name_to_id[record.topic_name] = record.topic_uuid
+            self.id_to_name[record.topic_uuid] = record.topic_name
+        elif record.type == PARTITION_RECORD_TYPE:
+            self.store.put(record.topic_uuid.bytes, record.partition_id, record.version, record.leader,
+                           record.leader_epoch, record.partition_epoch, record.replica_array,
+                           record.in_sync_replica_array, b"".join(x.bytes for x in record.directories_array))
+        else:
+            return
+        self.changes += 1
+        self.topic_changes[record.topic_uuid.bytes] = self.changes
+
+    def apply_value(self, value: bytes | memoryview) -> None:
+        # straight from the record value bytes into the store, no record object in between
+        value_type = value[1]
+        if value_type == PARTITION_RECORD_TYPE:
+            # compact array lengths are varints, but a single byte unless an array has over 126 entries; each one is
+            # checked before it places the next, anything longer goes through the parser
+            version, partition_id = PARTITION_RECORD_START.unpack_from(value, 2)
+            replicas_at = PARTITION_RECORD_VALUE_START + 1
+            if value[replicas_at - 1] & MSB_SET_MASK:
+                return self._apply_parsed(value)
+            replica_count = value[replicas_at - 1] - 1
+            isr_at = replicas_at + 4 * replica_count + 1
+            if value[isr_at - 1] & MSB_SET_MASK:
+                return self._apply_parsed(value)
+            isr_count = value[isr_at - 1] - 1
+            removing = isr_at + 4 * isr_count
+            if value[removing] & MSB_SET_MASK:
+                return self._apply_parsed(value)
+            adding = removing + 1 + 4 * max(value[removing] - 1, 0)
+            if value[adding] & MSB_SET_MASK:
+                return self._apply_parsed(value)
+            epochs = adding + 1 + 4 * max(value[adding] - 1, 0)
+            directories_at = epochs + PARTITION_EPOCHS.size
+            if value[directories_at] & MSB_SET_MASK:
+                return self._apply_parsed(value)
+            leader, leader_epoch, partition_epoch = PARTITION_EPOCHS.unpack_from(value, epochs)
+            directories = 16 * max(value[directories_at] - 1, 0)
+            topic_id = bytes(value[7:23])
+            self.store.put(topic_id, partition_id, version, leader, leader_epoch, partition_epoch,
+                           _int32s(value, replicas_at, replica_count), _int32s(value, isr_at, isr_count),
+                           bytes(value[directories_at + 1: directories_at + 1 + directories]))
+            self.changes += 1
+            self.topic_changes[topic_id] = self.changes
+        elif value_type == TOPIC_RECORD_TYPE:
+            parser = _Parser(value)
+            parser.index = 3
+            name = parser.read_string(parser.read_zig_zag() - 1)
+            topic_id = parser.parse_uuid()
+            self.name_to_id[name] = topic_id
+            self.id_to_name[topic_id] = name
+            self.changes += 1
+            self.topic_changes[topic_id.bytes] = self.changes
+
+    def _apply_parsed(self, value: bytes | memoryview) -> None:
+        parser = _Parser(value)
+        parser.index = 2
+        self.apply(parser.parse_record(value[0], value[1]))
+
+    def partitions(self, topic_name: str) -> Optional[PartitionList]:
+        topic_id = self.name_to_id.get(topic_name)
+        if topic_id is None:
+            return None
+        return self.store.partitions(topic_id.bytes)
+
+    def partition(self, topic_name: str, partition_id: int) -> Optional[PartitionView]:
+        partitions = self.partitions(topic_name) or []
+        position = bisect.bisect_left(partitions, partition_id, key=lambda x: x.partition_id)
+        if position < len(partitions) and partitions[position].partition_id == partition_id:
+            return partitions[position]
+        return None
+
+
+def next_offset(stuff: bytes | memoryview, position: int) -> int:
+    base_offset, last_offset_delta = BATCH_OFFSETS.unpack_from(stuff, position)
+    return base_offset + last_offset_delta + 1
+
+
+class BatchList(Sequence):
+    # record batches decoded on access from the bytes a log keeps, instead of being held as objects
+
+    def __init__(self, log: "ClusterMetaDataLog"):
+        self.log = log
+
+    def __len__(self) -> int:
+        return len(self.log.batch_positions)
+
+    def __getitem__(self, i: int) -> RecordBatch:
+        parser = _Parser(self.log.data)
+        parser.index = self.log.batch_positions[i]
+        return parser.parse_batch()
+
+
 @dataclass
 class ClusterMetaDataLog:
-    record_batches: list[RecordBatch]
+    # the valid batches back to back; topics and partitions are decoded once, into index
+    data: bytearray = field(default_factory=bytearray)
+    batch_positions: array = field(default_factory=lambda: array("Q"))
+    parsed_bytes: int = 0
+    index: TopicIndex = field(default_factory=TopicIndex)
+    corrupt_batches: int = 0
+    # the offset after the last batch applied to index
+    next_offset: int = 0
+
+    @property
+    def record_batches(self) -> BatchList:
+        return BatchList(self)
 
     @classmethod
-    def of(file_name) -> Self:
+    def of(cls, file_name) -> Self:
         with open(file_name, 'rb') as in_file:
             stuff = in_file.read()
             return ClusterMetaDataLog.of_bytes(stuff)
 
     @classmethod
-    def of_bytes(cls, stuff: bytes):
-
-        parser: _Parser = _Parser(stuff)
-        record_batches = []
-        while parser.has_next():
-
-            base_offset = parser.read(8)
-
-            batch_length = parser.read(4)
-            partition_leader_epoch = parser.read(4)
-            magic_byte = parser.read(1)
-            crc = parser.read(4, signed=True)
-            attribues = parser.read(2)
-            compression = Compression.of(attribues & 0x0003)
-            timestamp_type = attribues & 0x0004
-            is_transactional = (attribues & 0x0008) > 0
-            is_control_batch = (attribues & 0x000f) > 0
-            has_delete_horizon = (attribues & 0x0010) > 0
-            last_offset_data = parser.read(4)
-
-            timestamp_raw = parser.read(8,)
-            base_timestamp= None
-            timestamp_raw = parser.read(8)
-            max_timestamp= None
-            producer_id = parser.read(8, signed=True)
-            producer_epoch = parser.read(2, signed=True)
-            base_sequence = parser.read(4, signed=True)
-            records_length = parser.read(4)
-            records: list[TopicRecord | PartitionRecord | FeatureLevelRecord] = list()
-            for i in range(records_length):
-                record_length = parser.read_zig_zag(signed=True)
-                attributes = parser.read(1)
-                timestamp_delta = parser.read_zig_zag(signed=True)
-                offset_delta = parser.read(1, signed=True)
-                key_length = parser.read_zig_zag(signed=True)
-                if key_length >= 0:
-                    key = parser.read(key_length)
-                value_length = parser.read_zig_zag(signed=True)
-                frame_version = parser.read(1)
-                value_type = parser.read(1)
-                value = parser.parse_record(frame_version, value_type)
-                records.append(value)
-                headers_array_count = parser.read_zig_zag()
-            val = RecordBatch(base_offset, batch_length, partition_leader_epoch, magic_byte, crc, compression, timestamp_type, is_transactional, is_control_batch, has_delete_horizon, last_offset_data, base_timestamp, max_timestamp, producer_id, producer_epoch, base_sequence, 0, records)
-            record_batches.append(val)
-        return ClusterMetaDataLog(record_batches)
-
-
-
-def read_partition(server_args: ServerArguments) -> ClusterMetaDataLog:
-    if os.path.exists('/tmp/kraft-combined-logs/__cluster_metadata-0/00000000000000000000.log'):
-        with open('/tmp/kraft-combined-logs/__cluster_metadata-0/00000000000000000000.log', 'rb') as in_file:
-            return ClusterMetaDataLog.of_bytes(in_file.read())
-    default_string = '00000000000000000000004f0000000102b069457c00000000000000000191e05af81800000191e05af818ffffffffffffffffffffffffffff000000013a000000012e010c00116d657461646174612e76657273696f6e001400000000000000000001000000e4000000010224db12dd00000000000200000191e05b2d1500000191e05b2d15ffffffffffffffffffffffffffff000000033c00000001300102000473617a00000000000040008000000000000091000090010000020182010103010000000000000000000040008000000000000091020000000102000000010101000000010000000000000000021000000000004000800000000000000100009001000004018201010301000000010000000000004000800000000000009102000000010200000001010100000001000000000000000002100000000000400080000000000000010000'
-    stuff = binascii.unhexlify(default_string)
-    return ClusterMetaDataLog.of_bytes(stuff)
+    def of_bytes(cls, stuff: bytes, verifier: Optional[CrcVerifier] = None):
+        log = ClusterMetaDataLog()
+        log.extend(stuff, verifier)
+        return log
+
+    def extend(self, stuff: bytes, verifier: Optional[CrcVerifier] = None) -> int:
+        # stuff continues the log at parsed_bytes; a trailing partial batch is left for the next call
+        spans = _Parser(stuff).batch_spans()
+        corrupt = set(verifier.verify_batches(stuff, spans, loading=True)) if verifier else set()
+        view = memoryview(stuff)
+        for position, end in spans:
+            if position in corrupt:
+                # a batch that fails its crc is left out of the index instead of being served
+                self.corrupt_batches += 1
+                continue
+            self.batch_positions.append(len(self.data))
+            self.data += view[position: end]
+            self.next_offset = next_offset(view, position)
+            for value in _Parser.batch_values(view, position, end):
+                self.index.apply_value(value)
+        parsed = spans[-1][1] if spans else 0
+        self.parsed_bytes += parsed
+        return parsed
+
+
+DEFAULT_METADATA_LOG = binascii.unhexlify('00000000000000000000004f0000000102b069457c00000000000000000191e05af81800000191e05af818ffffffffffffffffffffffffffff000000013a000000012e010c00116d657461646174612e76657273696f6e001400000000000000000001000000e4000000010224db12dd00000000000200000191e05b2d1500000191e05b2d15ffffffffffffffffffffffffffff000000033c00000001300102000473617a00000000000040008000000000000091000090010000020182010103010000000000000000000040008000000000000091020000000102000000010101000000010000000000000000021000000000004000800000000000000100009001000004018201010301000000010000000000004000800000000000009102000000010200000001010100000001000000000000000002100000000000400080000000000000010000')
 
 
 class _Parser:
 
-    def __init__(self, stuff: bytes):
+    def __init__(self, stuff: bytes | memoryview):
         self.stuff = stuff
         self.index = 0
 
     def read(self, n: int, signed=False) -> int:
-        res: int = int.from_bytes(self.stuff[self.index: self.index + n], signed=signed)
+        unpack = _UNPACKERS.get((n, signed))
+        if unpack is None:
+            res: int = int.from_bytes(self.stuff[self.index: self.index + n], signed=signed)
+        else:
+            res = unpack(self.stuff, self.index)[0]
         self.index += n
         return res
-    def read_zig_zag(self,signed=False) -> int:
-        shift = 0
-        value = 0
-        aux = MSB_SET_MASK
+
+    def read_ints(self, n: int) -> tuple[int, ...]:
+        res = _INT32_ARRAYS[n].unpack_from(self.stuff, self.index) if n in _INT32_ARRAYS \
+            else struct.unpack_from(f">{n}i", self.stuff, self.index)
+        self.index += 4 * n
+        return res
+
+    def read_zig_zag(self, signed=False) -> int:
+        stuff = self.stuff
         index = self.index
-        record = b""
+        aux = stuff[index]
+        index += 1
+        value = aux & REMOVE_MSB_MASK
+        shift = 7
         while aux & MSB_SET_MASK:
-            aux = self.stuff[index]
-            record += aux.to_bytes()
-            value += (aux & REMOVE_MSB_MASK) << shift
+            aux = stuff[index]
             index += 1
+            value |= (aux & REMOVE_MSB_MASK) << shift
             shift += 7
-        if signed:
-            lsb = value & 0x01
-            if lsb:
-                value = -1 * ((value + 1) >> 1)
-            else:
-                value = value >> 1
         self.index = index
+        if signed:
+            return (value >> 1) ^ -(value & 1)
         return value
-        # https://gist.github.com/mfuerstenau/ba870a29e16536fdbaba
+    # https://gist.github.com/mfuerstenau/ba870a29e16536fdbaba
     # https://github.com/fmoo/python-varint/blob/master/varint.py
 
     def read_string(self, n: int) -> str:
-        res: str = self.stuff[self.index: self.index + n].decode(app.server.ENCODING)
+        res: str = str(self.stuff[self.index: self.index + n], app.server.ENCODING)
         self.index += n
         return res
 
     def parse_uuid(self) -> uuid.UUID:
-        res = uuid.UUID(bytes=self.stuff[self.index: self.index + 16])
+        res = uuid.UUID(bytes=bytes(self.stuff[self.index: self.index + 16]))
         self.index += 16
         return  res
     def parse_record(self, frame_version: int, type:int) -> TopicRecord | PartitionRecord | FeatureLevelRecord:
-        if type == 12:
+        if type == FEATURE_LEVEL_RECORD_TYPE:
             version = self.read(1)
             name_length = self.read_zig_zag(signed=False)
             name = self.read_string(name_length -1)
             feature_level = self.read(2)
             tagged_field_counts = self.read_zig_zag(signed=False)
             return FeatureLevelRecord(frame_version, type, name_length, name, feature_level, tagged_field_counts)
-        if type == 2:
+        if type == TOPIC_RECORD_TYPE:
             version = self.read(1)
             name_length = self.read_zig_zag(signed=False)
             name = self.read_string(name_length - 1)
             topic_uuid = self.parse_uuid()
             tagged_field_count = self.read_zig_zag(signed=False)
             return TopicRecord(frame_version, type, version,  name_length, name, topic_uuid, tagged_field_count)
-        if type == 3:
-            version = self.read(1)
-            partition_id = self.read(4)
+        if type == PARTITION_RECORD_TYPE:
+            version, partition_id = PARTITION_RECORD_START.unpack_from(self.stuff, self.index)
+            self.index += PARTITION_RECORD_START.size
             topic_uuid = self.parse_uuid()
-            length_replica_array = self.read(1)
-            replica_array = [            ]
-            for i in range(length_replica_array -1):
-                replica_array.append(self.read(4))
-            length_in_sync_replica_array = self.read(1)
-            in_sync_replica_array = []
-            for i in range(length_in_sync_replica_array -1):
-                in_sync_replica_array.append(self.read(4))
-            length_removing_replicas_array = self.read(1)
-            length_adding_replicas_array = self.read(1)
-            leader = self.read(4)
-            leader_epoch = self.read(4)
-            partition_epoch = self.read(4)
-            length_directories_array = self.read(1)
+            length_replica_array = self.read_zig_zag()
+            replica_array = list(self.read_ints(length_replica_array - 1))
+            length_in_sync_replica_array = self.read_zig_zag()
+            in_sync_replica_array = list(self.read_ints(length_in_sync_replica_array - 1))
+            length_removing_replicas_array = self.read_zig_zag()
+            self.index += 4 * max(length_removing_replicas_array - 1, 0)
+            length_adding_replicas_array = self.read_zig_zag()
+            self.index += 4 * max(length_adding_replicas_array - 1, 0)
+            leader, leader_epoch, partition_epoch = self.read_ints(3)
+            length_directories_array = self.read_zig_zag()
             directories = []
             for i in range(length_directories_array -1):
                 directories.append(self.parse_uuid())
-            tagged_field_counts = self.read(1)
+            tagged_field_counts = self.read_zig_zag()
 
             return PartitionRecord(frame_version, type, version, partition_id, topic_uuid, length_replica_array,
-                                   replica_array, length_in_sync_replica_array, in_sync_replica_array, length_removing_replicas_array, length_adding_replicas_array, leader, leader, leader_epoch, length_directories_array, directories, tagged_field_counts)
+                                   replica_array, length_in_sync_replica_array, in_sync_replica_array, length_removing_replicas_array, length_adding_replicas_array, leader, leader_epoch, partition_epoch, length_directories_array, directories, tagged_field_counts)
 
-    def has_next(self):
-        return self.index < len(self.stuff)
-
-
-def get_topic_stuff(log: ClusterMetaDataLog, topic_names: list[str]) -> list[PartitionRecord]:
-    batches = [x for x in log.record_batches]
-    records = []
-    records_by_id = defaultdict(list)
-    name_to_id = {}
-
-    for batch in batches:
-        for batch_record in batch.records:
-
-            if isinstance(batch_record, TopicRecord):
-                records_by_id[batch_record.topic_uuid].append(batch_record)
-                name_to_id[batch_record.topic_name] = batch_record.topic_uuid
-            if isinstance(batch_record, PartitionRecord):
-                records_by_id[batch_record.topic_uuid].append(batch_record)
-
-            records.append(batch_record)
-    if topic_names[0] not in name_to_id:
-        return []
-    relevant_records = [x for x in records_by_id[name_to_id[topic_names[0]]] if isinstance(x, PartitionRecord)]
-    print("lol")
-    return relevant_records
+    def has_complete_batch(self) -> bool:
+        remaining = len(self.stuff) - self.index
+        if remaining < BATCH_LENGTH_END:
+            return False
+        batch_length = _UNPACKERS[(4, True)](self.stuff, self.index + 8)[0]
+        return remaining >= BATCH_LENGTH_END + batch_length
 
+    def batch_spans(self) -> list[tuple[int, int]]:
+        spans = []
+        index = self.index
+        while len(self.stuff) - index >= BATCH_LENGTH_END:
+            end = index + BATCH_LENGTH_END + _UNPACKERS[(4, True)](self.stuff, index + 8)[0]
+            if end > len(self.stuff):
+                break
+            spans.append((index, end))
+            index = end
+        return spans
+
+    def skip_batch(self) -> None:
+        self.index += BATCH_LENGTH_END + _UNPACKERS[(4, True)](self.stuff, self.index + 8)[0]
+
+    def parse_batch(self) -> RecordBatch:
+        batch_start = self.index
+        (base_offset, batch_length, partition_leader_epoch, magic_byte, crc, attribues, last_offset_data,
+         base_timestamp_raw, max_timestamp_raw, producer_id, producer_epoch, base_sequence,
+         records_length) = BATCH_HEADER.unpack_from(self.stuff, batch_start)
+        self.index = batch_start + BATCH_HEADER.size
+        compression = Compression.of(attribues & COMPRESSION_MASK)
+        timestamp_type = attribues & TIMESTAMP_TYPE_MASK
+        is_transactional = (attribues & TRANSACTIONAL_MASK) > 0
+        is_control_batch = (attribues & CONTROL_BATCH_MASK) > 0
+        has_delete_horizon = (attribues & DELETE_HORIZON_MASK) > 0
+        base_timestamp= None
+        max_timestamp= None
+        batch_end = batch_start + BATCH_LENGTH_END + batch_length
+        if compression == Compression.NO_COMPRESSION:
+            records = self.parse_records(records_length)
+        else:
+            # everything after the header is one compressed block holding the records
+            records = _Parser(compression_codecs.decompress(compression.id, self.stuff[self.index: batch_end])) \
+                .parse_records(records_length)
+        val = RecordBatch(base_offset, batch_length, partition_leader_epoch, magic_byte, crc, compression, timestamp_type, is_transactional, is_control_batch, has_delete_horizon, last_offset_data, base_timestamp, max_timestamp, producer_id, producer_epoch, base_sequence, records_length, records)
+        self.index = batch_end
+        return val
+
+    def parse_records(self, records_length: int) -> list[TopicRecord | PartitionRecord | FeatureLevelRecord]:
+        records: list[TopicRecord | PartitionRecord | FeatureLevelRecord] = list()
+        stuff = self.stuff
+        for i in range(records_length):
+            record_length = self.read_zig_zag(signed=True)
+            record_end = self.index + record_length
+            self.index += 1
+            timestamp_delta = self.read_zig_zag(signed=True)
+            offset_delta = self.read_zig_zag(signed=True)
+            key_length = self.read_zig_zag(signed=True)
+            if key_length > 0:
+                self.index += key_length
+            value_length = self.read_zig_zag(signed=True)
+            frame_version = stuff[self.index]
+            value_type = stuff[self.index + 1]
+            self.index += 2
+            value = self.parse_record(frame_version, value_type)
+            records.append(value)
+            self.index = record_end
+        return records
+
+    @staticmethod
+    def batch_values(view: memoryview, position: int, end: int) -> Iterator[memoryview]:
+        # the value of every record in the batch at position; control batches carry no metadata records
+        (attributes, records_length) = BATCH_VALUES_HEADER.unpack_from(view, position + ATTRIBUTES_OFFSET)
+        if attributes & CONTROL_BATCH_MASK:
+            return
+        parser = _Parser(view)
+        parser.index = position + RECORDS_COUNT_END
+        codec = attributes & COMPRESSION_MASK
+        if codec:
+            parser = _Parser(memoryview(compression_codecs.decompress(codec, view[parser.index: end])))
+        for i in range(records_length):
+            record_length = parser.read_zig_zag(signed=True)
+            record_end = parser.index + record_length
+            # attributes, then timestamp and offset deltas
+            parser.index += 1
+            parser.read_zig_zag(signed=True)
+            parser.read_zig_zag(signed=True)
+            key_length = parser.read_zig_zag(signed=True)
+            if key_length > 0:
+                parser.index += key_length
+            value_length = parser.read_zig_zag(signed=True)
+            yield parser.stuff[parser.index: parser.index + value_length]
+            parser.index = record_end
 
+    def has_next(self):
+        return self.index < len(self.stuff)
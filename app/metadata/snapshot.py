@@ -0,0 +1,70 @@
+import mmap
+import os
+import pathlib
+import threading
+import traceback
+from dataclasses import dataclass
+from typing import Optional
+
+from app.metadata import checkpoint
+from app.metadata.mapped import MappedMetaDataLog
+from app.metadata.metadata import ClusterMetaDataLog, TopicIndex
+
+SNAPSHOT_NAME = "metadata.snapshot"
+
+FileSignature = Optional[tuple[int, int, int]]
+
+
+@dataclass
+class MetadataSnapshot:
+    index: TopicIndex
+    parsed_bytes: int = 0
+
+
+def write_snapshot(path: pathlib.Path, log: ClusterMetaDataLog | MappedMetaDataLog) -> None:
+    # the same binary format as the on-disk checkpoints, written to shared memory without an fsync
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, 'wb') as out_file:
+        out_file.write(checkpoint.encode(log.index, log.next_offset, log.parsed_bytes))
+    # readers either see the old file or the new one, never a half-written snapshot
+    os.replace(temporary, path)
+
+
+def read_snapshot(path: pathlib.Path) -> MetadataSnapshot:
+    with open(path, 'rb') as in_file:
+        mapped = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = checkpoint.decode(mapped)
+        except Exception as e:
+            # views of the map held by the traceback's frames would make close() raise instead of this
+            traceback.clear_frames(e.__traceback__)
+            raise
+        finally:
+            mapped.close()
+    return MetadataSnapshot(start.index, start.position)
+
+
+class SnapshotCache:
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.snapshot: Optional[MetadataSnapshot] = None
+        self.signature: FileSignature = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self) -> MetadataSnapshot:
+        stat = os.stat(self.path)
+        signature = stat.st_ino, stat.st_size, stat.st_mtime_ns
+        with self.lock:
+            if self.snapshot is not None and signature == self.signature:
+                self.hits += 1
+                return self.snapshot
+            self.misses += 1
+            self.snapshot = read_snapshot(self.path)
+            self.signature = signature
+            return self.snapshot
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "tails": 0}
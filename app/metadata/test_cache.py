@@ -0,0 +1,149 @@
+import pathlib
+import tempfile
+from unittest import TestCase
+
+import cache
+import snapshot
+from app.log import batches, crc
+from app.protocol import compression
+from metadata import DEFAULT_METADATA_LOG
+
+
+class TestMetadataCache(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.dir.name) / "00000000000000000000.log"
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_reuses_parsed_log_until_file_changes(self):
+        self.path.write_bytes(DEFAULT_METADATA_LOG)
+        metadata_cache = cache.MetadataCache(self.path)
+        first = metadata_cache.get()
+        self.assertIs(first, metadata_cache.get())
+        self.assertEqual({"hits": 1, "misses": 1, "tails": 0}, metadata_cache.stats())
+
+        self.path.write_bytes(DEFAULT_METADATA_LOG[:79 + 12])
+        second = metadata_cache.get()
+        self.assertIsNot(first, second)
+        self.assertEqual(1, len(second.record_batches))
+        self.assertEqual({"hits": 1, "misses": 2, "tails": 0}, metadata_cache.stats())
+
+    def test_missing_file_falls_back_to_default_log(self):
+        metadata_cache = cache.MetadataCache(self.path)
+        self.assertEqual(2, len(metadata_cache.get().record_batches))
+        metadata_cache.get()
+        self.assertEqual({"hits": 1, "misses": 1, "tails": 0}, metadata_cache.stats())
+
+    def test_appended_batches_are_tailed(self):
+        first_batch_end = 79 + 12
+        self.path.write_bytes(DEFAULT_METADATA_LOG[:first_batch_end])
+        metadata_cache = cache.MetadataCache(self.path)
+        log = metadata_cache.get()
+        self.assertEqual(1, len(log.record_batches))
+
+        with open(self.path, 'ab') as out_file:
+            out_file.write(DEFAULT_METADATA_LOG[first_batch_end: first_batch_end + 20])
+        self.assertIs(log, metadata_cache.get())
+        self.assertEqual(1, len(log.record_batches))
+        self.assertEqual(first_batch_end, log.parsed_bytes)
+
+        with open(self.path, 'ab') as out_file:
+            out_file.write(DEFAULT_METADATA_LOG[first_batch_end + 20:])
+        self.assertIs(log, metadata_cache.get())
+        self.assertEqual(2, len(log.record_batches))
+        self.assertEqual(len(DEFAULT_METADATA_LOG), log.parsed_bytes)
+        self.assertEqual(1, metadata_cache.misses)
+        self.assertEqual(2, metadata_cache.tails)
+
+    def test_mapped_log_matches_eager_log(self):
+        first_batch_end = 79 + 12
+        self.path.write_bytes(DEFAULT_METADATA_LOG[:first_batch_end])
+        metadata_cache = cache.MetadataCache(self.path, mapped=True)
+        log = metadata_cache.get()
+        self.assertEqual({}, log.index.name_to_id)
+
+        with open(self.path, 'ab') as out_file:
+            out_file.write(DEFAULT_METADATA_LOG[first_batch_end:])
+        self.assertIs(log, metadata_cache.get())
+        self.assertEqual(2, len(log.record_batches))
+
+        eager = cache.ClusterMetaDataLog.of_bytes(DEFAULT_METADATA_LOG)
+        self.assertEqual(eager.record_batches[1], log.record_batches[1])
+        self.assertEqual(eager.index.name_to_id, log.index.name_to_id)
+        partitions = log.index.partitions("saz")
+        self.assertEqual([0, 1], [x.partition_id for x in partitions])
+        self.assertEqual(eager.index.partitions("saz")[1], partitions[1].materialize())
+        self.assertEqual(eager.index.partitions("saz")[1].leader, partitions[1].leader)
+
+    def test_compressed_batches_are_inflated(self):
+        first_batch_end = 79 + 12
+        headers = batches.read_batch_headers(DEFAULT_METADATA_LOG)
+        self.path.write_bytes(DEFAULT_METADATA_LOG[:first_batch_end] + batches.recompress_batch(
+            DEFAULT_METADATA_LOG, headers[1], compression.GZIP))
+        expected = cache.ClusterMetaDataLog.of_bytes(DEFAULT_METADATA_LOG)
+        for mapped in (False, True):
+            log = cache.MetadataCache(self.path, mapped).get()
+            self.assertEqual(compression.GZIP, log.record_batches[1].compression.id)
+            self.assertEqual(expected.index.name_to_id, log.index.name_to_id)
+            self.assertEqual([x.partition_id for x in expected.index.partitions("saz")],
+                             [x.partition_id for x in log.index.partitions("saz")])
+
+    def test_batches_failing_their_crc_are_skipped(self):
+        corrupted = bytearray(DEFAULT_METADATA_LOG)
+        corrupted[-1] ^= 0xFF
+        self.path.write_bytes(corrupted)
+        for mapped in (False, True):
+            log = cache.MetadataCache(self.path, mapped, crc.CrcVerifier(crc.CrcMode.ON_LOAD)).get()
+            self.assertEqual(1, log.corrupt_batches)
+            self.assertEqual(1, len(log.record_batches))
+            self.assertEqual({}, log.index.name_to_id)
+            unchecked = cache.MetadataCache(self.path, mapped, crc.CrcVerifier(crc.CrcMode.OFF)).get()
+            self.assertEqual(2, len(unchecked.record_batches))
+
+    def test_a_verify_too_quick_to_time_still_loads(self):
+        class CoarseClock(crc.CrcVerifier):
+            def stats(self) -> dict[str, float]:
+                return {**super().stats(), "seconds": 0.0}
+
+        self.path.write_bytes(DEFAULT_METADATA_LOG)
+        with self.assertLogs("cache", "INFO") as logs:
+            log = cache.MetadataCache(self.path, verifier=CoarseClock(crc.CrcMode.ON_LOAD)).get()
+        self.assertEqual(0, log.corrupt_batches)
+        self.assertIn(f"verified crcs of {len(DEFAULT_METADATA_LOG)} metadata bytes,", logs.output[0])
+
+
+class TestSnapshotCache(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.log_path = pathlib.Path(self.dir.name) / "00000000000000000000.log"
+        self.snapshot_path = pathlib.Path(self.dir.name) / "metadata.snapshot"
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_workers_read_what_the_leader_published(self):
+        self.log_path.write_bytes(DEFAULT_METADATA_LOG)
+        leader = cache.MetadataCache(self.log_path, mapped=True)
+        snapshot.write_snapshot(self.snapshot_path, leader.get())
+        worker = snapshot.SnapshotCache(self.snapshot_path)
+        published = worker.get()
+        self.assertIs(published, worker.get())
+        self.assertEqual(len(DEFAULT_METADATA_LOG), published.parsed_bytes)
+        self.assertEqual(leader.get().index.name_to_id, published.index.name_to_id)
+        self.assertEqual({"hits": 1, "misses": 1, "tails": 0}, worker.stats())
+
+        self.log_path.write_bytes(DEFAULT_METADATA_LOG[:79 + 12])
+        snapshot.write_snapshot(self.snapshot_path, leader.get())
+        self.assertEqual(79 + 12, worker.get().parsed_bytes)
+        self.assertEqual({"hits": 1, "misses": 2, "tails": 0}, worker.stats())
+
+    def test_corrupt_snapshot_raises_its_own_error(self):
+        self.log_path.write_bytes(DEFAULT_METADATA_LOG)
+        snapshot.write_snapshot(self.snapshot_path, cache.MetadataCache(self.log_path).get())
+        corrupt = bytearray(self.snapshot_path.read_bytes())
+        corrupt[20] ^= 1
+        self.snapshot_path.write_bytes(corrupt)
+        with self.assertRaises(snapshot.checkpoint.CorruptCheckpointError):
+            snapshot.read_snapshot(self.snapshot_path)
@@ -0,0 +1,124 @@
+import pathlib
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+import cache
+import checkpoint
+from app.metadata.metadata import DEFAULT_METADATA_LOG, ClusterMetaDataLog
+from app.server.server_args import ServerArguments
+from resources.write_metadata import synthetic_metadata_log
+
+
+class TestCheckpoint(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.dir.name) / "__cluster_metadata-0" / "00000000000000000000.log"
+        self.path.parent.mkdir()
+        self.checkpoints = pathlib.Path(self.dir.name) / "checkpoints"
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        log = ClusterMetaDataLog.of_bytes(synthetic_metadata_log(5, 3, records_per_batch=4))
+        start = checkpoint.decode(checkpoint.encode(log.index, log.next_offset, log.parsed_bytes))
+        self.assertEqual(log.next_offset, start.next_offset)
+        self.assertEqual(log.parsed_bytes, start.position)
+        self.assertEqual(log.index.name_to_id, start.index.name_to_id)
+        for name in log.index.name_to_id:
+            self.assertEqual(list(log.index.partitions(name)), list(start.index.partitions(name)))
+
+    def test_corrupt_checkpoint_is_rejected(self):
+        encoded = bytearray(checkpoint.encode(ClusterMetaDataLog.of_bytes(DEFAULT_METADATA_LOG).index, 4, 100))
+        encoded[20] ^= 1
+        with self.assertRaises(checkpoint.CorruptCheckpointError):
+            checkpoint.decode(encoded)
+
+    def test_restart_replays_only_the_tail(self):
+        stuff = synthetic_metadata_log(6, 2, records_per_batch=5)
+        half = ClusterMetaDataLog.of_bytes(stuff).batch_positions[2]
+        self.path.write_bytes(stuff[:half])
+        first_cache = cache.MetadataCache(self.path, checkpoint_interval_ms=0, checkpoint_dir=self.checkpoints)
+        first = first_cache.get()
+        # written from the checkpoint thread; this only waits for it
+        first_cache.checkpointer.maybe_write()
+        self.assertEqual([self.checkpoints / "00000000000000000010.topic-index"],
+                         checkpoint.list_checkpoints(self.checkpoints))
+        # the log's own directory is left to KRaft
+        self.assertEqual([self.path], list(self.path.parent.iterdir()))
+
+        self.path.write_bytes(stuff)
+        for mapped in (False, True):
+            restarted = cache.MetadataCache(self.path, mapped, checkpoint_interval_ms=60_000,
+                                            checkpoint_dir=self.checkpoints).get()
+            # only the batches after the checkpoint were read
+            self.assertEqual(len(ClusterMetaDataLog.of_bytes(stuff).record_batches) - 2,
+                             len(restarted.record_batches))
+            self.assertEqual(ClusterMetaDataLog.of_bytes(stuff).index.name_to_id, restarted.index.name_to_id)
+            self.assertEqual(len(first.index.store) + 6, len(restarted.index.store))
+
+    def test_falls_back_to_an_older_checkpoint(self):
+        self.path.write_bytes(DEFAULT_METADATA_LOG)
+        log = ClusterMetaDataLog.of_bytes(DEFAULT_METADATA_LOG)
+        checkpoint.write_checkpoint(self.checkpoints, log.index, log.next_offset, log.parsed_bytes)
+        newest = checkpoint.checkpoint_path(self.checkpoints, log.next_offset + 1)
+        newest.write_bytes(b"garbage")
+        start = checkpoint.load_latest(self.checkpoints, self.path)
+        self.assertEqual(log.next_offset, start.next_offset)
+        # a checkpoint past the end of a log that was replaced is not used
+        self.path.write_bytes(DEFAULT_METADATA_LOG[:79 + 12])
+        self.assertIsNone(checkpoint.load_latest(self.checkpoints, self.path))
+
+    def test_requests_do_not_wait_for_the_write(self):
+        self.path.write_bytes(DEFAULT_METADATA_LOG)
+        metadata_cache = cache.MetadataCache(self.path, checkpoint_interval_ms=0, checkpoint_dir=self.checkpoints)
+        release = threading.Event()
+        write_encoded = checkpoint.write_encoded
+
+        def slow_write(*args):
+            release.wait(5)
+            return write_encoded(*args)
+
+        checkpoint.write_encoded = slow_write
+        try:
+            log = metadata_cache.get()
+            # the checkpoint thread is stuck in the write, the cache lock is free
+            time.sleep(0.1)
+            started = time.monotonic()
+            self.assertIs(log, metadata_cache.get())
+            self.assertLess(time.monotonic() - started, 1)
+            release.set()
+            metadata_cache.checkpointer.maybe_write()
+        finally:
+            checkpoint.write_encoded = write_encoded
+        self.assertEqual([checkpoint.checkpoint_path(self.checkpoints, log.next_offset)],
+                         checkpoint.list_checkpoints(self.checkpoints))
+
+    def test_encodes_outside_the_cache_lock(self):
+        self.path.write_bytes(DEFAULT_METADATA_LOG)
+        metadata_cache = cache.MetadataCache(self.path, checkpoint_interval_ms=60_000, checkpoint_dir=self.checkpoints)
+        log = metadata_cache.get()
+        # the checkpoint thread's own first write is out of the way, the next one is a minute off
+        metadata_cache.checkpointer.maybe_write()
+        encode = cache.encode
+        locked = []
+
+        def watched_encode(*args):
+            locked.append(metadata_cache.lock.locked())
+            return encode(*args)
+
+        cache.encode = watched_encode
+        try:
+            next_offset, encoded = metadata_cache._encode_checkpoint(-1)
+        finally:
+            cache.encode = encode
+        self.assertEqual([False], locked)
+        self.assertEqual(log.next_offset, checkpoint.decode(encoded).next_offset)
+
+    def test_off_unless_configured(self):
+        server_args = ServerArguments(self.path, properties={"log.dirs": self.dir.name})
+        self.assertIsNone(cache.MetadataCache(self.path, checkpoint_interval_ms=cache.checkpoint_interval_ms(
+            server_args), checkpoint_dir=cache.checkpoint_dir(server_args)).checkpointer)
+        self.assertNotIn(pathlib.Path(self.dir.name), cache.checkpoint_dir(server_args).parents)
@@ -81,3 +81,66 @@ class TestRecordValue(TestCase):
         res = parser.read_zig_zag(signed=True)
         self.assertFalse(parser.has_next())
 
+    def test_partitions_by_topic_name(self):
+        parsed = metadata.ClusterMetaDataLog.of_bytes(binascii.unhexlify(ROFLCOPTER_TEST_STRING))
+        self.assertIsNone(parsed.index.partitions("missing"))
+        found = parsed.index.partitions("saz")
+        self.assertEqual([0, 1], [x.partition_id for x in found])
+        self.assertEqual("saz", parsed.index.id_to_name[found[0].topic_uuid])
+
+
+class TestPartitionStore(TestCase):
+    def partition(self, partition_id: int, replicas: list[int], leader_epoch: int = 0) -> metadata.PartitionRecord:
+        topic_id = metadata.uuid.UUID(int=7)
+        return metadata.PartitionRecord(1, metadata.PARTITION_RECORD_TYPE, 1, partition_id, topic_id,
+                                        len(replicas) + 1, replicas, len(replicas) + 1, replicas, 1, 1, replicas[0],
+                                        leader_epoch, 0, 1, [], 0)
+
+    def test_views_match_the_records_applied(self):
+        index = metadata.TopicIndex()
+        index.apply(metadata.TopicRecord(1, metadata.TOPIC_RECORD_TYPE, 0, 4, "foo", metadata.uuid.UUID(int=7), 0))
+        for record in (self.partition(2, [1]), self.partition(0, [2, 3]), self.partition(1, [1]),
+                       self.partition(2, [3, 1, 2], leader_epoch=5)):
+            index.apply(record)
+        partitions = index.partitions("foo")
+        self.assertEqual([0, 1, 2], [x.partition_id for x in partitions])
+        self.assertEqual(self.partition(2, [3, 1, 2], leader_epoch=5), partitions[2])
+        self.assertEqual([3, 1, 2], index.partition("foo", 2).in_sync_replica_array)
+        self.assertEqual(3, len(index.store))
+
+    def test_copies_do_not_see_later_records(self):
+        index = metadata.TopicIndex()
+        index.apply(metadata.TopicRecord(1, metadata.TOPIC_RECORD_TYPE, 0, 4, "foo", metadata.uuid.UUID(int=7), 0))
+        index.apply(self.partition(0, [1]))
+        copy = index.copy()
+        index.apply(self.partition(0, [2, 3], leader_epoch=5))
+        index.apply(self.partition(1, [1]))
+        self.assertEqual([self.partition(0, [1])], list(copy.partitions("foo")))
+        self.assertEqual(2, len(index.partitions("foo")))
+
+    def test_values_and_records_build_the_same_index(self):
+        parsed = metadata.ClusterMetaDataLog.of_bytes(binascii.unhexlify(ROFLCOPTER_TEST_STRING))
+        from_records = metadata.TopicIndex()
+        for batch in parsed.record_batches:
+            for record in batch.records:
+                from_records.apply(record)
+        self.assertEqual(list(from_records.partitions("saz")), list(parsed.index.partitions("saz")))
+        self.assertEqual(parsed.record_batches[1].records[2], parsed.index.partition("saz", 1))
+
+    def test_long_replica_arrays_go_through_the_parser(self):
+        def compact_int32s(values: list[int]) -> bytes:
+            length = len(values) + 1
+            # two varint bytes from 128 on
+            prefix = bytes([length]) if length < 0x80 else bytes([(length & 0x7f) | 0x80, length >> 7])
+            return prefix + b"".join(x.to_bytes(4) for x in values)
+
+        index = metadata.TopicIndex()
+        replicas = list(range(1, 201))
+        for replica_array, isr in ((replicas, [1, 2]), ([3], replicas)):
+            value = (bytes([1, metadata.PARTITION_RECORD_TYPE, 1]) + (0).to_bytes(4) + metadata.uuid.UUID(int=7).bytes
+                     + compact_int32s(replica_array) + compact_int32s(isr) + b"\x01\x01"
+                     + metadata.PARTITION_EPOCHS.pack(1, 4, 2) + b"\x01\x00")
+            index.apply_value(value)
+            partition = index.store.partitions(metadata.uuid.UUID(int=7).bytes)[0]
+            self.assertEqual((replica_array, isr, 4), (partition.replica_array, partition.in_sync_replica_array,
+                                                        partition.leader_epoch))
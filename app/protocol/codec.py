@@ -0,0 +1,466 @@
+import dataclasses
+import json
+import pathlib
+import re
+import struct
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Self
+
+from app.protocol.reader import (field_end, read_bytes, read_compact_bytes, read_compact_length, read_compact_string,
+                                 read_length, read_string, read_uvarint, skip_tagged_fields)
+from app.protocol.request import KafkaRequestHeader
+from app.protocol.writer import (INT32, INT8, Encoded, FileRegion, ResponseBody, ResponseWriter, write_bytes,
+                                 write_compact_bytes, write_compact_string, write_string, write_tagged_fields,
+                                 write_uvarint)
+
+SCHEMA_DIRECTORY = pathlib.Path(__file__).parent / "schemas"
+# ApiVersions responses keep header v0 in every version, so a client can read the error of a version it guessed
+API_VERSIONS_KEY = 18
+MAX_VERSION = 0x7fff
+FIXED_TYPES = {"int8": "b", "int16": "h", "uint16": "H", "int32": "i", "uint32": "I", "int64": "q",
+               "float64": "d", "bool": "?"}
+ZERO_UUID = uuid.UUID(int=0)
+
+
+@dataclass(frozen=True)
+class Versions:
+    low: int
+    high: int
+
+    @classmethod
+    def of(cls, spec: Optional[str]) -> Self:
+        # the schema forms: "none", "3", "3-7" and "3+"
+        if spec is None or spec == "none":
+            return Versions(0, -1)
+        if spec.endswith("+"):
+            return Versions(int(spec[:-1]), MAX_VERSION)
+        low, _, high = spec.partition("-")
+        return Versions(int(low), int(high or low))
+
+    def __contains__(self, version: int) -> bool:
+        return self.low <= version <= self.high
+
+    def __iter__(self):
+        return iter(range(self.low, self.high + 1))
+
+
+@dataclass
+class FieldSpec:
+    name: str
+    type: str
+    versions: Versions
+    nullable_versions: Versions
+    tagged_versions: Versions
+    tag: Optional[int]
+    default: Optional[str]
+    fields: list[Self]
+
+    @classmethod
+    def of(cls, spec: dict) -> Self:
+        return FieldSpec(spec["name"], spec["type"], Versions.of(spec.get("versions")),
+                         Versions.of(spec.get("nullableVersions")), Versions.of(spec.get("taggedVersions")),
+                         spec.get("tag"), spec.get("default"), [FieldSpec.of(x) for x in spec.get("fields", [])])
+
+    @property
+    def attribute(self) -> str:
+        return re.sub(r"(?<!^)(?=[A-Z])", "_", self.name).lower()
+
+    @property
+    def is_array(self) -> bool:
+        return self.type.startswith("[]")
+
+    @property
+    def element(self) -> str:
+        return self.type[2:] if self.is_array else self.type
+
+    @property
+    def is_struct(self) -> bool:
+        return bool(self.fields)
+
+
+@dataclass
+class StructSpec:
+    name: str
+    fields: list[FieldSpec]
+    # the versions the struct appears in; its functions are only generated for those
+    versions: Versions
+
+
+def write_records(out: Encoded, records: Optional[bytes | memoryview | FileRegion], flexible: bool) -> None:
+    # file regions are counted in the length but streamed with sendfile instead of copied in
+    if not isinstance(records, FileRegion):
+        write_compact_bytes(out, records) if flexible else write_bytes(out, records)
+        return
+    write_uvarint(out, records.count + 1) if flexible else out.extend(INT32.pack(records.count))
+    if records.count:
+        out.regions.append((len(out), records))
+
+
+def default_value(field: FieldSpec) -> Any:
+    if field.is_array or field.type in ("bytes", "records") or field.is_struct:
+        # mutable defaults are made fresh for every instance, see _Generator.default_expression
+        return None if field.default == "null" else ...
+    if field.type == "string":
+        return None if field.default == "null" else field.default or ""
+    if field.type == "bool":
+        return field.default == "true"
+    if field.type == "float64":
+        return float(field.default or 0)
+    if field.type == "uuid":
+        return ZERO_UUID
+    return int(field.default or "0", 0)
+
+
+class _Generator:
+    # writes the source of one decode and one encode function per struct and version; nothing is interpreted
+    # from the schema once a message has been compiled
+
+    def __init__(self, namespace: dict):
+        self.namespace = namespace
+        self.lines: list[str] = []
+        self.constants: dict[tuple[type, str], str] = {}
+        self.locals = 0
+        # versions that would compile to the same code share one function
+        self.bodies: dict[str, str] = {}
+        self.functions: dict[str, str] = {}
+
+    def constant(self, value: Any) -> str:
+        key = (type(value), value.format if isinstance(value, struct.Struct) else repr(value))
+        name = self.constants.get(key)
+        if name is None:
+            name = self.constants[key] = f"C{len(self.constants)}"
+            self.namespace[name] = value
+        return name
+
+    def fresh(self, prefix: str) -> str:
+        self.locals += 1
+        return f"{prefix}{self.locals}"
+
+    def emit(self, name: str, out: list[str]) -> None:
+        body = "\n".join(out)
+        if body not in self.bodies:
+            self.bodies[body] = name
+            self.lines.append(f"def {name}{body}")
+        self.functions[name] = self.bodies[body]
+
+    def default_expression(self, field: FieldSpec) -> str:
+        value = default_value(field)
+        if value is not ...:
+            return self.constant(value)
+        if field.is_array:
+            return "[]"
+        if field.is_struct:
+            return f"{field.element}()"
+        return "b''"
+
+    def struct_function(self, kind: str, name: str, version: int) -> str:
+        name = f"{kind}_{name}_v{version}"
+        return self.functions.get(name, name)
+
+    def decode_value(self, out: list[str], indent: str, field: FieldSpec, element: bool, version: int,
+                     flexible: bool, target: str) -> None:
+        kind = field.element if element else field.type
+        # nullability belongs to the field, never to the elements of an array
+        nullable = not element and version in field.nullable_versions
+        if kind in FIXED_TYPES:
+            packer = struct.Struct(">" + FIXED_TYPES[kind])
+            out.append(f"{indent}{target} = {self.constant(packer)}.unpack_from(buffer, index)[0]")
+            out.append(f"{indent}index += {packer.size}")
+        elif kind == "uuid":
+            out.append(f"{indent}{target} = UUID(bytes=bytes(buffer[index:field_end(buffer, index, 16)]))")
+            out.append(f"{indent}index += 16")
+        elif kind == "string":
+            out.append(f"{indent}{target}, index = {'read_compact_string' if flexible else 'read_string'}"
+                       f"(buffer, index)")
+        elif kind in ("bytes", "records"):
+            out.append(f"{indent}{target}, index = {'read_compact_bytes' if flexible else 'read_bytes'}"
+                       f"(buffer, index)")
+        elif kind.startswith("[]"):
+            self.decode_array(out, indent, field, version, flexible, target, nullable)
+        elif nullable:
+            present = self.fresh("present")
+            out.append(f"{indent}{present} = INT8.unpack_from(buffer, index)[0]")
+            out.append(f"{indent}index += 1")
+            out.append(f"{indent}if {present} < 0:")
+            out.append(f"{indent}    {target} = None")
+            out.append(f"{indent}else:")
+            out.append(f"{indent}    {target}, index = {self.struct_function('decode', kind, version)}"
+                       f"(buffer, index)")
+        else:
+            out.append(f"{indent}{target}, index = {self.struct_function('decode', kind, version)}(buffer, index)")
+
+    def decode_array(self, out: list[str], indent: str, field: FieldSpec, version: int, flexible: bool,
+                     target: str, nullable: bool) -> None:
+        length = self.fresh("length")
+        element = field.element
+        out.append(f"{indent}{length}, index = {'read_compact_length' if flexible else 'read_length'}"
+                   f"(buffer, index)")
+        out.append(f"{indent}if {length} < 0:")
+        out.append(f"{indent}    {target} = {'None' if nullable else '[]'}")
+        if element in FIXED_TYPES and element != "bool":
+            # a whole array of numbers is one unpack
+            code = FIXED_TYPES[element]
+            size = struct.calcsize(">" + code)
+            out.append(f"{indent}else:")
+            out.append(f"{indent}    field_end(buffer, index, {size} * {length})")
+            out.append(f"{indent}    {target} = list(struct.unpack_from('>%d{code}' % {length}, buffer, index))")
+            out.append(f"{indent}    index += {size} * {length}")
+            return
+        item = self.fresh("item")
+        out.append(f"{indent}else:")
+        out.append(f"{indent}    {target} = []")
+        out.append(f"{indent}    for _ in range({length}):")
+        self.decode_value(out, indent + "        ", field, True, version, flexible, item)
+        out.append(f"{indent}        {target}.append({item})")
+
+    def encode_value(self, out: list[str], indent: str, field: FieldSpec, element: bool, version: int,
+                     flexible: bool, target: str, value: str) -> None:
+        kind = field.element if element else field.type
+        if kind in FIXED_TYPES:
+            out.append(f"{indent}{target} += {self.constant(struct.Struct('>' + FIXED_TYPES[kind]))}.pack({value})")
+        elif kind == "uuid":
+            out.append(f"{indent}{target} += {value}.bytes")
+        elif kind == "string":
+            out.append(f"{indent}{'write_compact_string' if flexible else 'write_string'}({target}, {value})")
+        elif kind == "bytes":
+            out.append(f"{indent}{'write_compact_bytes' if flexible else 'write_bytes'}({target}, {value})")
+        elif kind == "records":
+            out.append(f"{indent}write_records({target}, {value}, {flexible})")
+        elif kind.startswith("[]"):
+            items = self.fresh("items")
+            out.append(f"{indent}{items} = {value}")
+            null = bytes(1) if flexible else INT32.pack(-1)
+            out.append(f"{indent}if {items} is None:")
+            out.append(f"{indent}    {target} += {null!r}")
+            if field.element in FIXED_TYPES:
+                # an array of numbers is one pack, and short compact ones take their length along
+                code = FIXED_TYPES[field.element]
+                if flexible:
+                    out.append(f"{indent}elif not {items}:")
+                    out.append(f"{indent}    {target}.append(1)")
+                    out.append(f"{indent}elif len({items}) < 0x7f:")
+                    out.append(f"{indent}    {target} += struct.pack('>B%d{code}' % len({items}), len({items}) + 1, "
+                               f"*{items})")
+                    out.append(f"{indent}else:")
+                    out.append(f"{indent}    write_uvarint({target}, len({items}) + 1)")
+                else:
+                    out.append(f"{indent}else:")
+                    out.append(f"{indent}    {target} += INT32.pack(len({items}))")
+                out.append(f"{indent}    {target} += struct.pack('>%d{code}' % len({items}), *{items})")
+                return
+            out.append(f"{indent}else:")
+            if flexible:
+                out.append(f"{indent}    write_uvarint({target}, len({items}) + 1)")
+            else:
+                out.append(f"{indent}    {target} += INT32.pack(len({items}))")
+            item = self.fresh("item")
+            out.append(f"{indent}    for {item} in {items}:")
+            self.encode_value(out, indent + "        ", field, True, version, flexible, target, item)
+        elif not element and version in field.nullable_versions:
+            out.append(f"{indent}if {value} is None:")
+            out.append(f"{indent}    {target}.append(0xff)")
+            out.append(f"{indent}else:")
+            out.append(f"{indent}    {target}.append(1)")
+            out.append(f"{indent}    {self.struct_function('encode', kind, version)}({target}, {value})")
+        else:
+            out.append(f"{indent}{self.struct_function('encode', kind, version)}({target}, {value})")
+
+    def differs(self, field: FieldSpec, value: str) -> str:
+        # compares a struct with its default field by field, cheaper than building one and using __eq__
+        default = self.namespace[field.element]()
+        if all(x.type in FIXED_TYPES or x.type == "string" for x in field.fields):
+            return " or ".join(f"{value}.{x.attribute} != {self.constant(getattr(default, x.attribute))}"
+                               for x in field.fields)
+        return f"{value} != {self.constant(default)}"
+
+    def fixed_runs(self, fields: list[FieldSpec]) -> list[list[FieldSpec]]:
+        # neighbouring fixed-width fields are read and written with one struct call
+        runs = []
+        for field in fields:
+            if field.type in FIXED_TYPES and runs and runs[-1][0].type in FIXED_TYPES:
+                runs[-1].append(field)
+            else:
+                runs.append([field])
+        return runs
+
+    def decoder(self, spec: StructSpec, version: int, flexible: bool) -> None:
+        self.locals = 0
+        out = ["(buffer, index):"]
+        present = [x for x in spec.fields if version in x.versions]
+        untagged = [x for x in present if not (flexible and version in x.tagged_versions)]
+        tagged = [x for x in present if flexible and version in x.tagged_versions]
+        for run in self.fixed_runs(untagged):
+            if run[0].type in FIXED_TYPES:
+                packer = struct.Struct(">" + "".join(FIXED_TYPES[x.type] for x in run))
+                targets = "".join(f"v_{x.attribute}, " for x in run)
+                out.append(f"    {targets}= {self.constant(packer)}.unpack_from(buffer, index)")
+                out.append(f"    index += {packer.size}")
+            else:
+                self.decode_value(out, "    ", run[0], False, version, flexible, f"v_{run[0].attribute}")
+        if flexible:
+            for field in tagged:
+                out.append(f"    v_{field.attribute} = {self.default_expression(field)}")
+            if not tagged:
+                out.append("    index = skip_tagged_fields(buffer, index)")
+            else:
+                out.append("    count, index = read_uvarint(buffer, index)")
+                out.append("    for _ in range(count):")
+                out.append("        tag, index = read_uvarint(buffer, index)")
+                out.append("        size, index = read_uvarint(buffer, index)")
+                out.append("        end = field_end(buffer, index, size)")
+                for i, field in enumerate(tagged):
+                    out.append(f"        {'if' if i == 0 else 'elif'} tag == {field.tag}:")
+                    self.decode_value(out, "            ", field, False, version, flexible, f"v_{field.attribute}")
+                out.append("        index = end")
+        arguments = ", ".join(f"v_{x.attribute}" if x in present else self.default_expression(x)
+                              for x in spec.fields)
+        out.append(f"    return {spec.name}({arguments}), index")
+        self.emit(f"decode_{spec.name}_v{version}", out)
+
+    def encoder(self, spec: StructSpec, version: int, flexible: bool) -> None:
+        self.locals = 0
+        out = ["(out, message):"]
+        present = [x for x in spec.fields if version in x.versions]
+        untagged = [x for x in present if not (flexible and version in x.tagged_versions)]
+        tagged = [x for x in present if flexible and version in x.tagged_versions]
+        for run in self.fixed_runs(untagged):
+            if run[0].type in FIXED_TYPES:
+                packer = struct.Struct(">" + "".join(FIXED_TYPES[x.type] for x in run))
+                values = ", ".join(f"message.{x.attribute}" for x in run)
+                out.append(f"    out += {self.constant(packer)}.pack({values})")
+            else:
+                self.encode_value(out, "    ", run[0], False, version, flexible, "out", f"message.{run[0].attribute}")
+        if flexible and not tagged:
+            out.append("    out.append(0)")
+        elif flexible:
+            # only fields that differ from their default go on the wire
+            out.append("    tagged = {}")
+            for field in tagged:
+                value = f"message.{field.attribute}"
+                default = default_value(field)
+                if default is None:
+                    out.append(f"    if {value} is not None:")
+                elif field.is_struct and not field.is_array:
+                    out.append(f"    if {self.differs(field, value)}:")
+                elif default is ...:
+                    out.append(f"    if {value}:")
+                else:
+                    out.append(f"    if {value} != {self.constant(default)}:")
+                out.append(f"        tagged[{field.tag}] = field = Encoded()")
+                self.encode_value(out, "        ", field, False, version, flexible, "field", value)
+            out.append("    write_tagged_fields(out, tagged)")
+        out.append("    return out")
+        self.emit(f"encode_{spec.name}_v{version}", out)
+
+
+def _annotation(field: FieldSpec) -> Any:
+    if field.is_array:
+        return list
+    if field.is_struct:
+        return Optional[object]
+    return {"string": Optional[str], "uuid": uuid.UUID, "bool": bool, "float64": float,
+            "bytes": Optional[bytes | memoryview], "records": Optional[bytes | memoryview | FileRegion]}.get(
+        field.type, int)
+
+
+def _dataclass_field(field: FieldSpec, namespace: dict) -> dataclasses.Field:
+    value = default_value(field)
+    if value is not ...:
+        return dataclasses.field(default=value)
+    if field.is_array:
+        return dataclasses.field(default_factory=list)
+    if field.is_struct:
+        return dataclasses.field(default_factory=namespace[field.element])
+    return dataclasses.field(default=b"")
+
+
+class Message:
+    # one request or response schema, compiled: a dataclass per struct and a decoder and encoder per version
+
+    def __init__(self, spec: dict):
+        self.name: str = spec["name"]
+        self.api_key: int = spec["apiKey"]
+        self.type: str = spec["type"]
+        self.versions = Versions.of(spec["validVersions"])
+        self.flexible_versions = Versions.of(spec.get("flexibleVersions"))
+        self.structs: dict[str, type] = {}
+        namespace = {"UUID": uuid.UUID, "struct": struct, "INT8": INT8, "INT32": INT32, "Encoded": Encoded,
+                     "field_end": field_end, "read_uvarint": read_uvarint, "read_compact_length": read_compact_length,
+                     "read_length": read_length, "read_compact_string": read_compact_string,
+                     "read_string": read_string, "read_compact_bytes": read_compact_bytes, "read_bytes": read_bytes,
+                     "skip_tagged_fields": skip_tagged_fields, "write_uvarint": write_uvarint,
+                     "write_compact_string": write_compact_string, "write_string": write_string,
+                     "write_compact_bytes": write_compact_bytes, "write_bytes": write_bytes,
+                     "write_records": write_records, "write_tagged_fields": write_tagged_fields}
+        specs = []
+        self._collect(StructSpec(self.name, [FieldSpec.of(x) for x in spec["fields"]], self.versions), specs)
+        for struct_spec in specs:
+            cls = dataclasses.make_dataclass(struct_spec.name,
+                                             [(x.attribute, _annotation(x), _dataclass_field(x, namespace))
+                                              for x in struct_spec.fields], slots=True)
+            cls.__module__ = __name__
+            namespace[struct_spec.name] = self.structs[struct_spec.name] = cls
+        generator = _Generator(namespace)
+        for version in self.versions:
+            for struct_spec in (x for x in specs if version in x.versions):
+                generator.decoder(struct_spec, version, version in self.flexible_versions)
+                generator.encoder(struct_spec, version, version in self.flexible_versions)
+        exec(compile("\n".join(generator.lines), f"<{self.name} codec>", "exec"), namespace)
+        self.decoders: dict[int, Callable] = {x: namespace[generator.struct_function("decode", self.name, x)]
+                                              for x in self.versions}
+        self.encoders: dict[int, Callable] = {x: namespace[generator.struct_function("encode", self.name, x)]
+                                              for x in self.versions}
+        # the nested structs' encoders as well, for callers that keep parts of a message encoded
+        self.struct_encoders: dict[tuple[str, int], Callable] = {
+            (x.name, version): namespace[generator.struct_function("encode", x.name, version)]
+            for x in specs for version in x.versions if version in self.versions}
+
+    def _collect(self, spec: StructSpec, specs: list[StructSpec]) -> None:
+        # nested structs first, their classes are the defaults of the fields that hold them
+        for field in spec.fields:
+            if field.is_struct:
+                versions = Versions(max(spec.versions.low, field.versions.low),
+                                    min(spec.versions.high, field.versions.high))
+                self._collect(StructSpec(field.element, field.fields, versions), specs)
+        specs.append(spec)
+
+    @property
+    def struct(self) -> type:
+        return self.structs[self.name]
+
+    def flexible(self, version: int) -> bool:
+        return version in self.flexible_versions
+
+    def decode_body(self, buffer: bytes | memoryview, index: int, version: int) -> Any:
+        decoder = self.decoders.get(version)
+        if decoder is None:
+            raise ValueError(f"{self.name} has no version {version}")
+        return decoder(buffer, index)[0]
+
+    def decode(self, request: KafkaRequestHeader) -> Any:
+        version = request.request_api_version
+        index = request.body_start
+        if self.flexible(version):
+            # header v2 ends with its own tagged fields
+            index = skip_tagged_fields(request.raw_msg, index)
+        return self.decode_body(request.raw_msg, index, version)
+
+    def encode_body(self, writer: ResponseWriter, version: int, message: Any) -> ResponseWriter:
+        return self.encoders[version](writer, message)
+
+    def encode_response(self, request: KafkaRequestHeader, message: Any) -> ResponseBody:
+        version = request.request_api_version
+        writer = ResponseWriter()
+        writer.header(request.correlation_id, self.flexible(version) and self.api_key != API_VERSIONS_KEY)
+        return self.encode_body(writer, version, message).finish()
+
+
+def load_messages(directory: pathlib.Path = SCHEMA_DIRECTORY) -> dict[str, Message]:
+    messages = [Message(json.loads(path.read_text())) for path in sorted(directory.glob("*.json"))]
+    return {message.name: message for message in messages}
+
+
+MESSAGES = load_messages()
+REQUESTS = {x.api_key: x for x in MESSAGES.values() if x.type == "request"}
+RESPONSES = {x.api_key: x for x in MESSAGES.values() if x.type == "response"}
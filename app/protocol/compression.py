@@ -0,0 +1,113 @@
+import gzip
+import struct
+from typing import Callable, Optional
+
+try:
+    import snappy
+except ImportError:
+    snappy = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ids as stored in the low three bits of a v2 batch's attributes
+NO_COMPRESSION = 0
+GZIP = 1
+SNAPPY = 2
+LZ4 = 3
+ZSTD = 4
+CODEC_NAMES = {"uncompressed": NO_COMPRESSION, "none": NO_COMPRESSION, "gzip": GZIP, "snappy": SNAPPY, "lz4": LZ4,
+               "zstd": ZSTD}
+
+# the Java client frames snappy the way xerial's SnappyOutputStream does
+XERIAL_MAGIC = b"\x82SNAPPY\x00"
+XERIAL_HEADER = XERIAL_MAGIC + struct.pack(">ii", 1, 1)
+XERIAL_BLOCK_SIZE = 32 * 1024
+XERIAL_BLOCK_LENGTH = struct.Struct(">i")
+
+
+class UnsupportedCodecError(ValueError):
+    pass
+
+
+def _gzip_compress(data: bytes | memoryview, level: Optional[int]) -> bytes:
+    return gzip.compress(data, 6 if level is None else level, mtime=0)
+
+
+def _snappy_compress(data: bytes | memoryview, level: Optional[int]) -> bytes:
+    out = bytearray(XERIAL_HEADER)
+    data = memoryview(data)
+    for start in range(0, len(data), XERIAL_BLOCK_SIZE):
+        block = snappy.compress(bytes(data[start: start + XERIAL_BLOCK_SIZE]))
+        out += XERIAL_BLOCK_LENGTH.pack(len(block))
+        out += block
+    return bytes(out)
+
+
+def _snappy_decompress(data: bytes | memoryview) -> bytes:
+    data = memoryview(data)
+    if data[:len(XERIAL_MAGIC)] != XERIAL_MAGIC:
+        return snappy.decompress(bytes(data))
+    out = bytearray()
+    position = len(XERIAL_HEADER)
+    while position < len(data):
+        (length,) = XERIAL_BLOCK_LENGTH.unpack_from(data, position)
+        position += XERIAL_BLOCK_LENGTH.size
+        out += snappy.decompress(bytes(data[position: position + length]))
+        position += length
+    return bytes(out)
+
+
+def _lz4_compress(data: bytes | memoryview, level: Optional[int]) -> bytes:
+    return lz4.frame.compress(bytes(data), compression_level=level or 0)
+
+
+def _zstd_compress(data: bytes | memoryview, level: Optional[int]) -> bytes:
+    return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+
+
+def _zstd_decompress(data: bytes | memoryview) -> bytes:
+    # frames from the Java client do not always carry their content size
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+Compressor = Callable[[bytes | memoryview, Optional[int]], bytes]
+Decompressor = Callable[[bytes | memoryview], bytes]
+
+CODECS: dict[int, tuple[Compressor, Decompressor]] = {GZIP: (_gzip_compress, gzip.decompress)}
+if snappy is not None:
+    CODECS[SNAPPY] = (_snappy_compress, _snappy_decompress)
+if lz4 is not None:
+    CODECS[LZ4] = (_lz4_compress, lz4.frame.decompress)
+if zstandard is not None:
+    CODECS[ZSTD] = (_zstd_compress, _zstd_decompress)
+
+
+def codec(codec_id: int) -> tuple[Compressor, Decompressor]:
+    found = CODECS.get(codec_id)
+    if found is None:
+        raise UnsupportedCodecError(f"compression codec {codec_id} is not available")
+    return found
+
+
+def compress(codec_id: int, data: bytes | memoryview, level: Optional[int] = None) -> bytes:
+    if codec_id == NO_COMPRESSION:
+        return bytes(data)
+    return codec(codec_id)[0](data, level)
+
+
+def decompress(codec_id: int, data: bytes | memoryview) -> bytes | memoryview:
+    if codec_id == NO_COMPRESSION:
+        return data
+    try:
+        return codec(codec_id)[1](data)
+    except UnsupportedCodecError:
+        raise
+    except Exception as e:
+        # every codec library has its own error type; they all mean the same thing here
+        raise ValueError(f"codec {codec_id} could not decompress {len(data)} bytes: {e}") from e
@@ -0,0 +1,11 @@
+NONE = 0
+OFFSET_OUT_OF_RANGE = 1
+CORRUPT_MESSAGE = 2
+UNKNOWN_TOPIC_OR_PARTITION = 3
+REQUEST_TIMED_OUT = 7
+KAFKA_STORAGE_ERROR = 56
+UNSUPPORTED_VERSION = 35
+INVALID_REQUIRED_ACKS = 21
+INVALID_RECORD = 87
+UNKNOWN_TOPIC_ID = 100
+UNSUPPORTED_COMPRESSION_TYPE = 76
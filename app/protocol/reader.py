@@ -0,0 +1,79 @@
+from typing import Optional
+
+from app.protocol.writer import INT16, INT32
+from app.server import ENCODING
+
+
+def read_uvarint(buffer: bytes | memoryview, index: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[index]
+        index += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, index
+        shift += 7
+
+
+def read_varint(buffer: bytes | memoryview, index: int) -> tuple[int, int]:
+    value, index = read_uvarint(buffer, index)
+    return (value >> 1) ^ -(value & 1), index
+
+
+def field_end(buffer: bytes | memoryview, index: int, length: int) -> int:
+    end = index + length
+    if end > len(buffer):
+        raise ValueError(f"need {length} bytes at {index}, message has {len(buffer)}")
+    return end
+
+
+def read_compact_length(buffer: bytes | memoryview, index: int) -> tuple[int, int]:
+    length, index = read_uvarint(buffer, index)
+    return length - 1, index
+
+
+def read_length(buffer: bytes | memoryview, index: int) -> tuple[int, int]:
+    return INT32.unpack_from(buffer, index)[0], index + 4
+
+
+def read_compact_string(buffer: bytes | memoryview, index: int) -> tuple[Optional[str], int]:
+    length, index = read_compact_length(buffer, index)
+    if length < 0:
+        return None, index
+    end = field_end(buffer, index, length)
+    return str(buffer[index:end], ENCODING), end
+
+
+def read_string(buffer: bytes | memoryview, index: int) -> tuple[Optional[str], int]:
+    length = INT16.unpack_from(buffer, index)[0]
+    index += 2
+    if length < 0:
+        return None, index
+    end = field_end(buffer, index, length)
+    return str(buffer[index:end], ENCODING), end
+
+
+def read_compact_bytes(buffer: bytes | memoryview, index: int) -> tuple[Optional[bytes | memoryview], int]:
+    length, index = read_compact_length(buffer, index)
+    if length < 0:
+        return None, index
+    end = field_end(buffer, index, length)
+    return buffer[index:end], end
+
+
+def read_bytes(buffer: bytes | memoryview, index: int) -> tuple[Optional[bytes | memoryview], int]:
+    length, index = read_length(buffer, index)
+    if length < 0:
+        return None, index
+    end = field_end(buffer, index, length)
+    return buffer[index:end], end
+
+
+def skip_tagged_fields(buffer: bytes | memoryview, index: int) -> int:
+    count, index = read_uvarint(buffer, index)
+    for _ in range(count):
+        _, index = read_uvarint(buffer, index)
+        size, index = read_uvarint(buffer, index)
+        index = field_end(buffer, index, size)
+    return index
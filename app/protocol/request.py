@@ -0,0 +1,47 @@
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Optional, Self
+
+from app.protocol.reader import read_string
+from app.protocol.writer import ResponseBody
+
+# message_size, api key, api version, correlation id
+CLIENT_ID_START = 12
+
+
+@dataclass
+class KafkaRequestHeader:
+    message_size: int
+    request_api_key: int
+    request_api_version: int
+    correlation_id: int
+    payload: bytes
+    raw_msg: bytes
+    client_id: Optional[str] = None
+    body_start: int = CLIENT_ID_START
+    # set from the client's quotas before the handler runs, which writes it into the response
+    throttle_time_ms: int = 0
+
+    @classmethod
+    def of(cls, msg: bytes | memoryview) -> Self:
+        message_size = int.from_bytes(msg[0:4], "big")
+        request_api_key = int.from_bytes(msg[4:6], "big")
+        request_api_version = int.from_bytes(msg[6:8], "big")
+        correlation_id = int.from_bytes(msg[8:12], "big")
+        payload = msg[12:]
+        # the client id is a nullable int16 string in every header version
+        client_id, body_start = read_string(msg, CLIENT_ID_START)
+
+        return KafkaRequestHeader(message_size, request_api_key, request_api_version, correlation_id, payload, msg,
+                                  client_id, body_start)
+
+
+@dataclass()
+class KafkaResponse:
+    error_code: int
+    # the complete response frame, size prefix included; None when the client expects no reply
+    body: Optional[ResponseBody]
+    # how long the connection stays muted after the response is sent
+    throttle_time_ms: int = 0
+    # set instead of body while a delayed operation waits in a purgatory, resolves to the body
+    delayed: Optional[Future] = None
@@ -0,0 +1,65 @@
+import io
+import uuid
+from unittest import TestCase
+
+import codec
+from app.protocol.writer import FileRegion, ResponseWriter
+
+
+def encode(message: codec.Message, version: int, value) -> bytes:
+    return bytes(message.encode_body(ResponseWriter(), version, value).finish()[4:])
+
+
+class TestCodec(TestCase):
+    def test_every_version_round_trips(self):
+        for message in codec.MESSAGES.values():
+            for version in message.versions:
+                value = message.struct()
+                self.assertEqual(value, message.decode_body(encode(message, version, value), 0, version),
+                                 f"{message.name} v{version}")
+
+    def test_compact_types_and_tagged_fields(self):
+        message = codec.MESSAGES["ApiVersionsResponse"]
+        api_version = message.structs["ApiVersion"]
+        value = message.struct(0, [api_version(18, 0, 4)], 7, zk_migration_ready=True)
+        self.assertEqual(bytes.fromhex("0000" "00000001" "001200000004" "00000007"), encode(message, 2, value))
+        # compact array, a tagged field per entry, then tag 3 holding one byte
+        encoded = encode(message, 3, value)
+        self.assertEqual(bytes.fromhex("0000" "02" "001200000004" "00" "00000007" "01" "03" "01" "01"), encoded)
+        self.assertEqual(value, message.decode_body(encoded, 0, 3))
+
+    def test_unknown_tagged_fields_are_skipped(self):
+        message = codec.MESSAGES["DescribeTopicPartitionsRequest"]
+        # one topic "saz" whose tagged fields carry an unknown tag 9, limit 5, null cursor
+        encoded = bytes.fromhex("02" "0473617a" "01" "09" "02" "abcd" "00000005" "ff" "00")
+        request = message.decode_body(encoded, 0, 0)
+        self.assertEqual(["saz"], [x.name for x in request.topics])
+        self.assertEqual(5, request.response_partition_limit)
+        self.assertIsNone(request.cursor)
+
+    def test_fields_follow_their_versions(self):
+        message = codec.MESSAGES["FetchRequest"]
+        topic = message.structs["FetchTopic"]("saz", uuid.UUID(int=7), [message.structs["FetchPartition"](1)])
+        old, new = (message.decode_body(encode(message, x, message.struct(topics=[topic])), 0, x) for x in (12, 13))
+        self.assertEqual(("saz", codec.ZERO_UUID), (old.topics[0].topic, old.topics[0].topic_id))
+        self.assertEqual(("", uuid.UUID(int=7)), (new.topics[0].topic, new.topics[0].topic_id))
+
+    def test_file_records_are_not_copied(self):
+        message = codec.MESSAGES["FetchResponse"]
+        region = FileRegion(io.BytesIO(), 10, 300)
+        partition = message.structs["PartitionData"](0, 0, 5, records=region)
+        value = message.struct(responses=[message.structs["FetchableTopicResponse"](partitions=[partition])])
+        parts = message.encode_body(ResponseWriter(), 16, value).finish()
+        self.assertIs(region, parts[1])
+        # the length in front of the region is its compact size, 301 as a varint
+        self.assertEqual(bytes.fromhex("ad02"), bytes(parts[0][-2:]))
+        self.assertEqual(sum(len(x) for x in (parts[0], parts[2])) - 4 + 300, int.from_bytes(parts[0][:4]))
+
+    def test_nullable_arrays_of_structs(self):
+        message = codec.MESSAGES["MetadataRequest"]
+        value = message.struct([message.structs["MetadataRequestTopic"](uuid.UUID(int=7), "saz")])
+        # the elements carry no null marker of their own
+        encoded = encode(message, 12, value)
+        self.assertEqual(bytes.fromhex("02" + uuid.UUID(int=7).hex + "0473617a00" "01" "00" "00"), encoded)
+        self.assertEqual(value, message.decode_body(encoded, 0, 12))
+        self.assertIsNone(message.decode_body(bytes.fromhex("00" "01" "00" "00"), 0, 12).topics)
@@ -0,0 +1,29 @@
+import uuid
+from unittest import TestCase
+
+import writer
+
+
+class TestResponseWriter(TestCase):
+    def test_size_prefix_covers_body(self):
+        response = writer.ResponseWriter()
+        response.header(7, flexible=True).int16(-1).int32(5).int64(2 ** 40)
+        frame = response.finish()
+        self.assertEqual(len(frame) - 4, int.from_bytes(frame[0:4]))
+        self.assertEqual(bytes.fromhex("00000007" "00" "ffff" "00000005" "0000010000000000"), bytes(frame[4:]))
+
+    def test_compact_types(self):
+        response = writer.ResponseWriter()
+        response.compact_string("saz").compact_string(None).compact_array_length(2).compact_bytes(b"\x01")
+        self.assertEqual(bytes.fromhex("0473617a" "00" "03" "0201"), bytes(response.finish()[4:]))
+
+    def test_varints(self):
+        response = writer.ResponseWriter()
+        response.unsigned_varint(300).varint(-1).varint(36)
+        self.assertEqual(bytes.fromhex("ac02" "01" "48"), bytes(response.finish()[4:]))
+
+    def test_uuid_and_tagged_fields(self):
+        topic_id = uuid.UUID("00000000-0000-4000-8000-000000000091")
+        response = writer.ResponseWriter()
+        response.uuid(topic_id).tagged_fields({1: b"\xaa"})
+        self.assertEqual(topic_id.bytes + bytes.fromhex("01" "01" "01" "aa"), bytes(response.finish()[4:]))
@@ -0,0 +1,181 @@
+import struct
+import uuid
+from dataclasses import dataclass
+from typing import BinaryIO, Optional, Self
+
+from app.server import ENCODING
+
+INT8 = struct.Struct(">b")
+INT16 = struct.Struct(">h")
+INT32 = struct.Struct(">i")
+INT64 = struct.Struct(">q")
+UINT32 = struct.Struct(">I")
+
+SIZE_PREFIX_LENGTH = 4
+
+
+@dataclass(slots=True)
+class FileRegion:
+    file: BinaryIO
+    offset: int
+    count: int
+
+
+# a plain frame, or frame pieces interleaved with file ranges the sender streams with sendfile
+ResponseBody = bytes | bytearray | memoryview | list[memoryview | FileRegion]
+
+
+class Encoded(bytearray):
+    # what the encoders append to; records held in files are noted with their position instead
+
+    def __init__(self, data: bytes = b""):
+        super().__init__(data)
+        self.regions: list[tuple[int, FileRegion]] = []
+
+
+def write_uvarint(out: bytearray, value: int) -> None:
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def write_compact_string(out: bytearray, value: Optional[str]) -> None:
+    if value is None:
+        out.append(0)
+        return
+    encoded = value.encode(ENCODING)
+    write_uvarint(out, len(encoded) + 1)
+    out += encoded
+
+
+def write_string(out: bytearray, value: Optional[str]) -> None:
+    if value is None:
+        out += INT16.pack(-1)
+        return
+    encoded = value.encode(ENCODING)
+    out += INT16.pack(len(encoded))
+    out += encoded
+
+
+def write_compact_bytes(out: bytearray, value: Optional[bytes | memoryview]) -> None:
+    if value is None:
+        out.append(0)
+        return
+    write_uvarint(out, len(value) + 1)
+    out += value
+
+
+def write_bytes(out: bytearray, value: Optional[bytes | memoryview]) -> None:
+    if value is None:
+        out += INT32.pack(-1)
+        return
+    out += INT32.pack(len(value))
+    out += value
+
+
+def write_tagged_fields(out: bytearray, fields: dict[int, bytes | bytearray]) -> None:
+    write_uvarint(out, len(fields))
+    for tag in sorted(fields):
+        write_uvarint(out, tag)
+        write_uvarint(out, len(fields[tag]))
+        out += fields[tag]
+
+
+class ResponseWriter(Encoded):
+    # a whole frame; the generated encoders append to it directly after the header
+
+    def __init__(self):
+        # the message size is only known at the end, so its slot is reserved up front
+        super().__init__(bytes(SIZE_PREFIX_LENGTH))
+
+    def header(self, correlation_id: int, flexible: bool) -> Self:
+        self.uint32(correlation_id)
+        if flexible:
+            self.tagged_fields()
+        return self
+
+    def int8(self, value: int) -> Self:
+        self.extend(INT8.pack(value))
+        return self
+
+    def boolean(self, value: bool) -> Self:
+        return self.int8(1 if value else 0)
+
+    def int16(self, value: int) -> Self:
+        self.extend(INT16.pack(value))
+        return self
+
+    def int32(self, value: int) -> Self:
+        self.extend(INT32.pack(value))
+        return self
+
+    def uint32(self, value: int) -> Self:
+        self.extend(UINT32.pack(value))
+        return self
+
+    def int64(self, value: int) -> Self:
+        self.extend(INT64.pack(value))
+        return self
+
+    def uuid(self, value: uuid.UUID) -> Self:
+        return self.raw(value.bytes)
+
+    def raw(self, data: bytes | bytearray | memoryview) -> Self:
+        self.extend(data)
+        return self
+
+    def unsigned_varint(self, value: int) -> Self:
+        write_uvarint(self, value)
+        return self
+
+    def varint(self, value: int) -> Self:
+        return self.unsigned_varint((value << 1) ^ (value >> 63))
+
+    def string(self, value: Optional[str]) -> Self:
+        write_string(self, value)
+        return self
+
+    def compact_string(self, value: Optional[str]) -> Self:
+        write_compact_string(self, value)
+        return self
+
+    def compact_bytes(self, value: Optional[bytes | memoryview]) -> Self:
+        write_compact_bytes(self, value)
+        return self
+
+    def byte_array(self, value: Optional[bytes | memoryview]) -> Self:
+        write_bytes(self, value)
+        return self
+
+    def array_length(self, length: Optional[int]) -> Self:
+        return self.int32(-1 if length is None else length)
+
+    def compact_array_length(self, length: Optional[int]) -> Self:
+        return self.unsigned_varint(0 if length is None else length + 1)
+
+    def tagged_fields(self, fields: Optional[dict[int, bytes]] = None) -> Self:
+        write_tagged_fields(self, fields or {})
+        return self
+
+    def file_region(self, region: FileRegion) -> Self:
+        # the bytes are never copied in; they are counted in the size prefix and sent from the file later
+        self.regions.append((len(self), region))
+        return self
+
+    def finish(self) -> memoryview | list[memoryview | FileRegion]:
+        region_bytes = sum(region.count for _, region in self.regions)
+        UINT32.pack_into(self, 0, len(self) - SIZE_PREFIX_LENGTH + region_bytes)
+        view = memoryview(self)
+        if not self.regions:
+            return view
+        parts = []
+        start = 0
+        for position, region in self.regions:
+            if position > start:
+                parts.append(view[start:position])
+            parts.append(region)
+            start = position
+        if start < len(self):
+            parts.append(view[start:])
+        return parts
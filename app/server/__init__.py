@@ -1 +1,3 @@
 ENCODING = "utf-8"
+HOST = "localhost"
+PORT = 9092
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import time
+from functools import partial
+from typing import Callable
+
+from app.protocol.request import KafkaResponse
+from app.server import HOST, PORT, metrics
+from app.server.framing import DEFAULT_CAPACITY, FrameReader
+from app.server.server_args import ServerArguments
+from app.server.transport import write_response
+
+logger = logging.getLogger(__name__)
+
+Responder = Callable[[bytes, ServerArguments, int], KafkaResponse]
+Offload = Callable[[memoryview], bool]
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, server_args: ServerArguments,
+                            respond: Responder, offload: Offload) -> None:
+    loop = asyncio.get_running_loop()
+    frame_reader = FrameReader()
+    try:
+        while data := await reader.read(DEFAULT_CAPACITY):
+            frame_reader.feed(data)
+            received = time.perf_counter_ns()
+            # frames pipelined in one read queue behind each other, and nothing is fed until they are answered
+            for msg in frame_reader.frames():
+                await respond_to(writer, msg, server_args, respond, offload, loop, received)
+    except ConnectionError:
+        pass
+    except Exception as e:
+        # failed requests are logged by the responder, the connection is dropped either way
+        logger.debug("closing connection: %r", e)
+    finally:
+        writer.close()
+
+
+async def respond_to(writer: asyncio.StreamWriter, msg: memoryview, server_args: ServerArguments,
+                     respond: Responder, offload: Offload, loop: asyncio.AbstractEventLoop, received: int) -> None:
+    if offload(msg):
+        # anything that may touch the disk would stall every other connection on this loop
+        response = await loop.run_in_executor(None, respond, msg, server_args, received)
+    else:
+        response = respond(msg, server_args, received)
+    body = response.body if response.delayed is None else await asyncio.wrap_future(response.delayed)
+    if body is not None:
+        started = time.perf_counter_ns()
+        await write_response(writer, body)
+        metrics.METRICS.api(metrics.api_key_of(msg)).sent(metrics.response_size(body),
+                                                          time.perf_counter_ns() - started)
+    if response.throttle_time_ms:
+        # muted: nothing more is read from a throttled client until its throttle time is over
+        await asyncio.sleep(response.throttle_time_ms / 1000)
+
+
+async def serve(server_args: ServerArguments, respond: Responder, offload: Offload = lambda msg: False) -> None:
+    # all connections share this one loop, so idle clients cost a few KB instead of a thread each
+    server = await asyncio.start_server(partial(handle_connection, server_args=server_args, respond=respond,
+                                                offload=offload), HOST, PORT, reuse_port=True)
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,60 @@
+import socket
+from typing import Iterator
+
+SIZE_PREFIX_LENGTH = 4
+DEFAULT_CAPACITY = 64 * 1024
+MAX_FRAME_SIZE = 100 * 1024 * 1024
+
+
+class FrameReader:
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+    def recv_into(self, accepted_socket: socket.socket) -> int:
+        self._make_room()
+        n = accepted_socket.recv_into(self.view[self.end:])
+        self.end += n
+        return n
+
+    def feed(self, data: bytes) -> None:
+        self._reserve(len(data))
+        self._make_room(len(data))
+        self.view[self.end: self.end + len(data)] = data
+        self.end += len(data)
+
+    def frames(self) -> Iterator[memoryview]:
+        # a frame stays valid until the next recv_into/feed, which is when its bytes may get overwritten
+        while self.end - self.start >= SIZE_PREFIX_LENGTH:
+            message_size = int.from_bytes(self.view[self.start: self.start + SIZE_PREFIX_LENGTH], "big")
+            if message_size > MAX_FRAME_SIZE:
+                raise ValueError(f"frame of {message_size} bytes exceeds {MAX_FRAME_SIZE}")
+            frame_end = self.start + SIZE_PREFIX_LENGTH + message_size
+            if frame_end > self.end:
+                self._reserve(SIZE_PREFIX_LENGTH + message_size)
+                return
+            yield self.view[self.start: frame_end]
+            self.start = frame_end
+
+    def _reserve(self, n: int) -> None:
+        pending = self.end - self.start
+        if pending + n <= len(self.buffer):
+            return
+        buffer = bytearray(max(pending + n, 2 * len(self.buffer)))
+        buffer[0:pending] = self.view[self.start: self.end]
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.start = 0
+        self.end = pending
+
+    def _make_room(self, n: int = 1) -> None:
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end + n > len(self.buffer) or self.start > len(self.buffer) // 2:
+            pending = bytes(self.view[self.start: self.end])
+            self.view[0: len(pending)] = pending
+            self.start = 0
+            self.end = len(pending)
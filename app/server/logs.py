@@ -0,0 +1,53 @@
+import logging
+import sys
+import threading
+import time
+
+from app.server.server_args import ServerArguments
+
+DEFAULT_LEVEL = "INFO"
+DEFAULT_MESSAGES_PER_SECOND = 10.0
+FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    # a token bucket per message template, so a failure repeating on every request logs a few lines per second
+    # and a count of what was dropped instead of one line per request
+
+    def __init__(self, messages_per_second: float = DEFAULT_MESSAGES_PER_SECOND, clock=time.monotonic):
+        super().__init__()
+        self.rate = messages_per_second
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.buckets: dict[tuple[str, object], list[float]] = {}
+        self.suppressed: dict[tuple[str, object], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0:
+            return True
+        key = (record.name, record.msg)
+        now = self.clock()
+        with self.lock:
+            tokens, last = self.buckets.get(key, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self.buckets[key] = [tokens, now]
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+            self.buckets[key] = [tokens - 1, now]
+            suppressed = self.suppressed.pop(key, 0)
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+def configure(server_args: ServerArguments) -> None:
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    handler.addFilter(RateLimitFilter(float(server_args.properties.get("log.rate.limit.per.second",
+                                                                       DEFAULT_MESSAGES_PER_SECOND))))
+    root = logging.getLogger("app")
+    root.setLevel(server_args.properties.get("log.level", DEFAULT_LEVEL).upper())
+    root.handlers[:] = [handler]
+    root.propagate = False
@@ -0,0 +1,174 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from app.protocol.writer import FileRegion, ResponseBody
+from app.server import HOST
+from app.server.server_args import ServerArguments
+
+# 2**5 sub-buckets per power of two keeps every recorded value within ~3% of its bucket, like HdrHistogram
+# with two significant digits
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# microseconds up to 2**40, a bit over twelve days
+MAX_VALUE_BITS = 40
+QUANTILES = (0.5, 0.99, 0.999)
+
+
+def bucket_index(value: int) -> int:
+    # values below 2 * SUB_BUCKETS get a bucket each, above that each power of two is split SUB_BUCKETS ways
+    if value < 2 * SUB_BUCKETS:
+        return max(value, 0)
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return shift * SUB_BUCKETS + (value >> shift)
+
+
+def bucket_value(index: int) -> int:
+    # the largest value that lands in the bucket
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift, mantissa = divmod(index - SUB_BUCKETS, SUB_BUCKETS)
+    return ((mantissa + SUB_BUCKETS + 1) << shift) - 1
+
+
+class Histogram:
+    # not locked itself, ApiMetrics records under its own lock
+
+    def __init__(self):
+        self.counts = [0] * (bucket_index((1 << MAX_VALUE_BITS) - 1) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        value = min(max(value, 0), (1 << MAX_VALUE_BITS) - 1)
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, quantile: float) -> int:
+        if not self.count:
+            return 0
+        rank = max(int(quantile * self.count + 0.5), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_value(index), self.max)
+        return self.max
+
+
+class ApiMetrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # microseconds a frame waited to be handled, spent in its handler and spent being written out
+        self.queue_time = Histogram()
+        self.handle_time = Histogram()
+        self.send_time = Histogram()
+
+    def received(self, size: int, queue_ns: Optional[int]) -> None:
+        with self.lock:
+            self.requests += 1
+            self.bytes_in += size
+            if queue_ns is not None:
+                self.queue_time.record(queue_ns // 1000)
+
+    def handled(self, handle_ns: int, failed: bool) -> None:
+        with self.lock:
+            self.handle_time.record(handle_ns // 1000)
+            if failed:
+                self.errors += 1
+
+    def sent(self, size: int, send_ns: int) -> None:
+        with self.lock:
+            self.bytes_out += size
+            self.send_time.record(send_ns // 1000)
+
+
+class Metrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.apis: dict[int, ApiMetrics] = {}
+        self.api_names: dict[int, str] = {}
+        # sampled when rendered, such as the depth of the request queue
+        self.gauges: dict[str, Callable[[], int]] = {}
+
+    def api(self, api_key: int) -> ApiMetrics:
+        api = self.apis.get(api_key)
+        if api is None:
+            with self.lock:
+                api = self.apis.setdefault(api_key, ApiMetrics())
+        return api
+
+    def render(self) -> str:
+        lines = []
+        for api_key in sorted(self.apis):
+            api = self.apis[api_key]
+            labels = f'api_key="{api_key}",api="{self.api_names.get(api_key, "UNKNOWN")}"'
+            with api.lock:
+                lines.append(f"kafka_requests_total{{{labels}}} {api.requests}")
+                lines.append(f"kafka_request_errors_total{{{labels}}} {api.errors}")
+                lines.append(f"kafka_request_bytes_in_total{{{labels}}} {api.bytes_in}")
+                lines.append(f"kafka_response_bytes_out_total{{{labels}}} {api.bytes_out}")
+                for name, histogram in (("queue", api.queue_time), ("handle", api.handle_time),
+                                        ("send", api.send_time)):
+                    metric = f"kafka_request_{name}_time_us"
+                    for quantile in QUANTILES:
+                        lines.append(f'{metric}{{{labels},quantile="{quantile}"}} {histogram.quantile(quantile)}')
+                    lines.append(f"{metric}_max{{{labels}}} {histogram.max}")
+                    lines.append(f"{metric}_sum{{{labels}}} {histogram.total}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        for name, gauge in sorted(self.gauges.items()):
+            lines.append(f"{name} {gauge()}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def api_key_of(frame: bytes | memoryview) -> int:
+    # frames still carry their size prefix
+    return int.from_bytes(frame[4:6], "big")
+
+
+def response_size(body: ResponseBody) -> int:
+    if not isinstance(body, list):
+        return len(body)
+    return sum(part.count if isinstance(part, FileRegion) else len(part) for part in body)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self) -> None:
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = METRICS.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # every scrape would otherwise write a line to stderr
+        pass
+
+
+def start_endpoint(server_args: ServerArguments) -> Optional[ThreadingHTTPServer]:
+    # off unless metrics.port is set (Prometheus' usual one for Kafka is 9404); only served on localhost, worker n
+    # listens on metrics.port + n
+    port = server_args.int_property("metrics.port", -1)
+    if port < 0:
+        return None
+    server = ThreadingHTTPServer((HOST, port + server_args.worker_number), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
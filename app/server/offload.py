@@ -0,0 +1,21 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from app.server.server_args import ServerArguments
+
+# zlib and the optional codec libraries release the GIL, so these threads compress in parallel
+DEFAULT_COMPRESSION_THREADS = os.cpu_count() or 1
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(server_args: ServerArguments) -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(server_args.int_property("compression.threads", DEFAULT_COMPRESSION_THREADS),
+                                           thread_name_prefix="compression")
+        return _executor
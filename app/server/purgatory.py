@@ -0,0 +1,138 @@
+import abc
+import threading
+from concurrent.futures import Future
+from typing import Hashable, Iterable, Optional
+
+from app.protocol.writer import ResponseBody
+from app.server import metrics
+from app.server.timer import Timer, TimerTask
+
+# completed operations that may still sit in the watch lists of keys nobody checked since
+DEFAULT_PURGE_INTERVAL = 1000
+
+
+class DelayedOperation(abc.ABC):
+    # a request that is answered once its condition holds or its delay runs out, whichever comes first
+
+    def __init__(self, delay_ms: int):
+        self.delay_ms = delay_ms
+        self.response: Future[ResponseBody] = Future()
+        self.timer_task: Optional[TimerTask] = None
+        # reentrant: try_complete calls force_complete while holding it
+        self.lock = threading.RLock()
+        self.completed = False
+
+    @abc.abstractmethod
+    def try_complete(self) -> bool:
+        # checks the condition and calls force_complete if it holds
+        ...
+
+    @abc.abstractmethod
+    def on_complete(self) -> ResponseBody:
+        ...
+
+    def on_expiration(self) -> None:
+        pass
+
+    def force_complete(self) -> bool:
+        # only the first caller completes the operation, be it a watcher, the timer or the handler itself
+        with self.lock:
+            if self.completed:
+                return False
+            self.completed = True
+        if self.timer_task is not None:
+            self.timer_task.cancel()
+        try:
+            self.response.set_result(self.on_complete())
+        except Exception as e:
+            self.response.set_exception(e)
+        return True
+
+    def maybe_try_complete(self) -> bool:
+        with self.lock:
+            return not self.completed and self.try_complete()
+
+    def expire(self) -> None:
+        if self.force_complete():
+            self.on_expiration()
+
+
+class DelayedOperationPurgatory:
+    # operations wait under every key they depend on until check_and_complete is called for one of them or their
+    # delay runs out on the timing wheel
+
+    def __init__(self, name: str, purge_interval: int = DEFAULT_PURGE_INTERVAL, timer: Optional[Timer] = None):
+        self.name = name
+        self.purge_interval = purge_interval
+        self.timer = timer or Timer(f"{name}-purgatory")
+        self.lock = threading.Lock()
+        self.watchers: dict[Hashable, list[DelayedOperation]] = {}
+        # entries in the watch lists, and those of them whose operation has not completed yet
+        self.watched = 0
+        self.live = 0
+        metrics.METRICS.gauges[f"kafka_purgatory_{name}_size"] = lambda: self.delayed
+
+    @property
+    def delayed(self) -> int:
+        return self.timer.size
+
+    def try_complete_else_watch(self, operation: DelayedOperation, keys: Iterable[Hashable]) -> bool:
+        # True if the operation completed right away; otherwise its response future resolves later
+        if operation.maybe_try_complete():
+            return True
+        keys = list(keys)
+        with self.lock:
+            for key in keys:
+                self.watchers.setdefault(key, []).append(operation)
+            self.watched += len(keys)
+            self.live += len(keys)
+        operation.response.add_done_callback(lambda _: self._completed(len(keys)))
+        # whatever changed while it was being watched may have woken nobody
+        if operation.maybe_try_complete():
+            return True
+        operation.timer_task = TimerTask(operation.delay_ms, operation.expire)
+        self.timer.add(operation.timer_task)
+        if operation.completed:
+            operation.timer_task.cancel()
+        # a purge walks every list, so it waits until at least as many entries are stale as live
+        if self.watched - self.live > max(self.purge_interval, self.live):
+            self.purge_completed()
+        return operation.completed
+
+    def check_and_complete(self, key: Hashable) -> int:
+        with self.lock:
+            operations = list(self.watchers.get(key, ()))
+        if not operations:
+            return 0
+        completed = sum(operation.maybe_try_complete() for operation in operations)
+        with self.lock:
+            # the list may have grown meanwhile, and whatever completed under another key goes as well
+            waiting = [x for x in self.watchers.get(key, ()) if not x.completed]
+            self.watched -= len(self.watchers.get(key, ())) - len(waiting)
+            if waiting:
+                self.watchers[key] = waiting
+            else:
+                self.watchers.pop(key, None)
+        return completed
+
+    def _completed(self, keys: int) -> None:
+        with self.lock:
+            self.live -= keys
+
+    def watching(self, key: Hashable) -> int:
+        with self.lock:
+            return sum(not x.completed for x in self.watchers.get(key, ()))
+
+    def purge_completed(self) -> int:
+        # operations that expired are still listed under keys nobody has checked since
+        with self.lock:
+            purged = 0
+            for key in list(self.watchers):
+                waiting = [x for x in self.watchers[key] if not x.completed]
+                purged += len(self.watchers[key]) - len(waiting)
+                if waiting:
+                    self.watchers[key] = waiting
+                else:
+                    del self.watchers[key]
+            self.watched -= purged
+            return purged
@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from app.server.server_args import ServerArguments
+
+logger = logging.getLogger(__name__)
+
+# Kafka's quota.window.num and quota.window.size.seconds
+DEFAULT_WINDOW_SAMPLES = 11
+DEFAULT_WINDOW_SECONDS = 1
+REQUEST_RATE = "request.rate"
+BYTE_RATE = "byte.rate"
+# quota.request.rate and quota.byte.rate apply to every client id, quota.client.<client id>.<quota> to one
+QUOTA_PREFIX = "quota."
+CLIENT_PREFIX = "quota.client."
+# clients without an id share one set of windows
+NO_CLIENT_ID = ""
+
+
+class SlidingWindow:
+    # a rate over the last `samples` fixed-size windows, the one being filled included, like Kafka's Rate stat
+
+    def __init__(self, samples: int, sample_ms: int):
+        self.sample_ms = sample_ms
+        self.starts = [-sample_ms * samples] * samples
+        self.values = [0.0] * samples
+
+    def record(self, value: float, now_ms: int) -> None:
+        start = now_ms - now_ms % self.sample_ms
+        slot = start // self.sample_ms % len(self.values)
+        if self.starts[slot] != start:
+            # the slot still holds a sample that fell out of the window
+            self.starts[slot] = start
+            self.values[slot] = 0.0
+        self.values[slot] += value
+
+    def measure(self, now_ms: int) -> tuple[float, int]:
+        # the total of the samples still in the window and the time they cover
+        oldest_valid = now_ms - self.sample_ms * len(self.values)
+        total = 0.0
+        oldest = now_ms
+        for start, value in zip(self.starts, self.values):
+            if start > oldest_valid:
+                total += value
+                oldest = min(oldest, start)
+        # a new client's first burst is spread over almost the whole window instead of the few ms it has been around
+        return total, max(now_ms - oldest, self.sample_ms * (len(self.values) - 1), 1)
+
+    def rate(self, now_ms: int) -> float:
+        # per second
+        total, window_ms = self.measure(now_ms)
+        return total * 1000 / window_ms
+
+    def throttle_ms(self, bound: float, now_ms: int) -> int:
+        # how long the client has to stay quiet for its rate over the window to drop back to the bound
+        total, window_ms = self.measure(now_ms)
+        rate = total * 1000 / window_ms
+        if rate <= bound:
+            return 0
+        return min(int((rate - bound) / bound * window_ms), self.sample_ms * len(self.values))
+
+
+@dataclass
+class ClientQuota:
+    request_rate: Optional[float] = None
+    byte_rate: Optional[float] = None
+
+
+@dataclass
+class ClientWindows:
+    requests: SlidingWindow
+    bytes: SlidingWindow
+    last_used_ms: int
+
+
+class QuotaManager:
+
+    def __init__(self, default: ClientQuota, overrides: dict[str, ClientQuota],
+                 samples: int = DEFAULT_WINDOW_SAMPLES, sample_ms: int = DEFAULT_WINDOW_SECONDS * 1000):
+        self.default = default
+        self.overrides = overrides
+        self.samples = samples
+        self.sample_ms = sample_ms
+        self.lock = threading.Lock()
+        self.clients: dict[str, ClientWindows] = {}
+        self.purged_ms = 0
+
+    @classmethod
+    def of(cls, server_args: ServerArguments) -> Optional["QuotaManager"]:
+        default = ClientQuota()
+        overrides: dict[str, ClientQuota] = {}
+        for name, value in server_args.properties.items():
+            for quota in (REQUEST_RATE, BYTE_RATE):
+                if name == QUOTA_PREFIX + quota:
+                    setattr(default, quota.replace(".", "_"), float(value))
+                elif name.startswith(CLIENT_PREFIX) and name.endswith("." + quota):
+                    client_id = name[len(CLIENT_PREFIX):-len(quota) - 1]
+                    setattr(overrides.setdefault(client_id, ClientQuota()), quota.replace(".", "_"), float(value))
+        if default == ClientQuota() and not overrides:
+            return None
+        return QuotaManager(default, overrides, server_args.int_property("quota.window.num", DEFAULT_WINDOW_SAMPLES),
+                            server_args.int_property("quota.window.size.seconds", DEFAULT_WINDOW_SECONDS) * 1000)
+
+    def quota(self, client_id: str) -> ClientQuota:
+        override = self.overrides.get(client_id)
+        if override is None:
+            return self.default
+        return ClientQuota(override.request_rate if override.request_rate is not None else self.default.request_rate,
+                           override.byte_rate if override.byte_rate is not None else self.default.byte_rate)
+
+    def record_request(self, client_id: Optional[str], size: int, now_ms: Optional[int] = None) -> int:
+        # counts a request and its bytes, then returns how long the client is throttled for
+        now_ms = _now_ms() if now_ms is None else now_ms
+        client_id = client_id or NO_CLIENT_ID
+        quota = self.quota(client_id)
+        with self.lock:
+            windows = self._windows(client_id, now_ms)
+            windows.requests.record(1, now_ms)
+            windows.bytes.record(size, now_ms)
+            throttle_ms = 0
+            if quota.request_rate is not None:
+                throttle_ms = windows.requests.throttle_ms(quota.request_rate, now_ms)
+            if quota.byte_rate is not None:
+                throttle_ms = max(throttle_ms, windows.bytes.throttle_ms(quota.byte_rate, now_ms))
+        if throttle_ms:
+            logger.debug("throttling client %r for %d ms", client_id, throttle_ms)
+        return throttle_ms
+
+    def record_response(self, client_id: Optional[str], size: int, now_ms: Optional[int] = None) -> None:
+        # responses count against the byte rate of the client's next requests
+        now_ms = _now_ms() if now_ms is None else now_ms
+        with self.lock:
+            self._windows(client_id or NO_CLIENT_ID, now_ms).bytes.record(size, now_ms)
+
+    def _windows(self, client_id: str, now_ms: int) -> ClientWindows:
+        window_ms = self.samples * self.sample_ms
+        if now_ms - self.purged_ms > window_ms:
+            # client ids are picked by clients, so drop the ones that went quiet for a whole window
+            self.clients = {k: v for k, v in self.clients.items() if now_ms - v.last_used_ms <= window_ms}
+            self.purged_ms = now_ms
+        windows = self.clients.get(client_id)
+        if windows is None:
+            windows = self.clients[client_id] = ClientWindows(SlidingWindow(self.samples, self.sample_ms),
+                                                              SlidingWindow(self.samples, self.sample_ms), now_ms)
+        windows.last_used_ms = now_ms
+        return windows
+
+
+def _now_ms() -> int:
+    return time.monotonic_ns() // 1_000_000
+
+
+_manager: Optional[QuotaManager] = None
+_manager_loaded = False
+_manager_lock = threading.Lock()
+
+
+def get_quota_manager(server_args: ServerArguments) -> Optional[QuotaManager]:
+    # None when no quota is configured, which keeps the accounting off the request path
+    global _manager, _manager_loaded
+    if not _manager_loaded:
+        with _manager_lock:
+            if not _manager_loaded:
+                _manager = QuotaManager.of(server_args)
+                _manager_loaded = True
+    return _manager
@@ -1,7 +1,73 @@
+import argparse
 import pathlib
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Optional, Self
+
+DEFAULT_LOG_DIR = "/tmp/kraft-combined-logs"
+METADATA_LOG_NAME = "__cluster_metadata-0/00000000000000000000.log"
+
+
+class ServerMode(Enum):
+    # a thread per connection, which blocks on delayed responses, see app.main.handle_request
+    THREADED = "threaded"
+    # network threads frame requests for a fixed pool of handler threads, see app.server.socket_server
+    POOLED = "pooled"
+    ASYNCIO = "asyncio"
+
+
+def read_properties(path: pathlib.Path) -> dict[str, str]:
+    properties = {}
+    try:
+        lines = path.read_text().splitlines()
+    except OSError:
+        return properties
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(("#", "!")) or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        properties[key.strip()] = value.strip()
+    return properties
 
 
 @dataclass()
 class ServerArguments:
     properties_path: pathlib.Path
+    mode: ServerMode = ServerMode.THREADED
+    properties: dict[str, str] = field(default_factory=dict)
+    mmap_metadata: bool = False
+    workers: int = 1
+    # set for worker processes, which read metadata from the leader's snapshot instead of the log
+    metadata_snapshot_path: Optional[pathlib.Path] = None
+    worker_number: int = 0
+
+    def int_property(self, name: str, default: int) -> int:
+        return int(self.properties.get(name, default))
+
+    @property
+    def log_dir(self) -> pathlib.Path:
+        return pathlib.Path(self.properties.get("log.dirs", DEFAULT_LOG_DIR).split(",")[0])
+
+    @property
+    def metadata_log_path(self) -> pathlib.Path:
+        return self.log_dir / METADATA_LOG_NAME
+
+    @classmethod
+    def of(cls, argv: list[str]) -> Self:
+        parser = argparse.ArgumentParser(prog="app.main")
+        parser.add_argument("properties_path", type=pathlib.Path)
+        parser.add_argument("--mode", choices=[x.value for x in ServerMode], default=ServerMode.THREADED.value,
+                            help="threaded runs a thread per connection, and a long poll (a fetch with max_wait_ms, a "
+                                 "produce with acks=-1) parks that thread and the connection's later requests until "
+                                 "it completes; pooled and asyncio wait without a thread, use them for many waiting "
+                                 "clients")
+        parser.add_argument("--mmap-metadata", action="store_true",
+                            help="map the metadata log and decode records only when they are looked up")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="fork this many processes that all accept on the port")
+        args = parser.parse_args(argv)
+        if args.workers < 1:
+            parser.error("--workers must be at least 1")
+        return ServerArguments(args.properties_path, ServerMode(args.mode), read_properties(args.properties_path),
+                               args.mmap_metadata, args.workers)
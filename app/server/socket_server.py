@@ -0,0 +1,327 @@
+import heapq
+import itertools
+import logging
+import os
+import queue
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+from functools import partial
+from typing import Iterator, Optional
+
+from app.protocol.request import KafkaResponse
+from app.protocol.writer import FileRegion
+from app.server import HOST, PORT, metrics
+from app.server.async_server import Responder
+from app.server.framing import FrameReader
+from app.server.server_args import ServerArguments
+
+logger = logging.getLogger(__name__)
+
+# Kafka's num.network.threads, num.io.threads and queued.max.requests
+DEFAULT_NETWORK_THREADS = 3
+DEFAULT_HANDLER_THREADS = 8
+DEFAULT_QUEUED_MAX_REQUESTS = 500
+# what a handler answers when the request failed and its connection has to go
+CLOSE = object()
+
+
+class Connection:
+
+    def __init__(self, accepted_socket: socket.socket):
+        self.socket = accepted_socket
+        self.reader = FrameReader()
+        self.frames: Optional[Iterator[memoryview]] = None
+        # muted from the moment a request is queued until its response is written: the requests of one connection
+        # are handled one at a time and answered in order, and nothing is read meanwhile, so the frame a handler
+        # holds stays valid
+        self.muted = False
+        self.events = 0
+        self.outgoing: deque[memoryview | FileRegion] = deque()
+        self.frame: Optional[memoryview] = None
+        self.response_size = 0
+        self.send_started = 0
+        self.throttle_time_ms = 0
+        self.closed = False
+
+
+@dataclass(slots=True)
+class Request:
+    processor: "Processor"
+    connection: Connection
+    frame: memoryview
+    enqueued_ns: int
+
+
+class Processor(threading.Thread):
+    # a network thread: reads and frames requests from its connections and writes their responses back, but
+    # never runs a handler
+
+    def __init__(self, number: int, requests: queue.Queue):
+        super().__init__(name=f"network-{number}", daemon=True)
+        self.requests = requests
+        self.selector = selectors.DefaultSelector()
+        self.new_connections: queue.SimpleQueue[socket.socket] = queue.SimpleQueue()
+        self.responses: queue.SimpleQueue[tuple[Connection, object]] = queue.SimpleQueue()
+        # (unmute at, tie breaker, connection) of throttled connections
+        self.throttled: list[tuple[float, int, Connection]] = []
+        self.throttled_count = itertools.count()
+        self.waker, self.wake_end = socket.socketpair()
+        self.waker.setblocking(False)
+        self.wake_end.setblocking(False)
+        self.selector.register(self.waker, selectors.EVENT_READ)
+
+    def accept(self, accepted_socket: socket.socket) -> None:
+        accepted_socket.setblocking(False)
+        self.new_connections.put(accepted_socket)
+        self.wakeup()
+
+    def send_response(self, connection: Connection, response: KafkaResponse | object) -> None:
+        # called from handler threads
+        self.responses.put((connection, response))
+        self.wakeup()
+
+    def wakeup(self) -> None:
+        try:
+            self.wake_end.send(b"\0")
+        except BlockingIOError:
+            # the pipe is full of wakeups already
+            pass
+
+    def run(self) -> None:
+        while True:
+            timeout = max(self.throttled[0][0] - time.monotonic(), 0) if self.throttled else None
+            for key, mask in self.selector.select(timeout):
+                if key.data is None:
+                    self._drain_wakeups()
+                    continue
+                connection = key.data
+                try:
+                    if mask & selectors.EVENT_WRITE:
+                        self.write(connection)
+                    if mask & selectors.EVENT_READ and not connection.closed:
+                        self.read(connection)
+                except Exception as e:
+                    # failed requests are logged by the responder, the connection is dropped either way
+                    logger.debug("closing connection: %r", e)
+                    self.close(connection)
+            self._register_new_connections()
+            self._complete_responses()
+            self._unmute_throttled()
+
+    def read(self, connection: Connection) -> None:
+        try:
+            if not connection.reader.recv_into(connection.socket):
+                self.close(connection)
+                return
+        except BlockingIOError:
+            return
+        connection.frames = connection.reader.frames()
+        self.next_request(connection)
+
+    def next_request(self, connection: Connection) -> None:
+        frame = next(connection.frames, None) if connection.frames is not None else None
+        if frame is None:
+            connection.frames = None
+            self._update_interest(connection)
+            return
+        connection.muted = True
+        connection.frame = frame
+        self._update_interest(connection)
+        # blocks while the queue is full, which stops this thread from reading more, like Kafka's processors
+        self.requests.put(Request(self, connection, frame, time.perf_counter_ns()))
+
+    def write(self, connection: Connection) -> None:
+        while connection.outgoing:
+            part = connection.outgoing[0]
+            try:
+                if isinstance(part, FileRegion):
+                    sent = os.sendfile(connection.socket.fileno(), part.file.fileno(), part.offset, part.count)
+                    if sent == 0:
+                        raise ConnectionError(f"{part.file.name} ended before {part.count} bytes at {part.offset}")
+                    remaining = FileRegion(part.file, part.offset + sent, part.count - sent) if sent < part.count \
+                        else None
+                else:
+                    sent = connection.socket.send(part)
+                    remaining = part[sent:] if sent < len(part) else None
+            except BlockingIOError:
+                self._update_interest(connection)
+                return
+            if remaining is None:
+                connection.outgoing.popleft()
+            else:
+                connection.outgoing[0] = remaining
+        metrics.METRICS.api(metrics.api_key_of(connection.frame)).sent(
+            connection.response_size, time.perf_counter_ns() - connection.send_started)
+        self._response_done(connection)
+
+    def close(self, connection: Connection) -> None:
+        if connection.closed:
+            return
+        connection.closed = True
+        connection.outgoing.clear()
+        if connection.events:
+            self.selector.unregister(connection.socket)
+        connection.socket.close()
+
+    def _response_done(self, connection: Connection) -> None:
+        if connection.throttle_time_ms:
+            # a throttled connection stays muted for its throttle time, like Kafka's quota managers
+            heapq.heappush(self.throttled, (time.monotonic() + connection.throttle_time_ms / 1000,
+                                            next(self.throttled_count), connection))
+            self._update_interest(connection)
+            return
+        self._unmute(connection)
+
+    def _unmute_throttled(self) -> None:
+        now = time.monotonic()
+        while self.throttled and self.throttled[0][0] <= now:
+            connection = heapq.heappop(self.throttled)[2]
+            if not connection.closed:
+                self._unmute(connection)
+
+    def _unmute(self, connection: Connection) -> None:
+        connection.muted = False
+        connection.frame = None
+        # pipelined requests that were read along with the last one go next
+        self.next_request(connection)
+
+    def _complete_responses(self) -> None:
+        while True:
+            try:
+                connection, response = self.responses.get_nowait()
+            except queue.Empty:
+                return
+            if connection.closed:
+                continue
+            try:
+                if response is CLOSE:
+                    self.close(connection)
+                    continue
+                connection.throttle_time_ms = response.throttle_time_ms
+                body = response.body
+                if body is None:
+                    self._response_done(connection)
+                else:
+                    connection.outgoing.extend(body if isinstance(body, list) else [memoryview(body)])
+                    connection.response_size = metrics.response_size(body)
+                    connection.send_started = time.perf_counter_ns()
+                    self.write(connection)
+            except Exception as e:
+                logger.debug("closing connection: %r", e)
+                self.close(connection)
+
+    def _register_new_connections(self) -> None:
+        while True:
+            try:
+                accepted_socket = self.new_connections.get_nowait()
+            except queue.Empty:
+                return
+            self._update_interest(Connection(accepted_socket))
+
+    def _update_interest(self, connection: Connection) -> None:
+        events = (selectors.EVENT_WRITE if connection.outgoing else 0) | \
+                 (0 if connection.muted else selectors.EVENT_READ)
+        if events == connection.events:
+            return
+        if not connection.events:
+            self.selector.register(connection.socket, events, connection)
+        elif not events:
+            self.selector.unregister(connection.socket)
+        else:
+            self.selector.modify(connection.socket, events, connection)
+        connection.events = events
+
+    def _drain_wakeups(self) -> None:
+        try:
+            while self.waker.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+
+class RequestHandlerPool:
+    # a fixed number of threads that run the handlers of whatever the network threads queued
+
+    def __init__(self, requests: queue.Queue, respond: Responder, server_args: ServerArguments, threads: int):
+        self.requests = requests
+        self.respond = respond
+        self.server_args = server_args
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.threads = [threading.Thread(target=self.run, name=f"request-handler-{i}", daemon=True)
+                        for i in range(threads)]
+
+    def start(self) -> None:
+        for thread in self.threads:
+            thread.start()
+
+    def run(self) -> None:
+        while True:
+            request = self.requests.get()
+            with self.lock:
+                self.busy += 1
+            try:
+                # the time since the network thread queued the request is recorded as its queue time
+                response = self.respond(request.frame, self.server_args, request.enqueued_ns)
+            except Exception:
+                # the responder logged it
+                response = CLOSE
+            finally:
+                with self.lock:
+                    self.busy -= 1
+            if response is not CLOSE and response.delayed is not None:
+                # the purgatory sends it when the operation completes, this thread moves on meanwhile
+                response.delayed.add_done_callback(partial(self.send_delayed, request, response))
+                continue
+            request.processor.send_response(request.connection, response)
+
+    @staticmethod
+    def send_delayed(request: Request, response: KafkaResponse, delayed: Future) -> None:
+        try:
+            response = replace(response, body=delayed.result(), delayed=None)
+        except Exception as e:
+            logger.debug("delayed request failed: %r", e)
+            response = CLOSE
+        request.processor.send_response(request.connection, response)
+
+
+class SocketServer:
+
+    def __init__(self, server_args: ServerArguments, respond: Responder, host: str = HOST, port: int = PORT):
+        network_threads = server_args.int_property("num.network.threads", DEFAULT_NETWORK_THREADS)
+        handler_threads = server_args.int_property("num.io.threads", DEFAULT_HANDLER_THREADS)
+        if network_threads < 1 or handler_threads < 1:
+            raise ValueError("num.network.threads and num.io.threads must be at least 1")
+        # a request queue bounded at queued.max.requests applies backpressure to the network threads
+        self.requests: queue.Queue[Request] = queue.Queue(
+            server_args.int_property("queued.max.requests", DEFAULT_QUEUED_MAX_REQUESTS))
+        self.processors = [Processor(i, self.requests) for i in range(network_threads)]
+        self.handlers = RequestHandlerPool(self.requests, respond, server_args, handler_threads)
+        self.server_socket = socket.create_server((host, port), reuse_port=True)
+        metrics.METRICS.gauges["kafka_request_queue_size"] = self.requests.qsize
+        metrics.METRICS.gauges["kafka_request_handlers_busy"] = lambda: self.handlers.busy
+
+    @property
+    def port(self) -> int:
+        return self.server_socket.getsockname()[1]
+
+    def serve_forever(self) -> None:
+        for processor in self.processors:
+            processor.start()
+        self.handlers.start()
+        # the accepting thread only deals connections out to the network threads
+        for processor in itertools.cycle(self.processors):
+            try:
+                accepted_socket, _ = self.server_socket.accept()
+            except OSError:
+                # shut down
+                return
+            processor.accept(accepted_socket)
+
+    def shutdown(self) -> None:
+        self.server_socket.close()
@@ -0,0 +1,33 @@
+from unittest import TestCase
+
+import framing
+
+
+def frame(payload: bytes) -> bytes:
+    return len(payload).to_bytes(4, "big") + payload
+
+
+class TestFrameReader(TestCase):
+    def test_pipelined_frames(self):
+        reader = framing.FrameReader()
+        reader.feed(frame(b"first") + frame(b"second") + frame(b"thi"))
+        frames = [bytes(x[4:]) for x in reader.frames()]
+        self.assertEqual([b"first", b"second", b"thi"], frames)
+
+    def test_split_frame(self):
+        reader = framing.FrameReader()
+        data = frame(b"payload") + frame(b"x")
+        reader.feed(data[:3])
+        self.assertEqual([], list(reader.frames()))
+        reader.feed(data[3:9])
+        self.assertEqual([], list(reader.frames()))
+        reader.feed(data[9:])
+        self.assertEqual([b"payload", b"x"], [bytes(x[4:]) for x in reader.frames()])
+
+    def test_frame_larger_than_buffer(self):
+        reader = framing.FrameReader(capacity=16)
+        payload = bytes(range(256)) * 4
+        data = frame(payload)
+        for i in range(0, len(data), 10):
+            reader.feed(data[i: i + 10])
+        self.assertEqual([payload], [bytes(x[4:]) for x in reader.frames()])
@@ -0,0 +1,48 @@
+import logging
+from unittest import TestCase
+
+import logs
+import metrics
+
+
+class TestHistogram(TestCase):
+    def test_buckets_cover_every_value(self):
+        for value in list(range(200)) + [1000, 4095, 4096, 123456, (1 << 40) - 1]:
+            index = metrics.bucket_index(value)
+            self.assertLessEqual(value, metrics.bucket_value(index))
+            self.assertGreater(value, metrics.bucket_value(index - 1) if index else -1)
+
+    def test_quantiles_within_bucket_precision(self):
+        histogram = metrics.Histogram()
+        for value in range(1, 10001):
+            histogram.record(value)
+        for quantile, expected in ((0.5, 5000), (0.99, 9900), (0.999, 9990)):
+            self.assertAlmostEqual(expected, histogram.quantile(quantile), delta=expected / metrics.SUB_BUCKETS)
+        self.assertEqual(10000, histogram.quantile(1.0))
+        self.assertEqual(10000, histogram.count)
+
+    def test_render(self):
+        registry = metrics.Metrics()
+        registry.api_names[18] = "API_VERSION_REQUEST"
+        registry.api(18).received(30, 5000)
+        registry.api(18).handled(2000, failed=True)
+        text = registry.render()
+        self.assertIn('kafka_requests_total{api_key="18",api="API_VERSION_REQUEST"} 1', text)
+        self.assertIn('kafka_request_errors_total{api_key="18",api="API_VERSION_REQUEST"} 1', text)
+        self.assertIn('kafka_request_queue_time_us{api_key="18",api="API_VERSION_REQUEST",quantile="0.5"} 5', text)
+
+
+class TestRateLimitFilter(TestCase):
+    def test_suppresses_and_reports_repeats(self):
+        now = [0.0]
+        limiter = logs.RateLimitFilter(2, clock=lambda: now[0])
+
+        def record(message: str) -> logging.LogRecord:
+            return logging.LogRecord("app", logging.WARNING, __file__, 0, message, ("x",), None)
+
+        self.assertEqual([True, True, False, False], [limiter.filter(record("failed: %s")) for _ in range(4)])
+        self.assertTrue(limiter.filter(record("other %s")))
+        now[0] = 1.0
+        passed = record("failed: %s")
+        self.assertTrue(limiter.filter(passed))
+        self.assertEqual("failed: x (2 similar messages suppressed)", passed.getMessage())
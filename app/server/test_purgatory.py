@@ -0,0 +1,95 @@
+import threading
+from unittest import TestCase
+
+import purgatory
+from app.server.timer import Timer
+
+
+class Counter(purgatory.DelayedOperation):
+    # completes once its partition has seen enough appends
+    appends: dict = {}
+
+    def __init__(self, key, wanted: int, delay_ms: int):
+        super().__init__(delay_ms)
+        self.key = key
+        self.wanted = wanted
+        self.expired = False
+
+    def try_complete(self) -> bool:
+        return self.appends.get(self.key, 0) >= self.wanted and self.force_complete()
+
+    def on_complete(self) -> bytes:
+        return b"expired" if self.appends.get(self.key, 0) < self.wanted else b"done"
+
+    def on_expiration(self) -> None:
+        self.expired = True
+
+
+class TestPurgatory(TestCase):
+    def setUp(self):
+        Counter.appends = {}
+        self.purgatory = purgatory.DelayedOperationPurgatory("test")
+
+    def append(self, key) -> int:
+        Counter.appends[key] = Counter.appends.get(key, 0) + 1
+        return self.purgatory.check_and_complete(key)
+
+    def test_append_wakes_only_its_partition(self):
+        waiting = [Counter(("foo", x % 2), 1, 10_000) for x in range(6)]
+        for operation in waiting:
+            self.assertFalse(self.purgatory.try_complete_else_watch(operation, [operation.key]))
+        self.assertEqual(6, self.purgatory.delayed)
+        self.assertEqual(3, self.append(("foo", 1)))
+        self.assertEqual([False, True] * 3, [x.response.done() for x in waiting])
+        self.assertEqual(b"done", waiting[1].response.result())
+        self.assertEqual((3, 0, 3), (self.purgatory.delayed, self.purgatory.watching(("foo", 1)),
+                                     self.purgatory.watching(("foo", 0))))
+
+    def test_ready_operations_complete_without_waiting(self):
+        Counter.appends[("foo", 0)] = 1
+        operation = Counter(("foo", 0), 1, 10_000)
+        self.assertTrue(self.purgatory.try_complete_else_watch(operation, [operation.key]))
+        self.assertEqual(0, self.purgatory.delayed)
+
+    def test_expiration(self):
+        operation = Counter(("foo", 0), 1, 50)
+        self.purgatory.try_complete_else_watch(operation, [operation.key])
+        self.assertEqual(b"expired", operation.response.result(timeout=5))
+        self.assertTrue(operation.expired)
+        self.assertEqual(0, self.purgatory.delayed)
+        # an append after the deadline finds nothing left to complete
+        self.assertEqual(0, self.append(("foo", 0)))
+
+    def test_completes_exactly_once(self):
+        operation = Counter(("foo", 0), 1, 10_000)
+        self.purgatory.try_complete_else_watch(operation, [("foo", 0), ("bar", 0)])
+        Counter.appends[("foo", 0)] = 1
+        threads = [threading.Thread(target=self.purgatory.check_and_complete, args=(("foo", 0),)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(operation.response.done())
+        self.assertFalse(operation.force_complete())
+        self.assertFalse(operation.expired)
+
+    def test_many_outstanding_operations(self):
+        self.purgatory = purgatory.DelayedOperationPurgatory("test", purge_interval=100,
+                                                             timer=Timer("test", reaper=False))
+        waiting = [Counter(("foo", x % 250), 1, 60_000) for x in range(50_000)]
+        for operation in waiting:
+            self.purgatory.try_complete_else_watch(operation, [operation.key, ("bar", 0)])
+        self.assertEqual(50_000, self.purgatory.delayed)
+        self.assertEqual(200, self.append(("foo", 7)))
+        self.assertEqual(49_800, self.purgatory.delayed)
+        # the completed ones are still listed under ("bar", 0) until a purge
+        self.assertEqual(200, self.purgatory.purge_completed())
+        self.assertEqual(49_800, self.purgatory.watching(("bar", 0)))
+
+    def test_subclasses_must_define_completion(self):
+        class NoResponse(purgatory.DelayedOperation):
+            def try_complete(self) -> bool:
+                return False
+
+        with self.assertRaises(TypeError):
+            NoResponse(10)
@@ -0,0 +1,61 @@
+import pathlib
+from unittest import TestCase
+
+import quotas
+from app.server.server_args import ServerArguments
+
+
+class TestSlidingWindow(TestCase):
+    def test_rate_covers_the_live_samples(self):
+        window = quotas.SlidingWindow(samples=4, sample_ms=1000)
+        for second in range(4):
+            window.record(100, 10_000 + second * 1000)
+        self.assertAlmostEqual(400 / 3.5, window.rate(13_500))
+        # the first sample has dropped out
+        self.assertAlmostEqual(300 / 3, window.rate(14_000))
+        self.assertEqual(0, window.rate(20_000))
+
+    def test_throttle_brings_the_rate_back_to_the_bound(self):
+        window = quotas.SlidingWindow(samples=11, sample_ms=1000)
+        window.record(200, 50_000)
+        # 200 over the minimum 10 s window is 20/s, twice the bound, so it takes another 10 s to get back to it
+        self.assertEqual(10_000, window.throttle_ms(10, 50_000))
+        self.assertEqual(0, window.throttle_ms(20, 50_000))
+        # never longer than the whole window
+        self.assertEqual(11_000, window.throttle_ms(1, 50_000))
+
+
+class TestQuotaManager(TestCase):
+    def test_properties(self):
+        server_args = ServerArguments(pathlib.Path("unused"), properties={
+            "quota.request.rate": "50", "quota.client.loud.byte.rate": "1024",
+            "quota.client.with.dots.request.rate": "5", "quota.window.num": "3"})
+        manager = quotas.QuotaManager.of(server_args)
+        self.assertEqual(quotas.ClientQuota(50, None), manager.quota("quiet"))
+        self.assertEqual(quotas.ClientQuota(50, 1024), manager.quota("loud"))
+        self.assertEqual(quotas.ClientQuota(5, None), manager.quota("with.dots"))
+        self.assertEqual(3, manager.samples)
+        self.assertIsNone(quotas.QuotaManager.of(ServerArguments(pathlib.Path("unused"))))
+
+    def test_noisy_client_is_throttled_alone(self):
+        manager = quotas.QuotaManager(quotas.ClientQuota(request_rate=10), {}, samples=11, sample_ms=1000)
+        throttles = [manager.record_request("noisy", 50, now_ms=1_000 + x) for x in range(150)]
+        # 100 requests over the 10 s minimum window is exactly the bound
+        self.assertEqual([0] * 100, throttles[:100])
+        self.assertTrue(0 < throttles[100] < throttles[149])
+        self.assertEqual(0, manager.record_request("quiet", 50, now_ms=1_200))
+        self.assertEqual(0, manager.record_request(None, 50, now_ms=1_200))
+
+    def test_responses_count_against_the_byte_rate(self):
+        manager = quotas.QuotaManager(quotas.ClientQuota(byte_rate=1000), {}, samples=2, sample_ms=1000)
+        self.assertEqual(0, manager.record_request("consumer", 100, now_ms=0))
+        manager.record_response("consumer", 5000, now_ms=0)
+        # 5200 bytes over a one second window is 5.2 times the bound, capped at the two second window
+        self.assertEqual(2000, manager.record_request("consumer", 100, now_ms=1))
+
+    def test_idle_clients_are_dropped(self):
+        manager = quotas.QuotaManager(quotas.ClientQuota(request_rate=10), {}, samples=2, sample_ms=1000)
+        for number in range(100):
+            manager.record_request(f"client-{number}", 10, now_ms=0)
+        manager.record_request("later", 10, now_ms=2_001)
+        self.assertEqual(["later"], list(manager.clients))
@@ -0,0 +1,136 @@
+import pathlib
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from unittest import TestCase
+
+import socket_server
+from app.protocol.request import KafkaResponse
+from app.protocol.writer import FileRegion
+from app.server import metrics
+from app.server.server_args import ServerArguments
+
+
+def frame(number: int) -> bytes:
+    # size, api key 18, then the number the fake handlers look at
+    return (6).to_bytes(4) + (18).to_bytes(2) + number.to_bytes(4)
+
+
+def read_exactly(client: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = client.recv(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+class TestSocketServer(TestCase):
+    def start(self, respond, **properties) -> socket_server.SocketServer:
+        server_args = ServerArguments(pathlib.Path("unused"), properties={k.replace("_", "."): str(v)
+                                                                           for k, v in properties.items()})
+        server = socket_server.SocketServer(server_args, respond, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        return server
+
+    def connect(self, server: socket_server.SocketServer) -> socket.socket:
+        client = socket.create_connection(("localhost", server.port), timeout=5)
+        self.addCleanup(client.close)
+        return client
+
+    def test_pipelined_responses_come_back_in_order(self):
+        records = tempfile.TemporaryFile()
+        self.addCleanup(records.close)
+        records.write(b"record" * 50_000)
+        records.flush()
+
+        def respond(msg, server_args, received_ns):
+            number = int.from_bytes(msg[6:10])
+            # later requests finish first if they are allowed to run side by side
+            time.sleep((10 - number % 10) / 1000)
+            if number % 3 == 0:
+                return KafkaResponse(0, [memoryview(bytes(msg[6:10])), FileRegion(records, 0, 300_000)])
+            return KafkaResponse(0, bytes(msg[6:10]))
+
+        server = self.start(respond, num_network_threads=2, num_io_threads=4)
+        clients = [self.connect(server) for _ in range(3)]
+        for client in clients:
+            client.sendall(b"".join(frame(x) for x in range(10)))
+        for client in clients:
+            for number in range(10):
+                self.assertEqual(number.to_bytes(4), read_exactly(client, 4))
+                if number % 3 == 0:
+                    self.assertEqual(b"record" * 50_000, read_exactly(client, 300_000))
+
+    def test_unanswered_and_failed_requests(self):
+        def respond(msg, server_args, received_ns):
+            number = int.from_bytes(msg[6:10])
+            if number == 2:
+                raise ValueError("bad request")
+            # like a produce with acks=0
+            return KafkaResponse(0, None if number == 0 else bytes(msg[6:10]))
+
+        client = self.connect(self.start(respond))
+        client.sendall(frame(0) + frame(1) + frame(2) + frame(3))
+        self.assertEqual((1).to_bytes(4), read_exactly(client, 4))
+        # the failed request closes the connection before anything after it is answered
+        self.assertEqual(b"", read_exactly(client, 4))
+
+    def test_request_queue_is_bounded(self):
+        release = threading.Event()
+
+        def respond(msg, server_args, received_ns):
+            release.wait(5)
+            return KafkaResponse(0, bytes(msg[6:10]))
+
+        server = self.start(respond, num_network_threads=1, num_io_threads=1, queued_max_requests=2)
+        clients = [self.connect(server) for _ in range(6)]
+        for number, client in enumerate(clients):
+            client.sendall(frame(number))
+        time.sleep(0.2)
+        # one request being handled, two queued, and the network thread waiting to queue the fourth
+        self.assertEqual(2, server.requests.qsize())
+        self.assertIn("kafka_request_queue_size 2\n", metrics.METRICS.render())
+        self.assertIn("kafka_request_handlers_busy 1\n", metrics.METRICS.render())
+        release.set()
+        for number, client in enumerate(clients):
+            self.assertEqual(number.to_bytes(4), read_exactly(client, 4))
+
+    def test_throttled_connection_is_muted(self):
+        def respond(msg, server_args, received_ns):
+            number = int.from_bytes(msg[6:10])
+            return KafkaResponse(0, bytes(msg[6:10]), throttle_time_ms=300 if number == 0 else 0)
+
+        server = self.start(respond)
+        throttled, other = self.connect(server), self.connect(server)
+        throttled.sendall(frame(0) + frame(1))
+        self.assertEqual((0).to_bytes(4), read_exactly(throttled, 4))
+        muted_at = time.monotonic()
+        # other connections are still served meanwhile
+        other.sendall(frame(2))
+        self.assertEqual((2).to_bytes(4), read_exactly(other, 4))
+        self.assertLess(time.monotonic() - muted_at, 0.25)
+        self.assertEqual((1).to_bytes(4), read_exactly(throttled, 4))
+        self.assertGreaterEqual(time.monotonic() - muted_at, 0.25)
+
+    def test_delayed_responses_free_the_handler(self):
+        parked = Future()
+
+        def respond(msg, server_args, received_ns):
+            number = int.from_bytes(msg[6:10])
+            if number == 0:
+                return KafkaResponse(0, None, delayed=parked)
+            return KafkaResponse(0, bytes(msg[6:10]))
+
+        server = self.start(respond, num_io_threads=1)
+        waiting, other = self.connect(server), self.connect(server)
+        waiting.sendall(frame(0) + frame(1))
+        other.sendall(frame(2))
+        # the only handler thread is not stuck on the parked request
+        self.assertEqual((2).to_bytes(4), read_exactly(other, 4))
+        parked.set_result(b"done")
+        self.assertEqual(b"done" + (1).to_bytes(4), read_exactly(waiting, 8))
@@ -0,0 +1,70 @@
+from unittest import TestCase
+
+import timer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000
+
+    def __call__(self) -> int:
+        return self.now
+
+
+class TestTimer(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.timer = timer.Timer("test", tick_ms=1, wheel_size=8, clock=self.clock, reaper=False)
+        self.fired = []
+
+    def add(self, delay_ms: int) -> timer.TimerTask:
+        task = timer.TimerTask(delay_ms, lambda: self.fired.append(delay_ms))
+        self.timer.add(task)
+        return task
+
+    def advance_to(self, now: int) -> None:
+        # one millisecond at a time, like a reaper that is never late
+        while self.clock.now < now:
+            self.clock.now += 1
+            self.timer.advance_clock()
+
+    def test_tasks_fire_at_their_deadline_on_every_level(self):
+        # 8 ms on the first wheel, 64 ms on the second and 512 ms on the third
+        for delay in (500, 3, 7, 40, 200):
+            self.add(delay)
+        self.assertEqual(5, self.timer.size)
+        for delay in (3, 7, 40, 200, 500):
+            self.advance_to(1_000 + delay - 1)
+            self.assertNotIn(delay, self.fired)
+            self.advance_to(1_000 + delay)
+            self.assertEqual(delay, self.fired[-1])
+        self.assertEqual(0, self.timer.size)
+
+    def test_a_late_reaper_fires_everything_due(self):
+        for delay in (5, 60, 300):
+            self.add(delay)
+        self.clock.now += 1_000
+        self.timer.advance_clock()
+        self.assertEqual([5, 60, 300], sorted(self.fired))
+
+    def test_cancelled_tasks_never_fire(self):
+        tasks = [self.add(x) for x in (2, 30, 400)]
+        tasks[1].cancel()
+        tasks[2].cancel()
+        self.assertEqual(1, self.timer.size)
+        self.advance_to(1_500)
+        self.assertEqual([2], self.fired)
+
+    def test_due_tasks_run_right_away(self):
+        self.add(0)
+        self.assertEqual([0], self.fired)
+        self.assertEqual(0, self.timer.size)
+
+    def test_buckets_are_queued_instead_of_tasks(self):
+        for number in range(100_000):
+            self.add(1 + number % 5_000)
+        self.assertEqual(100_000, self.timer.size)
+        self.assertLess(len(self.timer.queue), 100)
+        self.clock.now += 5_000
+        self.timer.advance_clock()
+        self.assertEqual(100_000, len(self.fired))
@@ -0,0 +1,181 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Optional
+
+DEFAULT_TICK_MS = 1
+DEFAULT_WHEEL_SIZE = 20
+
+
+def monotonic_ms() -> int:
+    return time.monotonic_ns() // 1_000_000
+
+
+class TimerTask:
+    # a node of its bucket's doubly linked list, so cancelling unlinks it in constant time
+
+    def __init__(self, delay_ms: int, action: Callable[[], None]):
+        self.delay_ms = delay_ms
+        self.action = action
+        self.expiration_ms = 0
+        self.bucket: Optional[Bucket] = None
+        self.previous: Optional[TimerTask] = None
+        self.next: Optional[TimerTask] = None
+        self.timer: Optional[Timer] = None
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        timer = self.timer
+        if timer is None:
+            self.cancelled = True
+            return
+        with timer.condition:
+            self.cancelled = True
+            if self.bucket is not None:
+                self.bucket.remove(self)
+                timer.size -= 1
+
+
+class Bucket:
+    # every task of one wheel slot; the whole bucket is queued once, at the start of its slot
+
+    def __init__(self):
+        self.head: Optional[TimerTask] = None
+        self.expiration_ms = -1
+
+    def add(self, task: TimerTask) -> None:
+        task.bucket = self
+        task.previous = None
+        task.next = self.head
+        if self.head is not None:
+            self.head.previous = task
+        self.head = task
+
+    def remove(self, task: TimerTask) -> None:
+        if task.previous is None:
+            self.head = task.next
+        else:
+            task.previous.next = task.next
+        if task.next is not None:
+            task.next.previous = task.previous
+        task.bucket = task.previous = task.next = None
+
+    def set_expiration(self, expiration_ms: int) -> bool:
+        # only a changed expiration means the bucket has to be queued again
+        changed = expiration_ms != self.expiration_ms
+        self.expiration_ms = expiration_ms
+        return changed
+
+    def flush(self) -> list[TimerTask]:
+        tasks = []
+        while self.head is not None:
+            task = self.head
+            self.remove(task)
+            tasks.append(task)
+        self.expiration_ms = -1
+        return tasks
+
+
+class TimingWheel:
+    # wheel_size slots of tick_ms each; anything further out goes to an overflow wheel whose tick is this wheel's
+    # whole interval, so far deadlines cost one more level instead of more slots
+
+    def __init__(self, tick_ms: int, wheel_size: int, start_ms: int, push: Callable[[Bucket], None]):
+        self.tick_ms = tick_ms
+        self.wheel_size = wheel_size
+        self.interval = tick_ms * wheel_size
+        self.buckets = [Bucket() for _ in range(wheel_size)]
+        self.current_ms = start_ms - start_ms % tick_ms
+        self.push = push
+        self.overflow: Optional[TimingWheel] = None
+
+    def add(self, task: TimerTask) -> bool:
+        # False when the task is already due
+        if task.expiration_ms < self.current_ms + self.tick_ms:
+            return False
+        if task.expiration_ms < self.current_ms + self.interval:
+            virtual_id = task.expiration_ms // self.tick_ms
+            bucket = self.buckets[virtual_id % self.wheel_size]
+            bucket.add(task)
+            if bucket.set_expiration(virtual_id * self.tick_ms):
+                self.push(bucket)
+            return True
+        if self.overflow is None:
+            self.overflow = TimingWheel(self.interval, self.wheel_size, self.current_ms, self.push)
+        return self.overflow.add(task)
+
+    def advance(self, time_ms: int) -> None:
+        if time_ms >= self.current_ms + self.tick_ms:
+            self.current_ms = time_ms - time_ms % self.tick_ms
+            if self.overflow is not None:
+                self.overflow.advance(self.current_ms)
+
+
+class Timer:
+    # the reaper sleeps until the earliest bucket is due, so waiting tasks cost nothing per tick; expired tasks run
+    # on the reaper thread and should only hand their work off
+
+    def __init__(self, name: str, tick_ms: int = DEFAULT_TICK_MS, wheel_size: int = DEFAULT_WHEEL_SIZE,
+                 clock: Callable[[], int] = monotonic_ms, reaper: bool = True):
+        self.clock = clock
+        self.condition = threading.Condition()
+        # (expiration, sequence, bucket): buckets, not tasks, so the heap stays at a few entries per wheel
+        self.queue: list[tuple[int, int, Bucket]] = []
+        self.sequence = itertools.count()
+        self.wheel = TimingWheel(tick_ms, wheel_size, clock(), self._push)
+        self.size = 0
+        if reaper:
+            threading.Thread(target=self._run, name=f"{name}-reaper", daemon=True).start()
+
+    def add(self, task: TimerTask) -> None:
+        with self.condition:
+            task.timer = self
+            task.expiration_ms = self.clock() + task.delay_ms
+            due = self._add(task)
+        if due:
+            task.action()
+
+    def advance_clock(self, timeout_ms: int = 0) -> bool:
+        # runs every task that is due, waiting up to timeout_ms for the first one; False if none was
+        with self.condition:
+            if not self._due() and timeout_ms > 0:
+                wait_ms = timeout_ms if not self.queue else min(timeout_ms, self.queue[0][0] - self.clock())
+                self.condition.wait(wait_ms / 1000)
+            due = []
+            while self._due():
+                expiration_ms, _, bucket = heapq.heappop(self.queue)
+                if expiration_ms != bucket.expiration_ms:
+                    continue
+                self.wheel.advance(expiration_ms)
+                # tasks of an overflow bucket move down to a finer wheel, the rest are due
+                for task in bucket.flush():
+                    self.size -= 1
+                    if self._add(task):
+                        due.append(task)
+        for task in due:
+            if not task.cancelled:
+                task.action()
+        return bool(due)
+
+    def _add(self, task: TimerTask) -> bool:
+        # True when the task is due and was not cancelled
+        if task.cancelled:
+            return False
+        if self.wheel.add(task):
+            self.size += 1
+            return False
+        return True
+
+    def _due(self) -> bool:
+        return bool(self.queue) and self.queue[0][0] <= self.clock()
+
+    def _push(self, bucket: Bucket) -> None:
+        heapq.heappush(self.queue, (bucket.expiration_ms, next(self.sequence), bucket))
+        if self.queue[0][2] is bucket:
+            # the reaper may be sleeping towards a later deadline
+            self.condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            self.advance_clock(200)
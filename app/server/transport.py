@@ -0,0 +1,43 @@
+import asyncio
+import os
+import socket
+
+from app.protocol.writer import FileRegion, ResponseBody
+
+
+def send_response(accepted_socket: socket.socket, body: ResponseBody) -> None:
+    if not isinstance(body, list):
+        accepted_socket.sendall(body)
+        return
+    for part in body:
+        if isinstance(part, FileRegion):
+            sendfile(accepted_socket, part)
+        else:
+            accepted_socket.sendall(part)
+
+
+def sendfile(accepted_socket: socket.socket, region: FileRegion) -> None:
+    # page cache straight to the socket; os.sendfile takes the offset so the shared file position is never used
+    offset = region.offset
+    remaining = region.count
+    while remaining > 0:
+        sent = os.sendfile(accepted_socket.fileno(), region.file.fileno(), offset, remaining)
+        if sent == 0:
+            raise ConnectionError(f"{region.file.name} ended before {region.count} bytes at {region.offset}")
+        offset += sent
+        remaining -= sent
+
+
+async def write_response(writer: asyncio.StreamWriter, body: ResponseBody) -> None:
+    if not isinstance(body, list):
+        writer.write(body)
+        await writer.drain()
+        return
+    loop = asyncio.get_running_loop()
+    for part in body:
+        if isinstance(part, FileRegion):
+            await writer.drain()
+            await loop.sendfile(writer.transport, part.file, part.offset, part.count)
+        else:
+            writer.write(part)
+    await writer.drain()
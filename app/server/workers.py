@@ -0,0 +1,115 @@
+import dataclasses
+import logging
+import os
+import pathlib
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from typing import Callable
+
+from app.log.crc import get_verifier
+from app.metadata.cache import MetadataCache, checkpoint_dir, checkpoint_interval_ms
+from app.metadata.snapshot import SNAPSHOT_NAME, write_snapshot
+from app.server.server_args import ServerArguments
+
+logger = logging.getLogger(__name__)
+
+SHARED_MEMORY_DIR = pathlib.Path("/dev/shm")
+DEFAULT_SNAPSHOT_REFRESH_MS = 100
+# a worker that dies sooner than this is not restarted, it would most likely die again
+MIN_WORKER_LIFETIME_SECONDS = 1.0
+
+Server = Callable[[ServerArguments], None]
+
+
+class SnapshotPublisher:
+
+    def __init__(self, cache: MetadataCache, path: pathlib.Path, refresh_ms: int):
+        self.cache = cache
+        self.path = path
+        self.refresh_ms = refresh_ms
+        self.published = None
+
+    def publish(self) -> bool:
+        log = self.cache.get()
+        version = (id(log), log.parsed_bytes)
+        if version == self.published:
+            return False
+        write_snapshot(self.path, log)
+        self.published = version
+        return True
+
+    def run(self) -> None:
+        while True:
+            time.sleep(self.refresh_ms / 1000)
+            try:
+                self.publish()
+            except OSError as e:
+                logger.warning("metadata snapshot refresh failed: %s", e)
+
+    def start(self) -> None:
+        threading.Thread(target=self.run, name="metadata-snapshot", daemon=True).start()
+
+
+def run_workers(server_args: ServerArguments, serve: Server) -> None:
+    snapshot_dir = pathlib.Path(tempfile.mkdtemp(prefix="kafka-metadata-",
+                                                 dir=SHARED_MEMORY_DIR if SHARED_MEMORY_DIR.is_dir() else None))
+    snapshot_path = snapshot_dir / SNAPSHOT_NAME
+    publisher = SnapshotPublisher(MetadataCache(server_args.metadata_log_path, server_args.mmap_metadata,
+                                                get_verifier(server_args), checkpoint_interval_ms(server_args),
+                                                checkpoint_dir(server_args)),
+                                  snapshot_path,
+                                  server_args.int_property("metadata.snapshot.refresh.ms", DEFAULT_SNAPSHOT_REFRESH_MS))
+    # the first snapshot exists before any worker can accept a connection
+    publisher.publish()
+    worker_args = dataclasses.replace(server_args, metadata_snapshot_path=snapshot_path)
+    workers: dict[int, tuple[int, float]] = {}
+
+    def spawn(number: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            status = 1
+            try:
+                # worker 0 is the leader: it alone reads the metadata log and rewrites the snapshot
+                if number == 0:
+                    publisher.start()
+                serve(dataclasses.replace(worker_args, worker_number=number))
+                status = 0
+            except KeyboardInterrupt:
+                status = 0
+            finally:
+                os._exit(status)
+        workers[pid] = (number, time.monotonic())
+
+    def stop(*_) -> None:
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for number in range(server_args.workers):
+            spawn(number)
+        logger.info("started %d workers", server_args.workers)
+        while workers:
+            pid, status = os.wait()
+            number, started = workers.pop(pid)
+            logger.warning("worker %d (pid %d) exited with status %d", number, pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < MIN_WORKER_LIFETIME_SECONDS:
+                raise SystemExit(1)
+            spawn(number)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(workers):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
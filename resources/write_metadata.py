@@ -1,12 +1,88 @@
+import argparse
 import binascii
+import pathlib
+import uuid
+
+from app.log.batches import build_record_batch
+from app.metadata.metadata import FEATURE_LEVEL_RECORD_TYPE, PARTITION_RECORD_TYPE, TOPIC_RECORD_TYPE
+from app.protocol.writer import SIZE_PREFIX_LENGTH, ResponseWriter
+from app.server.server_args import METADATA_LOG_NAME
 
 ROFLCOPTER_TEST_STRING = '00000000000000000000004f0000000102b069457c00000000000000000191e05af81800000191e05af818ffffffffffffffffffffffffffff000000013a000000012e010c00116d657461646174612e76657273696f6e001400000000000000000001000000e4000000010224db12dd00000000000200000191e05b2d1500000191e05b2d15ffffffffffffffffffffffffffff000000033c00000001300102000473617a00000000000040008000000000000091000090010000020182010103010000000000000000000040008000000000000091020000000102000000010101000000010000000000000000021000000000004000800000000000000100009001000004018201010301000000010000000000004000800000000000009102000000010200000001010100000001000000000000000002100000000000400080000000000000010000'
 
+FRAME_VERSION = 1
+METADATA_VERSION_LEVEL = 20
+DIRECTORY_ID = uuid.UUID("10000000-0000-4000-8000-000000000001")
+BROKER_ID = 1
+
+
+def record_value(writer: ResponseWriter) -> bytes:
+    # the writer reserves a size prefix for whole responses, record values do not have one
+    return bytes(writer.finish()[SIZE_PREFIX_LENGTH:])
+
+
+def feature_level_record(name: str, level: int) -> bytes:
+    writer = ResponseWriter()
+    writer.int8(FRAME_VERSION).int8(FEATURE_LEVEL_RECORD_TYPE).int8(0)
+    writer.compact_string(name).int16(level).tagged_fields()
+    return record_value(writer)
+
+
+def topic_record(name: str, topic_id: uuid.UUID) -> bytes:
+    writer = ResponseWriter()
+    writer.int8(FRAME_VERSION).int8(TOPIC_RECORD_TYPE).int8(0)
+    writer.compact_string(name).uuid(topic_id).tagged_fields()
+    return record_value(writer)
+
+
+def partition_record(partition_id: int, topic_id: uuid.UUID, replicas: list[int]) -> bytes:
+    writer = ResponseWriter()
+    writer.int8(FRAME_VERSION).int8(PARTITION_RECORD_TYPE).int8(1).int32(partition_id).uuid(topic_id)
+    # replicas, in-sync replicas, then the empty removing and adding replica lists
+    for nodes in (replicas, replicas, [], []):
+        writer.compact_array_length(len(nodes))
+        for node in nodes:
+            writer.int32(node)
+    writer.int32(replicas[0]).int32(0).int32(0)
+    writer.compact_array_length(1).uuid(DIRECTORY_ID)
+    writer.tagged_fields()
+    return record_value(writer)
+
+
+def synthetic_metadata_log(topics: int, partitions: int, records_per_batch: int = 100,
+                           topic_prefix: str = "topic") -> bytes:
+    # a feature level record, then every topic followed by its partitions, chunked into batches
+    values = [feature_level_record("metadata.version", METADATA_VERSION_LEVEL)]
+    for i in range(topics):
+        topic_id = uuid.UUID(int=(0x4000 << 64) | (0x8000 << 48) | (i + 1))
+        values.append(topic_record(f"{topic_prefix}-{i:06d}", topic_id))
+        values.extend(partition_record(partition_id, topic_id, [BROKER_ID]) for partition_id in range(partitions))
+    out = bytearray()
+    for offset in range(0, len(values), records_per_batch):
+        chunk = values[offset: offset + records_per_batch]
+        out += build_record_batch([(None, value) for value in chunk], base_offset=offset)
+    return bytes(out)
+
 
 def main():
-    with open('__cluster_metadata-0/00000000000000000000.log', 'wb') as out_file:
-        out_file.write(binascii.unhexlify(ROFLCOPTER_TEST_STRING))
+    parser = argparse.ArgumentParser(description="write a __cluster_metadata log, the fixed sample one by default")
+    parser.add_argument("--log-dir", type=pathlib.Path, default=pathlib.Path("."))
+    parser.add_argument("--topics", type=int, default=0, help="synthesize this many topics instead of the sample")
+    parser.add_argument("--partitions", type=int, default=1, help="partitions per synthetic topic")
+    parser.add_argument("--records-per-batch", type=int, default=100)
+    parser.add_argument("--topic-prefix", default="topic")
+    args = parser.parse_args()
+
+    if args.topics:
+        stuff = synthetic_metadata_log(args.topics, args.partitions, args.records_per_batch, args.topic_prefix)
+    else:
+        stuff = binascii.unhexlify(ROFLCOPTER_TEST_STRING)
+    path = args.log_dir / METADATA_LOG_NAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as out_file:
+        out_file.write(stuff)
+    print(f"wrote {len(stuff)} bytes to {path}")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+import json
+import pathlib
+import random
+import socket
+import struct
+import subprocess
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from app.protocol.writer import ResponseWriter
+
+SIZE = struct.Struct(">i")
+CORRELATION_ID = struct.Struct(">i")
+API_VERSIONS_KEY = 18
+DESCRIBE_TOPIC_PARTITIONS_KEY = 75
+CLIENT_ID = "bench"
+PERCENTILES = {"p50": 0.50, "p99": 0.99, "p999": 0.999}
+
+
+def request_header(writer: ResponseWriter, api_key: int, api_version: int, correlation_id: int,
+                   flexible: bool) -> ResponseWriter:
+    writer.int16(api_key).int16(api_version).int32(correlation_id).string(CLIENT_ID)
+    return writer.tagged_fields() if flexible else writer
+
+
+def api_versions_request(correlation_id: int) -> bytes:
+    writer = request_header(ResponseWriter(), API_VERSIONS_KEY, 4, correlation_id, True)
+    writer.compact_string("bench").compact_string("0").tagged_fields()
+    return bytes(writer.finish())
+
+
+def describe_topic_partitions_request(correlation_id: int, topics: list[str], limit: int) -> bytes:
+    writer = request_header(ResponseWriter(), DESCRIBE_TOPIC_PARTITIONS_KEY, 0, correlation_id, True)
+    writer.compact_array_length(len(topics))
+    for topic in topics:
+        writer.compact_string(topic).tagged_fields()
+    writer.int32(limit).int8(-1).tagged_fields()
+    return bytes(writer.finish())
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    # "api_versions=3,describe_topic_partitions=1"
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("api_versions", "describe_topic_partitions"):
+            raise argparse.ArgumentTypeError(f"unknown request type {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+@dataclass
+class Results:
+    latencies_ns: dict[str, list[int]] = field(default_factory=dict)
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+    def record(self, kind: str, latency_ns: int) -> None:
+        self.latencies_ns.setdefault(kind, []).append(latency_ns)
+
+
+def summarize(latencies_ns: list[int], seconds: float) -> dict[str, float]:
+    ordered = sorted(latencies_ns)
+    summary = {"requests": len(ordered), "requests_per_second": len(ordered) / seconds if seconds else 0.0}
+    if not ordered:
+        return summary
+    for name, quantile in PERCENTILES.items():
+        # nearest rank, so p999 of fewer than 1000 samples is the maximum
+        summary[f"{name}_us"] = ordered[min(len(ordered) - 1, int(quantile * len(ordered)))] / 1000
+    summary["max_us"] = ordered[-1] / 1000
+    summary["mean_us"] = sum(ordered) / len(ordered) / 1000
+    return summary
+
+
+class Connection:
+
+    def __init__(self, args: argparse.Namespace, results: Results, seed: int):
+        self.args = args
+        self.results = results
+        self.random = random.Random(seed)
+        self.kinds = list(args.mix)
+        self.weights = list(args.mix.values())
+        self.in_flight: deque[tuple[int, str, int]] = deque()
+
+    def next_request(self, correlation_id: int) -> tuple[str, bytes]:
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        if kind == "api_versions":
+            return kind, api_versions_request(correlation_id)
+        return kind, describe_topic_partitions_request(correlation_id, self.args.topics, self.args.partition_limit)
+
+    async def run(self, requests: int, record: bool) -> None:
+        reader, writer = await asyncio.open_connection(self.args.host, self.args.port)
+        # up to --pipeline requests are outstanding at once; 1 means request, wait, request
+        window = asyncio.Semaphore(self.args.pipeline)
+        receiver = asyncio.create_task(self.receive(reader, window, requests, record))
+        try:
+            for correlation_id in range(requests):
+                await window.acquire()
+                if receiver.done():
+                    break
+                kind, frame = self.next_request(correlation_id)
+                self.in_flight.append((time.perf_counter_ns(), kind, correlation_id))
+                writer.write(frame)
+                if record:
+                    self.results.bytes_sent += len(frame)
+                await writer.drain()
+            await receiver
+        finally:
+            writer.close()
+
+    async def receive(self, reader: asyncio.StreamReader, window: asyncio.Semaphore, requests: int,
+                      record: bool) -> None:
+        for _ in range(requests):
+            (size,) = SIZE.unpack(await reader.readexactly(SIZE.size))
+            payload = await reader.readexactly(size)
+            received = time.perf_counter_ns()
+            sent, kind, correlation_id = self.in_flight.popleft()
+            (answered,) = CORRELATION_ID.unpack_from(payload)
+            if answered != correlation_id:
+                raise RuntimeError(f"expected correlation id {correlation_id}, got {answered}")
+            if record:
+                self.results.record(kind, received - sent)
+                self.results.bytes_received += SIZE.size + size
+            window.release()
+
+
+async def run_phase(args: argparse.Namespace, results: Results, requests: int, record: bool) -> float:
+    connections = [Connection(args, results, args.seed + i) for i in range(args.connections)]
+    start = time.perf_counter()
+    await asyncio.gather(*(connection.run(requests, record) for connection in connections))
+    return time.perf_counter() - start
+
+
+def wait_for_port(host: str, port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="throughput and latency of the broker's request path")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=9092)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests per connection")
+    parser.add_argument("--warmup", type=int, default=200, help="unmeasured requests per connection first")
+    parser.add_argument("--pipeline", type=int, default=1, help="requests in flight per connection")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("api_versions=1,describe_topic_partitions=1"))
+    parser.add_argument("--topics", nargs="*", default=[], help="DescribeTopicPartitions topics, all when empty")
+    parser.add_argument("--partition-limit", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--broker", type=pathlib.Path, metavar="PROPERTIES",
+                        help="start python -m app.main PROPERTIES for the run and stop it afterwards")
+    parser.add_argument("--broker-args", default="", help="extra app.main arguments, e.g. '--mode asyncio'")
+    parser.add_argument("--output", type=pathlib.Path, help="append the results as one json line to this file")
+    args = parser.parse_args()
+
+    broker = None
+    if args.broker is not None:
+        broker = subprocess.Popen([sys.executable, "-m", "app.main", str(args.broker), *args.broker_args.split()],
+                                  stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(args.host, args.port, 10.0)
+        results = Results()
+        if args.warmup:
+            asyncio.run(run_phase(args, results, args.warmup, record=False))
+        seconds = asyncio.run(run_phase(args, results, args.requests, record=True))
+    finally:
+        if broker is not None:
+            broker.terminate()
+            broker.wait()
+
+    every = [x for latencies in results.latencies_ns.values() for x in latencies]
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "config": {"connections": args.connections, "requests": args.requests, "pipeline": args.pipeline,
+                   "mix": args.mix, "topics": args.topics, "partition_limit": args.partition_limit,
+                   "broker_args": args.broker_args},
+        "seconds": seconds,
+        "bytes_sent": results.bytes_sent,
+        "bytes_received": results.bytes_received,
+        "total": summarize(every, seconds),
+        "apis": {kind: summarize(latencies, seconds) for kind, latencies in sorted(results.latencies_ns.items())},
+    }
+    for name, summary in [("total", report["total"]), *report["apis"].items()]:
+        print(f"{name}: {summary['requests']} requests, {summary['requests_per_second']:,.0f}/s, "
+              f"p50 {summary.get('p50_us', 0):.0f}us p99 {summary.get('p99_us', 0):.0f}us "
+              f"p999 {summary.get('p999_us', 0):.0f}us")
+    if args.output is not None:
+        with open(args.output, "a") as out_file:
+            out_file.write(json.dumps(report) + "\n")
+
+
+if __name__ == '__main__':
+    main()
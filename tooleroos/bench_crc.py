@@ -0,0 +1,40 @@
+import argparse
+import time
+
+from app.log import crc
+from app.metadata.metadata import DEFAULT_METADATA_LOG, _Parser
+
+
+def best_of(rounds: int, function, *args) -> float:
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bytes/sec of the CRC-32C batch validator")
+    parser.add_argument("--copies", type=int, default=5000, help="times the sample metadata log is repeated")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    stuff = DEFAULT_METADATA_LOG * args.copies
+    implementations = {"bytewise": crc.crc32c_bytewise, "slicing-by-8": crc.crc32c_sliced}
+    if crc.IMPLEMENTATION == "native":
+        implementations["native"] = crc.crc32c
+    for name, implementation in implementations.items():
+        elapsed = best_of(args.rounds, implementation, stuff)
+        print(f"{name}: {len(stuff) / elapsed / 1e6:.1f} MB/s")
+
+    spans = _Parser(stuff).batch_spans()
+    verifier = crc.CrcVerifier(crc.CrcMode.ALWAYS)
+    elapsed = best_of(args.rounds, verifier.verify_batches, stuff, spans, True)
+    print(f"validator ({crc.IMPLEMENTATION}), {len(spans)} batches of {len(stuff)} bytes: "
+          f"{len(stuff) / elapsed / 1e6:.1f} MB/s, {len(spans) / elapsed:,.0f} batches/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+import argparse
+import time
+
+from app.metadata.metadata import ClusterMetaDataLog, DEFAULT_METADATA_LOG
+
+
+def main():
+    parser = argparse.ArgumentParser(description="records/sec of ClusterMetaDataLog.of_bytes")
+    parser.add_argument("--copies", type=int, default=20000, help="times the sample log is repeated")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    stuff = DEFAULT_METADATA_LOG * args.copies
+    best = None
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        log = ClusterMetaDataLog.of_bytes(stuff)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    records = sum(len(x.records) for x in log.record_batches)
+    print(f"{len(stuff)} bytes, {len(log.record_batches)} batches, {records} records")
+    print(f"best of {args.rounds}: {best:.3f}s, {records / best:,.0f} records/s, {len(stuff) / best / 1e6:.1f} MB/s")
+
+
+if __name__ == '__main__':
+    main()